@@ -1,208 +1,293 @@
 import argparse
+import asyncio
+import glob
+import json
 import os
+from collections import Counter
+from datetime import datetime
 from pathlib import Path
-from pdf2john import get_pdf_hash
-from subprocess import run
-from pikepdf import Pdf
+from dictionary import count_rules, count_words
+from planner import DictAttack, MaskAttack, mask_positions, parse_duration, read_mask_file
+from jobs import JobStore, TERMINAL_STATUSES, ORIGIN_CLI
+from hashcat_driver import format_speed
+from shard import parse_workers
+from engine import Engine, ProcessPlan, Reporter, ROUTE_CACHED, ROUTE_FAILED
+from triage import TRIAGE_LABELS
+from options import DEFAULT_PROFILE, PROFILE_LABELS, WATERMARK_ACTIONS, WATERMARKS_KEEP
 from config import Config
-from datetime import datetime
+from pdf_logger import log_error, log_info
+import metrics
 
-class PdfLogger:
-    def __init__(self, pdf_name):
-        self.log_file = Config.get_pdf_log_path(pdf_name)
-        # 确保日志目录存在
-        self.log_file.parent.mkdir(exist_ok=True)
-        # 创建日志文件并写入开始信息
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            f.write(f'[{timestamp}] 开始处理PDF文件: {pdf_name}\n')
-    
-    def info(self, msg):
-        """记录普通日志"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'[{timestamp}] {msg}\n')
-    
-    def error(self, error_msg):
-        """记录错误日志"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'[{timestamp}] ERROR: {error_msg}\n')
-    
-    def command(self, cmd, output):
-        """记录命令和输出"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'\n[{timestamp}] 执行命令: {" ".join(cmd)}\n')
-            f.write(f'[{timestamp}] 命令输出:\n{output}\n')
-
-def crack_pdf_hash(hash_str, pdf_name, mask="?d"):
-    logger = PdfLogger(pdf_name)
-    try:
-        Config.validate()  # 验证hashcat是否存在
-        logger.info('hashcat验证通过')
-        
-        # 按照不同PDF版本的hash模式依次尝试
-        hash_modes = [
-            ('10500', 'PDF 1.7 Level 8 (Acrobat 10 - 11)'),
-            ('10700', 'PDF 1.7 Level 3 (Acrobat 9)'),
-            ('10600', 'PDF 1.7 Level 3 (Acrobat 8)'),
-            ('10400', 'PDF 1.1 - 1.3 (Acrobat 2 - 4)')
-        ]
-        
-        logger.info('创建临时哈希文件')
-        with open('temp_hash.txt', 'w') as f:
-            f.write(hash_str)
-        
-        for mode, desc in hash_modes:
-            print(f'🔍 尝试模式: {desc}')
-            logger.info(f'开始尝试模式: {desc}')
-            
-            cmd = [
-                str(Config.HASHCAT_BIN),
-                '-m', mode,
-                '-a', '3',
-                '--increment',
-                '--increment-min', '4',
-                '--increment-max', '8',
-                'temp_hash.txt',
-                mask,
-                '--potfile-disable',
-                '-w', '4',  # 工作负载配置文件
-                '--force',  # 忽略警告
-                '-O'  # 优化内核以减少内存使用
-            ]
-            
-            # 记录开始执行的命令
-            logger.info(f'开始执行模式 {desc}')
-            logger.command(cmd, '开始执行...')
-            
-            start_time = time.time()
-            logger.info(f'进程启动时间: {datetime.fromtimestamp(start_time).strftime("%Y-%m-%d %H:%M:%S")}')
-            
-            result = run(cmd, capture_output=True, text=True, cwd=str(Config.HASHCAT_DIR))
-            
-            # 记录完整输出
-            logger.command(cmd, result.stderr + '\n' + result.stdout)
-            
-            # 检查错误输出
-            error_lines = [line for line in result.stderr.split('\n') 
-                          if 'ERROR' in line or 'FAILED' in line or 'WARNING' in line]
-            
-            if 'Status...........: Cracked' in result.stderr:
-                msg = f'✅ 使用模式 {desc} 破解成功！'
-                print(msg)
-                logger.info(msg)
-                with open('temp_hash.txt', 'r') as f:
-                    for line in f:
-                        if ':' in line:
-                            password = line.split(':')[-1].strip()
-                            logger.info(f'找到密码: {password}')
-                            return password
-            
-            # 显示失败原因
-            if error_lines:
-                print(f'❌ 模式 {desc} 失败原因：')
-                for error in error_lines:
-                    error_msg = f'  ⚠️ {error.strip()}'
-                    print(error_msg)
-                    logger.error(f'Mode {desc}: {error.strip()}')
-            else:
-                msg = f'❌ 模式 {desc} 尝试失败，切换到下一个模式'
-                print(msg)
-                logger.info(msg)
-            
-            # 显示性能信息
-            for line in result.stderr.split('\n'):
-                if 'Speed' in line:
-                    speed_msg = f'📊 {line.strip()}'
-                    print(speed_msg)
-                    logger.info(f'性能信息: {line.strip()}')
-        
-        msg = '❌ 所有模式都尝试失败'
-        print(msg)
-        logger.error(msg)
-        return None
-    except FileNotFoundError as e:
-        msg = f'❌ 错误：{str(e)}'
+class ConsoleReporter(Reporter):
+    """把引擎的消息打印到终端，hashcat进度在同一行刷新"""
+
+    def __init__(self):
+        self.inline = False  # 进度行尚未换行
+
+    def message(self, text):
+        if self.inline:
+            print()
+            self.inline = False
+        print(text)
+
+    def progress(self, job, event):
+        if event.speeds:
+            self.inline = True
+            print_progress(event)
+
+def print_progress(event):
+    """在同一行刷新hashcat进度"""
+    eta = f'，剩余 {int(event.eta // 60)}分{int(event.eta % 60)}秒' if event.eta is not None else ''
+    print(f'\r⏳ {event.status} {event.progress:.1%}  {format_speed(sum(event.speeds.values()))}{eta}   ',
+          end='', flush=True)
+
+def list_jobs():
+    """列出可以继续的中断任务"""
+    jobs = JobStore().interrupted(ORIGIN_CLI)
+    if not jobs:
+        print('没有可以继续的任务')
+        return
+    print('可以继续的任务:')
+    for job in jobs:
+        updated = datetime.fromtimestamp(job.updated_at).strftime('%Y-%m-%d %H:%M:%S')
+        if job.shards_file.exists():
+            restore = '分片任务，已完成的块不再重复'
+        else:
+            restore = '有还原点' if job.restore_file.exists() else '无还原点，将重新开始'
+        print(f'  {job.id}  {job.pdf_name}  模式 {job.mode}  {job.describe()}  '
+              f'{len(job.sources)} 个文件  {updated}  {restore}')
+
+async def resume_job(engine, job_id, plan):
+    """从hashcat还原点（分片任务从未完成的块）继续中断的任务，并解密任务记录中的源文件"""
+    store = engine.store
+    job = store.get(job_id)
+    if job is None or job.status in TERMINAL_STATUSES or job.origin != ORIGIN_CLI:
+        msg = f'❌ 错误：任务 {job_id} 不存在或已结束'
         print(msg)
-        logger.error(msg)
-        return None
-    except Exception as e:
-        msg = f'❌ 未知错误：{str(e)}'
+        log_error(msg)
+        return
+    if job_id not in {j.id for j in store.interrupted(ORIGIN_CLI)}:
+        msg = f'❌ 错误：任务 {job_id} 仍在运行'
         print(msg)
-        logger.error(msg)
-        return None
+        log_error(msg)
+        return
+    await engine.resume(store.get(job_id), plan)
+
+def collect_inputs(patterns):
+    """展开输入参数中的目录和通配符，返回去重后的 PDF文件 -> 批量输出时在输出目录下的相对路径
+
+    目录中的文件保留相对该目录的路径，通配符匹配的文件保留相对通配符之前那级目录的路径，
+    不同子目录中的同名文件因此不会写到同一个输出文件。
+    """
+    files = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            for p in sorted(p for p in path.rglob('*') if p.is_file() and p.suffix.lower() == '.pdf'):
+                files.setdefault(p, p.relative_to(path))
+        elif any(c in pattern for c in '*?['):
+            base = glob_base(pattern)
+            for p in sorted(Path(p) for p in glob.glob(pattern, recursive=True) if Path(p).is_file()):
+                files.setdefault(p, Path(os.path.relpath(p, base)))
+        elif path.exists():
+            files.setdefault(path, Path(path.name))
+        else:
+            msg = f'❌ 错误：输入文件 {path} 不存在'
+            print(msg)
+            log_error(msg)
+    return files
+
+def glob_base(pattern):
+    """通配符之前的目录部分，如 more/**/*.pdf -> more"""
+    parts = []
+    for part in Path(pattern).parts:
+        if any(c in part for c in '*?['):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path('.')
+
+def main():
+    parser = argparse.ArgumentParser(description='PDF解密工具')
+    parser.add_argument('input', nargs='*', help='输入PDF文件、目录或通配符')
+    parser.add_argument('-o', '--output', help='输出PDF文件路径（批量模式下为输出目录）')
+    parser.add_argument('-m', '--mask', action='append',
+                        help='密码掩码模式，可重复指定，按预计耗时从小到大执行（默认 ?d）')
+    parser.add_argument('-w', '--wordlist', action='append',
+                        help='字典文件（支持 .gz），可重复指定；指定字典时不再默认执行 ?d 掩码')
+    parser.add_argument('-r', '--rules', action='append', help='hashcat规则文件，应用于每个字典，可重复指定')
+    parser.add_argument('--hybrid-append', metavar='MASK', action='append',
+                        help='混合攻击：字典后追加掩码（hashcat -a 6），如 ?d?d?d?d')
+    parser.add_argument('--hybrid-prepend', metavar='MASK', action='append',
+                        help='混合攻击：字典前添加掩码（hashcat -a 7）')
+    parser.add_argument('--mask-file', action='append',
+                        help='.hcmask掩码文件（如 mask_stats.py 生成的），按文件顺序执行其中的掩码，可重复指定')
+    parser.add_argument('--min-len', type=int, default=4, help='最小密码长度')
+    parser.add_argument('--max-len', type=int, default=8, help='最大密码长度')
+    parser.add_argument('--budget', default=str(Config.TIME_BUDGET),
+                        help='时间预算，如 3600、30m、2h、7d，0表示不限；超出预算的掩码会被缩短或跳过，'
+                             '运行时间用完时结束hashcat')
+    parser.add_argument('--save-profile', choices=list(PROFILE_LABELS), default=DEFAULT_PROFILE,
+                        help='解密后的保存方式：fast 保留原压缩（最快），compact 重新压缩（最小），web 线性化')
+    parser.add_argument('--watermarks', choices=list(WATERMARK_ACTIONS), default=WATERMARKS_KEEP,
+                        help='水印：keep 保留，remove 逐页去掉水印注释、水印图层和重复图章，'
+                             'report 只显示会去掉的内容（预演，不修改输出）')
+    parser.add_argument('--workers', default=Config.SHARD_WORKERS,
+                        help='把密钥空间分片给多个hashcat工作进程，如 local:1,local:2,ssh:user@gpu-box'
+                             '（默认取 PDFJOKER_WORKERS，空表示只用一个hashcat进程）')
+    parser.add_argument('-j', '--jobs', type=int, default=Config.CPU_JOBS,
+                        help='分诊、哈希提取和解密的并行进程数（默认取 PDFJOKER_CPU_JOBS）')
+    parser.add_argument('--list-jobs', action='store_true', help='列出可以继续的中断任务')
+    parser.add_argument('--resume', metavar='JOB_ID', help='从还原点继续中断的任务')
+    parser.add_argument('--abandon', metavar='JOB_ID', help='放弃中断的任务并删除其文件')
+    parser.add_argument('--metrics-port', type=int, default=Config.METRICS_PORT,
+                        help='运行期间在该端口提供Prometheus格式的指标（/metrics），0表示不提供'
+                             '（默认取 PDFJOKER_METRICS_PORT）')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='结束时把各阶段耗时、计数和速度的JSON汇总写入该文件，- 表示输出到终端')
+    args = parser.parse_args()
+    
+    store = JobStore()
+    store.gc()
+    if args.list_jobs:
+        list_jobs()
+        return
+    if args.abandon:
+        job = store.get(args.abandon)
+        if job is None:
+            print(f'❌ 错误：任务 {args.abandon} 不存在')
+        else:
+            store.abandon(job)
+            print(f'🗑️ 已放弃任务 {job.id}')
+        return
+    try:
+        workers = parse_workers(args.workers)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.resume and not args.input:
+        parser.error('需要指定输入PDF文件、目录或通配符')
+    start_metrics_server(args.metrics_port)
+    try:
+        # Ctrl-C取消事件循环中的处理，运行中的hashcat写入还原点后退出
+        asyncio.run(run(args, workers))
+    except KeyboardInterrupt:
+        pass
     finally:
-        if os.path.exists('temp_hash.txt'):
-            logger.info('删除临时哈希文件')
-            os.remove('temp_hash.txt')
+        write_metrics(args.metrics_json)
 
-def decrypt_pdf(input_file, password, output_file):
+async def run(args, workers=()):
+    """在一个事件循环中运行处理引擎：继续中断的任务或处理输入文件"""
+    async with Engine(cpu_limit=args.jobs, reporter=ConsoleReporter()) as engine:
+        if args.resume:
+            plan = ProcessPlan(profile=args.save_profile, watermarks=args.watermarks, workers=workers)
+            await resume_job(engine, args.resume, plan)
+        else:
+            await process_inputs(engine, args, workers)
+
+def start_metrics_server(port):
+    """在后台提供指标端点，端口被占用时只提示，不影响处理"""
     try:
-        log_info(f'开始解密PDF文件: {input_file}')
-        with Pdf.open(input_file, password=password) as pdf:
-            pdf.save(output_file)
-            pdf.remove_all_restrictions()
-            log_info(f'PDF解密成功，已保存到: {output_file}')
-    except Exception as e:
-        msg = f'❌ PDF解密失败：{str(e)}'
+        server = metrics.start_server(port)
+    except OSError as e:
+        msg = f'⚠️ 无法在端口 {port} 提供指标：{str(e)}'
         print(msg)
         log_error(msg)
+        return
+    if server is not None:
+        host, port = server.server_address[:2]
+        log_info(f'指标端点: http://{host}:{port}/metrics')
 
-def main():
-    parser = argparse.ArgumentParser(description='PDF解密工具')
-    parser.add_argument('input', help='输入PDF文件路径')
-    parser.add_argument('-o', '--output', help='输出PDF文件路径')
-    parser.add_argument('-m', '--mask', default='?d', help='密码掩码模式')
-    args = parser.parse_args()
+def write_metrics(path=None):
+    """记录本次运行的指标汇总，给出path时写入JSON文件（- 表示终端）"""
+    summary = metrics.get_metrics().summary()
+    log_info('指标汇总', metrics=summary)
+    if not path:
+        return
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path == '-':
+        print(text)
+        return
+    try:
+        Path(path).write_text(text + '\n', encoding='utf-8')
+    except OSError as e:
+        msg = f'❌ 无法写入指标汇总：{str(e)}'
+        print(msg)
+        log_error(msg)
+
+def build_attacks(args):
+    """根据命令行参数生成掩码、字典和混合攻击"""
+    masks = args.mask or ([] if args.wordlist or args.mask_file else ['?d'])
+    attacks = [MaskAttack(mask, args.min_len, args.max_len) for mask in masks]
+    for path in args.mask_file or []:
+        if not read_mask_file(path):
+            raise ValueError(f'掩码文件中没有掩码：{path}')
+        attacks.append(DictAttack(os.path.abspath(path), attack_mode=3))
+    if (args.rules or args.hybrid_append or args.hybrid_prepend) and not args.wordlist:
+        raise ValueError('规则和混合攻击需要用 -w 指定字典')
+    for path in [*(args.wordlist or []), *(args.rules or [])]:
+        if not Path(path).is_file():
+            raise FileNotFoundError(f'文件不存在：{path}')
+    rules = tuple(os.path.abspath(path) for path in args.rules or [])
+    for path in rules:
+        if not count_rules(path):
+            raise ValueError(f'规则文件中没有规则：{path}')
+    for wordlist in args.wordlist or []:
+        wordlist = os.path.abspath(wordlist)
+        if not count_words(wordlist):
+            raise ValueError(f'字典为空：{wordlist}')
+        attacks.append(DictAttack(wordlist, rules))
+        attacks.extend(DictAttack(wordlist, attack_mode=6, mask=mask) for mask in args.hybrid_append or [])
+        attacks.extend(DictAttack(wordlist, attack_mode=7, mask=mask) for mask in args.hybrid_prepend or [])
+    for attack in attacks:
+        if attack.mask:
+            mask_positions(attack.mask)  # 检查掩码格式
+    return attacks
+
+async def process_inputs(engine, args, workers=()):
+    """处理命令行给出的输入文件"""
     
     # 记录启动参数
     log_info('程序启动')
-    log_info(f'启动参数: input={args.input}, output={args.output}, mask={args.mask}')
-    
-    input_path = Path(args.input)
-    if not input_path.exists():
-        msg = f'❌ 错误：输入文件 {input_path} 不存在'
+    log_info(f'启动参数: input={args.input}, output={args.output}, mask={args.mask}, '
+             f'wordlist={args.wordlist}, rules={args.rules}, jobs={args.jobs}, workers={args.workers}')
+    try:
+        budget = parse_duration(args.budget)
+        attacks = build_attacks(args)
+    except (ValueError, FileNotFoundError) as e:
+        msg = f'❌ 错误：{str(e)}'
         print(msg)
         log_error(msg)
         return
     
-    output_path = Path(args.output) if args.output else input_path.with_name(f'{input_path.stem}_decrypted{input_path.suffix}')
-    
-    print('正在生成哈希...')
-    log_info('开始生成PDF哈希')
-    with open(input_path, 'rb') as f:
-        hash_str = get_pdf_hash(f.read())
-    
-    if not hash_str:
-        msg = '⚠️ 该PDF未加密或格式异常'
+    inputs = collect_inputs(args.input)
+    if not inputs:
+        msg = '❌ 错误：没有找到可处理的PDF文件'
         print(msg)
-        log_info(msg)
+        log_error(msg)
         return
     
-    # 记录生成的哈希
-    log_info(f'生成的PDF哈希:\n{hash_str}')
-    
-    print('开始破解...')
-    log_info('开始破解PDF密码')
-    password = crack_pdf_hash(hash_str, args.mask)
-    
-    if password:
-        msg = f'🎉 破解成功！密码是: {password}'
-        print(msg)
-        log_info(msg)
-        print('正在解密PDF...')
-        decrypt_pdf(input_path, password, output_path)
-        msg = f'✅ 解密完成！文件已保存到: {output_path}'
-        print(msg)
-        log_info(msg)
+    plan = ProcessPlan(attacks, budget, args.output, args.save_profile, args.watermarks, workers)
+    if len(inputs) > 1 or not Path(args.input[0]).is_file():
+        try:
+            outcomes = await engine.process_batch(list(inputs), plan, inputs)
+        except ValueError as e:
+            msg = f'❌ 错误：{str(e)}'
+            print(msg)
+            log_error(msg)
+            return
+        print_summary(outcomes)
     else:
-        msg = '❌ 破解失败'
-        print(msg)
-        log_error(msg)
-    
+        await engine.process(next(iter(inputs)), plan)
     log_info('程序结束')
 
+def print_summary(outcomes):
+    """批量处理的汇总：按处理路径计数"""
+    stats = Counter(outcome.route for outcome in outcomes)
+    print('📊 处理汇总:')
+    for path, label in TRIAGE_LABELS.items():
+        print(f'  {label}: {stats[path]}')
+    print(f'  缓存命中: {stats[ROUTE_CACHED]}')
+    print(f'  失败: {stats[ROUTE_FAILED]}')
+    log_info(f'批量处理汇总: {dict(stats)}')
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -8,8 +8,12 @@ class Config:
     ROOT_DIR = Path(__file__).parent.parent
     
     # 日志目录
-    LOG_DIR = ROOT_DIR / 'logs'
+    LOG_DIR = Path(os.environ.get('PDFJOKER_LOG_DIR', ROOT_DIR / 'logs'))
     ERROR_LOG = LOG_DIR / 'error.log'
+    APP_LOG = LOG_DIR / 'pdfjoker.log'
+    LOG_MAX_BYTES = int(os.environ.get('PDFJOKER_LOG_MAX_BYTES', 10 * 1024 * 1024))  # 超过后轮转，0表示不轮转
+    LOG_BACKUPS = int(os.environ.get('PDFJOKER_LOG_BACKUPS', 5))  # 轮转保留的旧文件数
+    LOG_QUEUE_SIZE = 100000  # 队列满时丢弃记录，不阻塞调用方
     
     @classmethod
     def get_pdf_log_path(cls, pdf_name):
@@ -18,8 +22,78 @@ class Config:
         safe_name = ''.join(c if c.isalnum() else '_' for c in pdf_name)
         return cls.LOG_DIR / f'{safe_name}_{timestamp}.log'
     
+    # 破解结果缓存
+    CACHE_DIR = Path(os.environ.get('PDFJOKER_CACHE_DIR', ROOT_DIR / 'cache'))
+    RESULT_CACHE_DB = CACHE_DIR / 'results.sqlite3'
+    RESULT_CACHE_TTL = int(os.environ.get('PDFJOKER_RESULT_CACHE_TTL', 90 * 24 * 3600))  # 秒
+    RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('PDFJOKER_RESULT_CACHE_MAX_ENTRIES', 100000))
+    SPEEDS_FILE = CACHE_DIR / 'speeds.json'  # 各模式的实测速度
+    
+    # 网页端：上传的文件按SHA-256落盘一次，分诊、哈希和解密结果缓存在内存中
+    UPLOAD_DIR = CACHE_DIR / 'uploads'
+    UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get('PDFJOKER_UPLOAD_SPOOL_MAX_BYTES', 10 * 1024 ** 3))  # 超过后删除最久未用的
+    UPLOAD_MAX_BYTES = int(os.environ.get('PDFJOKER_UPLOAD_MAX_BYTES', 1024 ** 3))  # 单个文件
+    SESSION_UPLOAD_MAX_BYTES = int(os.environ.get('PDFJOKER_SESSION_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))  # 每个会话累计
+    SESSION_MAX_UPLOADS = int(os.environ.get('PDFJOKER_SESSION_MAX_UPLOADS', 20))  # 每个会话的文件数
+    MEMO_MAX_BYTES = int(os.environ.get('PDFJOKER_MEMO_MAX_BYTES', 512 * 1024 ** 2))  # 内存缓存，主要是解密结果
+    
+    # 分诊、哈希提取和解密同时运行的进程数（命令行 -j）
+    CPU_JOBS = int(os.environ.get('PDFJOKER_CPU_JOBS', os.cpu_count() or 1))
+    
+    # 攻击计划的默认时间预算（秒），0表示不限
+    TIME_BUDGET = int(os.environ.get('PDFJOKER_TIME_BUDGET', 7 * 24 * 3600))
+    
+    # 启动hashcat前的CPU快速验证
+    QUICK_PASS_WORDLIST = Path(os.environ.get('PDFJOKER_QUICK_PASS_WORDLIST',
+                                              ROOT_DIR / 'app' / 'data' / 'top_passwords.txt'))
+    QUICK_PASS_LIMIT = int(os.environ.get('PDFJOKER_QUICK_PASS_LIMIT', 10000))  # 0表示跳过快速验证
+    QUICK_PASS_SECONDS = float(os.environ.get('PDFJOKER_QUICK_PASS_SECONDS', 5))  # 墙钟时间上限，0表示不限
+    QUICK_PASS_PROCESSES = int(os.environ.get('PDFJOKER_QUICK_PASS_PROCESSES', os.cpu_count() or 1))
+    QUICK_PASS_BATCH = 256  # 每个进程每次校验的候选数
+
+    # 去水印：需要处理的页数达到WATERMARK_INLINE_PAGES时分批交给进程池
+    WATERMARK_PROCESSES = int(os.environ.get('PDFJOKER_WATERMARK_PROCESSES', os.cpu_count() or 1))
+    WATERMARK_INLINE_PAGES = 200
+    WATERMARK_BATCH_PAGES = 100  # 每个进程每次处理的页数
+    # 在至少这个比例的页面上绘制的同一个XObject也算作水印；默认关闭，信头、页眉Logo同样每页都有
+    WATERMARK_STAMP_RATIO = float(os.environ.get('PDFJOKER_WATERMARK_STAMP_RATIO', 0))  # 如0.9，0表示不检测重复图章
+    WATERMARK_STAMP_MIN_PAGES = 3  # 少于这么多页的文档不检测重复图章
+
+    # 字典攻击：网页端可选的字典目录
+    WORDLIST_DIR = Path(os.environ.get('PDFJOKER_WORDLIST_DIR', ROOT_DIR / 'wordlists'))
+    
+    # 掩码文件：mask_stats从已破解的密码和语料统计生成，可能性高的掩码在前
+    MASK_DIR = Path(os.environ.get('PDFJOKER_MASK_DIR', ROOT_DIR / 'masks'))
+    MASK_STATS_MAX_MASKS = int(os.environ.get('PDFJOKER_MASK_STATS_MAX_MASKS', 500))  # 生成的掩码数上限
+    MASK_STATS_MAX_LENGTH = 32  # 更长的行不当作密码统计
+    MARKOV_HCSTAT2 = os.environ.get('PDFJOKER_MARKOV_HCSTAT2', '')  # 掩码攻击的Markov统计表，空表示hashcat自带的
+    HCSTAT2GEN = os.environ.get('PDFJOKER_HCSTAT2GEN', 'hcstat2gen.bin')  # hashcat-utils中的hcstat2gen
+    
+    # 可恢复的破解任务
+    JOBS_DIR = Path(os.environ.get('PDFJOKER_JOBS_DIR', ROOT_DIR / 'jobs'))
+    JOBS_DB = JOBS_DIR / 'jobs.sqlite3'
+    JOB_RETENTION = int(os.environ.get('PDFJOKER_JOB_RETENTION', 7 * 24 * 3600))  # 秒
+    MAX_GPU_JOBS = int(os.environ.get('PDFJOKER_MAX_GPU_JOBS', 1))  # 同时运行的hashcat进程数
+    HASHCAT_DEVICES = os.environ.get('PDFJOKER_HASHCAT_DEVICES', '')  # 传给 -d 的设备，如 1,2；空表示全部设备
+    
+    # 分片破解：把一个任务的密钥空间切成块，分给多个hashcat工作进程
+    # 如 local:1,local:2,ssh:user@gpu-box,ssh:gpu-box2:1；local:N 绑定本机设备N，空表示不分片
+    SHARD_WORKERS = os.environ.get('PDFJOKER_WORKERS', '')
+    SHARD_CHUNKS_PER_WORKER = int(os.environ.get('PDFJOKER_CHUNKS_PER_WORKER', 8))  # 块越多，工作进程失败时重做得越少
+    SHARD_MAX_ATTEMPTS = 3  # 同一个块最多失败的次数
+    SHARD_WORKER_FAILURES = 2  # 工作进程连续失败这么多次后不再分配块
+    REMOTE_HASHCAT = os.environ.get('PDFJOKER_REMOTE_HASHCAT', 'hashcat')  # SSH节点上的hashcat
+    REMOTE_DIR = os.environ.get('PDFJOKER_REMOTE_DIR', '/tmp/pdfjoker')  # SSH节点上的任务目录
+    
+    # 指标：Prometheus文本格式的本地端点（/metrics），0表示不启动
+    METRICS_HOST = os.environ.get('PDFJOKER_METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.environ.get('PDFJOKER_METRICS_PORT', 0))
+    
     # hashcat相关路径
-    HASHCAT_DIR = ROOT_DIR / 'bin' / ('win' if platform.system() == 'Windows' else 'linux') / 'hashcat
+    HASHCAT_DIR = Path(os.environ.get(
+        'PDFJOKER_HASHCAT_DIR',
+        ROOT_DIR / 'bin' / ('win' if platform.system() == 'Windows' else 'linux') / 'hashcat'
+    ))
     HASHCAT_BIN = HASHCAT_DIR / ('hashcat.exe' if platform.system() == 'Windows' else 'hashcat.bin')
     HASHCAT_KERNELS = HASHCAT_DIR / 'OpenCL'
     
@@ -27,7 +101,7 @@ class Config:
     def validate(cls):
         """验证配置是否正确"""
         # 创建日志目录
-        cls.LOG_DIR.mkdir(exist_ok=True)
+        cls.LOG_DIR.mkdir(parents=True, exist_ok=True)
         
         # 验证hashcat是否存在
         if not cls.HASHCAT_BIN.exists():
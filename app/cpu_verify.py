@@ -0,0 +1,268 @@
+import hashlib
+import itertools
+import multiprocessing
+import struct
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+from config import Config
+from dictionary import filename_candidates
+from hash_modes import parse_pdf_hash, UnsupportedHashError
+
+# PDF标准安全处理器的32字节填充串
+PAD = bytes.fromhex('28bf4e5e4e758a4164004e56fffa01082e2e00b6d0683e802f0ca9fe6453697a')
+
+# 候选数少于该值时不启动进程池，避免进程启动开销
+INLINE_LIMIT = 64
+
+# 各修订版本在一个CPU核心上校验一个候选的大致耗时（秒），用来按时间预算换算快速验证的候选数
+CHECK_SECONDS = {2: 0.00002, 3: 0.0003, 4: 0.0003, 5: 0.00002, 6: 0.0015}
+
+
+def _rc4_python(key: bytes, data: bytes) -> bytes:
+    s = list(range(256))
+    j = 0
+    key_len = len(key)
+    for i in range(256):
+        j = (j + s[i] + key[i % key_len]) & 0xFF
+        s[i], s[j] = s[j], s[i]
+    out = bytearray(len(data))
+    i = j = 0
+    for n, byte in enumerate(data):
+        i = (i + 1) & 0xFF
+        j = (j + s[i]) & 0xFF
+        s[i], s[j] = s[j], s[i]
+        out[n] = byte ^ s[(s[i] + s[j]) & 0xFF]
+    return bytes(out)
+
+
+def _load_rc4():
+    """有cryptography时使用其ARC4实现，否则使用纯Python实现"""
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher
+        try:
+            from cryptography.hazmat.decrepit.ciphers.algorithms import ARC4
+        except ImportError:
+            from cryptography.hazmat.primitives.ciphers.algorithms import ARC4
+    except ImportError:
+        return _rc4_python
+
+    def rc4(key: bytes, data: bytes) -> bytes:
+        return Cipher(ARC4(key), mode=None).encryptor().update(data)
+    return rc4
+
+
+def _load_aes_cbc():
+    """R6需要AES-128-CBC；没有cryptography时返回None"""
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        return None
+
+    def aes_cbc(key: bytes, iv: bytes, data: bytes) -> bytes:
+        return Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor().update(data)
+    return aes_cbc
+
+
+class _RC4Target:
+    """R2-R4：MD5 + RC4，按/U校验用户密码（与hashcat一致，不校验所有者密码）"""
+
+    def __init__(self, fields, rc4):
+        self.revision = fields['revision']
+        self.key_len = 5 if self.revision == 2 else fields['length'] // 8
+        self.udata = fields['udata'][:32]
+        self.odata = fields['odata'][:32]
+        self.rc4 = rc4
+        tail = struct.pack('<i', fields['permissions']) + fields['document_id']
+        if self.revision >= 4 and not fields['encrypt_metadata']:
+            tail += b'\xff\xff\xff\xff'
+        self._key_tail = self.odata + tail
+        self._u_seed = hashlib.md5(PAD + fields['document_id']).digest()
+
+    @staticmethod
+    def _pad(password: bytes) -> bytes:
+        return (password + PAD)[:32]
+
+    def _user_key(self, padded: bytes) -> bytes:
+        key = hashlib.md5(padded + self._key_tail).digest()
+        if self.revision >= 3:
+            for _ in range(50):
+                key = hashlib.md5(key[:self.key_len]).digest()
+        return key[:self.key_len]
+
+    def _check_user(self, padded: bytes) -> bool:
+        key = self._user_key(padded)
+        if self.revision == 2:
+            return self.rc4(key, PAD) == self.udata
+        data = self.rc4(key, self._u_seed)
+        for i in range(1, 20):
+            data = self.rc4(bytes(b ^ i for b in key), data)
+        return data == self.udata[:16]
+
+    @staticmethod
+    def encode(password: str) -> Optional[bytes]:
+        """候选的密码字节：R2-R4的密码是PDFDocEncoding，按latin-1编码，无法编码时返回None"""
+        try:
+            return password.encode('latin-1')
+        except UnicodeEncodeError:
+            return None
+
+    def check(self, password: str) -> bool:
+        data = self.encode(password)
+        return data is not None and self._check_user(self._pad(data))
+
+
+class _SHA256Target:
+    """R5/R6：按/U中的验证盐校验SHA-256（R6为算法2.B）"""
+
+    def __init__(self, fields, aes_cbc):
+        self.revision = fields['revision']
+        self.udata = fields['udata'][:48]
+        self.aes_cbc = aes_cbc
+
+    def _hash(self, password: bytes, salt: bytes, udata: bytes) -> bytes:
+        k = hashlib.sha256(password + salt + udata).digest()
+        if self.revision == 5:
+            return k
+        i = 0
+        while True:
+            k1 = (password + k + udata) * 64
+            e = self.aes_cbc(k[:16], k[16:32], k1)
+            # 前16字节作为大整数模3，等于各字节之和模3
+            k = (hashlib.sha256, hashlib.sha384, hashlib.sha512)[sum(e[:16]) % 3](e).digest()
+            i += 1
+            if i >= 64 and e[-1] <= i - 32:
+                return k[:32]
+
+    @staticmethod
+    def encode(password: str) -> bytes:
+        """候选的密码字节：R5/R6的密码是UTF-8"""
+        return password.encode('utf-8')
+
+    def check(self, password: str) -> bool:
+        data = self.encode(password)[:127]
+        return self._hash(data, self.udata[32:40], b'') == self.udata[:32]
+
+
+def make_target(hash_str: str):
+    """为$pdf$哈希创建校验器，无法在CPU上校验时返回None"""
+    try:
+        fields = parse_pdf_hash(hash_str)
+    except UnsupportedHashError:
+        return None
+    revision = fields['revision']
+    if revision in (2, 3, 4) and len(fields['udata']) >= 32 and len(fields['odata']) == 32:
+        return _RC4Target(fields, _load_rc4())
+    if revision in (5, 6) and len(fields['udata']) >= 40:
+        aes_cbc = _load_aes_cbc()
+        if revision == 6 and aes_cbc is None:
+            return None
+        return _SHA256Target(fields, aes_cbc)
+    return None
+
+
+# 进程池中每个工作进程的校验器
+_targets = []
+
+
+def _init_worker(hash_strs):
+    global _targets
+    _targets = [make_target(h) for h in hash_strs]
+
+
+def _check_batch(batch: List[str]):
+    """在工作进程中校验一批候选，返回 (哈希序号, 密码字节)"""
+    hits = []
+    for password in batch:
+        for index, target in enumerate(_targets):
+            if target is not None and target.check(password):
+                hits.append((index, target.encode(password)))
+    return hits
+
+
+def _batches(candidates: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(candidates)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _unique(candidates: Iterable[str]) -> Iterator[str]:
+    seen = set()
+    for candidate in candidates:
+        if candidate not in seen:
+            seen.add(candidate)
+            yield candidate
+
+
+def candidate_limit(hash_strs: List[str], seconds: float, processes: Optional[int] = None) -> int:
+    """seconds秒内大约能校验的候选数：每个候选要对每个哈希校验一次，R6比RC4慢两个数量级"""
+    processes = processes or Config.QUICK_PASS_PROCESSES
+    cost = sum(CHECK_SECONDS[target.revision] for target in map(make_target, hash_strs) if target is not None)
+    return int(seconds * processes / cost) if cost else 0
+
+
+def verify(hash_strs: List[str], candidates: Iterable[str], processes: Optional[int] = None,
+           batch_size: Optional[int] = None, timeout: Optional[float] = None) -> Dict[str, bytes]:
+    """在CPU上批量校验候选密码，返回 哈希 -> 密码字节（全部找到后提前结束）
+
+    timeout是墙钟时间上限（秒），到时不再校验剩余的批次，None表示不限。
+    """
+    hash_strs = [h for h in hash_strs if make_target(h) is not None]
+    if not hash_strs:
+        return {}
+    deadline = None if timeout is None else time.monotonic() + timeout
+    processes = processes or Config.QUICK_PASS_PROCESSES
+    batch_size = batch_size or Config.QUICK_PASS_BATCH
+    candidates = _unique(candidates)
+    head = list(itertools.islice(candidates, INLINE_LIMIT))
+    recovered = {}
+
+    def collect(hits):
+        for index, password in hits:
+            recovered.setdefault(hash_strs[index], password)
+        return len(recovered) == len(hash_strs) or (deadline is not None and time.monotonic() >= deadline)
+
+    _init_worker(hash_strs)
+    if collect(_check_batch(head)) or len(head) < INLINE_LIMIT:
+        return recovered
+    rest = _batches(candidates, batch_size)
+    if processes <= 1:
+        for batch in rest:
+            if collect(_check_batch(batch)):
+                break
+        return recovered
+    # spawn可以安全地在多线程的服务进程（如Streamlit后台线程）中使用
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, initializer=_init_worker, initargs=(hash_strs,)) as pool:
+        for hits in pool.imap_unordered(_check_batch, rest):
+            if collect(hits):
+                break
+    return recovered
+
+
+def top_passwords(limit: Optional[int] = None) -> Iterator[str]:
+    """内置常见密码，之后是所有4位数字和常见年份"""
+    def generate():
+        with open(Config.QUICK_PASS_WORDLIST, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line and not line.startswith('#'):
+                    yield line
+        for year in range(2030, 1949, -1):
+            yield str(year)
+        for number in range(10000):
+            yield f'{number:04d}'
+    return itertools.islice(generate(), limit)
+
+
+def quick_pass(hash_strs: List[str], name: Optional[str] = None, extra: Iterable[str] = ()) -> Dict[str, bytes]:
+    """启动hashcat前的快速验证：文件名等元数据候选，然后是内置常见密码
+
+    常见密码的数量按 QUICK_PASS_SECONDS 和各哈希的校验耗时缩减（R6只校验RC4的几分之一），
+    整个快速验证也不会超过这个时间。
+    """
+    limit = Config.QUICK_PASS_LIMIT
+    timeout = Config.QUICK_PASS_SECONDS or None
+    if timeout is not None:
+        limit = min(limit, candidate_limit(hash_strs, timeout))
+    candidates = itertools.chain(filename_candidates(name), extra, top_passwords(limit))
+    return verify(hash_strs, candidates, timeout=timeout)
@@ -0,0 +1,76 @@
+from io import BytesIO
+from os import PathLike
+from typing import BinaryIO, Callable, Optional, Union
+from pikepdf import Name, ObjectStreamMode, Pdf, StreamDecodeLevel
+from options import DEFAULT_PROFILE
+from watermark import WatermarkReport, strip_watermarks
+
+# pikepdf保存参数；不传encryption时输出不加密，权限限制随/Encrypt一起去掉
+SAVE_PROFILES = {
+    # 原样复制压缩数据和对象流，只去掉加密：最快，内存占用最少
+    'fast': {
+        'object_stream_mode': ObjectStreamMode.preserve,
+        'stream_decode_level': StreamDecodeLevel.none,
+    },
+    # 生成对象流并重新压缩：文件最小，耗时最长
+    'compact': {
+        'object_stream_mode': ObjectStreamMode.generate,
+        'stream_decode_level': StreamDecodeLevel.generalized,
+        'compress_streams': True,
+        'recompress_flate': True,
+    },
+    # 线性化（Fast Web View），浏览器可以边下载边显示
+    'web': {
+        'object_stream_mode': ObjectStreamMode.preserve,
+        'stream_decode_level': StreamDecodeLevel.none,
+        'linearize': True,
+    },
+}
+
+# 签名文档“只允许追加”的/SigFlags位
+_SIG_FLAG_APPEND_ONLY = 2
+
+Source = Union[str, PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+# 破解结果是密码字节（如R2-R4的latin-1字节），命令行等处给出的密码是文本
+Password = Union[str, bytes]
+
+
+def open_pdf(source: Source, password: Optional[Password] = None) -> Pdf:
+    """打开PDF：路径由qpdf按需读取，字节和文件对象直接读取，不写临时文件"""
+    if isinstance(source, (str, PathLike)):
+        # 默认的按需读取比内存映射（AccessMode.mmap）的峰值常驻内存更低
+        return Pdf.open(source, password=password or '')
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    source.seek(0)
+    return Pdf.open(source, password=password or '')
+
+
+def remove_restrictions(pdf: Pdf):
+    """去掉加密以外的使用限制：签名/使用权限字典（/Perms）和“只允许追加”标记"""
+    if Name.Perms in pdf.Root:
+        del pdf.Root.Perms
+    acroform = pdf.Root.get(Name.AcroForm)
+    if acroform is not None and Name.SigFlags in acroform:
+        acroform.SigFlags = int(acroform.SigFlags) & ~_SIG_FLAG_APPEND_ONLY
+
+
+def decrypt(source: Source, password: Optional[Password], output: Union[str, PathLike, BinaryIO, None] = None,
+            profile: str = DEFAULT_PROFILE, remove_watermarks: bool = False,
+            on_report: Optional[Callable[[WatermarkReport], None]] = None) -> Optional[BytesIO]:
+    """解密并去掉限制后写入output（路径或可写流）；output为None时返回内存中的BytesIO
+
+    remove_watermarks为True时先逐页去掉水印，on_report收到去掉了哪些水印。
+    """
+    buffer = BytesIO() if output is None else None
+    with open_pdf(source, password) as pdf:
+        remove_restrictions(pdf)
+        if remove_watermarks:
+            report = strip_watermarks(pdf, source, password)
+            if on_report is not None:
+                on_report(report)
+        pdf.save(buffer if output is None else output, **SAVE_PROFILES[profile])
+    if buffer is not None:
+        buffer.seek(0)
+    return buffer
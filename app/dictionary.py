@@ -0,0 +1,181 @@
+import gzip
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+from config import Config
+from pdf_scan import ScanError, scan_metadata
+
+# hashcat可以直接读取gzip压缩的字典，统计行数时同样流式解压
+_OPENERS = {'.gz': gzip.open}
+
+# 日期候选的常见写法
+DATE_FORMATS = (
+    '%Y%m%d', '%y%m%d', '%d%m%Y', '%m%d%Y', '%d%m%y', '%Y-%m-%d', '%d.%m.%Y',
+    '%Y/%m/%d', '%Y%m', '%m%d', '%d%m', '%Y',
+)
+
+# 读取字典行数时的块大小
+_CHUNK_SIZE = 1024 * 1024
+
+# (路径, 大小, 修改时间) -> 行数
+_line_counts = {}
+
+
+def _open_binary(path):
+    return _OPENERS.get(Path(path).suffix.lower(), open)(path, 'rb')
+
+
+def count_words(path) -> int:
+    """字典的行数，按块统计换行符；结果按文件大小和修改时间缓存"""
+    stat = os.stat(path)
+    key = (str(path), stat.st_size, stat.st_mtime)
+    if key not in _line_counts:
+        count = 0
+        last = b'\n'
+        with _open_binary(path) as f:
+            while chunk := f.read(_CHUNK_SIZE):
+                count += chunk.count(b'\n')
+                last = chunk[-1:]
+        _line_counts[key] = count + (last != b'\n')
+    return _line_counts[key]
+
+
+def iter_words(path) -> Iterator[bytes]:
+    """逐行读取字典（可以是.gz），返回去掉换行符的原始字节"""
+    with _open_binary(path) as f:
+        for line in f:
+            yield line.rstrip(b'\r\n')
+
+
+def count_rules(path) -> int:
+    """hashcat规则文件中的规则数（忽略空行和注释）"""
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return sum(1 for line in f if line.strip() and not line.startswith('#'))
+
+
+def available_wordlists() -> List[Path]:
+    """字典目录中的字典文件"""
+    if not Config.WORDLIST_DIR.is_dir():
+        return []
+    return sorted(p for p in Config.WORDLIST_DIR.iterdir() if p.is_file() and not p.name.startswith('.'))
+
+
+def available_mask_files() -> List[Path]:
+    """掩码目录中的.hcmask文件"""
+    if not Config.MASK_DIR.is_dir():
+        return []
+    return sorted(Config.MASK_DIR.glob('*.hcmask'))
+
+
+def available_rules() -> List[Path]:
+    """hashcat自带的规则文件"""
+    rules_dir = Config.HASHCAT_DIR / 'rules'
+    if not rules_dir.is_dir():
+        return []
+    return sorted(rules_dir.glob('*.rule'))
+
+
+def default_rules() -> List[Path]:
+    """文档元数据候选使用的默认规则（hashcat自带的best64）"""
+    best64 = Config.HASHCAT_DIR / 'rules' / 'best64.rule'
+    return [best64] if best64.exists() else []
+
+
+def write_wordlist(path, words: Iterable[str]) -> int:
+    """流式写入字典，返回写入的行数"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for word in words:
+            f.write(word + '\n')
+            count += 1
+    return count
+
+
+def parse_pdf_date(text: str) -> Optional[date]:
+    """解析PDF日期（D:20230515093000+08'00'）或XMP日期（2023-05-15T09:30:00）"""
+    match = re.match(r'(?:D:)?(\d{4})-?(\d{2})?-?(\d{2})?', text.strip())
+    if not match:
+        return None
+    year, month, day = match.group(1), match.group(2) or '01', match.group(3) or '01'
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def date_candidates(value: date) -> List[str]:
+    """日期的常见写法，如 20230515、150523、2023-05-15"""
+    return list(dict.fromkeys(value.strftime(fmt) for fmt in DATE_FORMATS))
+
+
+def _dates_in(text: str) -> List[date]:
+    """文本中的8位或6位日期，如文件名中的 20230515"""
+    found = []
+    for digits in re.findall(r'(?<!\d)(\d{8}|\d{6})(?!\d)', text):
+        for fmt in ('%Y%m%d', '%d%m%Y', '%y%m%d') if len(digits) == 8 else ('%y%m%d', '%Y%m'):
+            try:
+                found.append(datetime.strptime(digits, fmt).date())
+                break
+            except ValueError:
+                continue
+    return found
+
+
+def text_candidates(text: str) -> List[str]:
+    """文本及其分词的常见变形：原文、大小写、去空格、各个词和首字母"""
+    parts = [p for p in re.split(r'[\s_\-.,;:()（）\[\]/\\|]+', text) if p]
+    candidates = [text, text.lower(), text.upper(), ''.join(parts), ''.join(parts).lower()]
+    for part in parts:
+        candidates.extend([part, part.lower(), part.capitalize()])
+    words = [p for p in parts if not p.isdigit()]
+    if len(words) > 1:
+        initials = ''.join(p[0] for p in words)
+        candidates.extend([initials.lower(), initials.upper()])
+    candidates.extend(re.findall(r'\d+', text))
+    return [c for c in dict.fromkeys(candidates) if c]
+
+
+def filename_candidates(name: Optional[str]) -> List[str]:
+    """从文件名推测的候选，如 合同_2023-05.pdf -> 合同、2023、202305 等"""
+    if not name:
+        return []
+    stem = Path(name).stem
+    candidates = text_candidates(stem)
+    digits = re.findall(r'\d+', stem)
+    if len(digits) > 1:
+        candidates.append(''.join(digits))
+    for value in _dates_in(stem):
+        candidates.extend(date_candidates(value))
+    return [c for c in dict.fromkeys(candidates) if c]
+
+
+def metadata_candidates(pdf_file: Union[str, bytes, None], name: Optional[str] = None) -> List[str]:
+    """从文档元数据（作者、标题、创建日期等）和文件名生成候选密码
+
+    加密文档的/Info字符串通常也被加密，能读到的只有未加密的字段和XMP元数据，
+    文件名总是可用。
+    """
+    candidates = filename_candidates(name or (pdf_file if isinstance(pdf_file, str) else None))
+    metadata = {}
+    if pdf_file is not None:
+        try:
+            metadata = scan_metadata(pdf_file)
+        except (ScanError, OSError):
+            pass
+    for key in ('/Author', '/Title', '/Subject', '/Keywords'):
+        if key in metadata:
+            candidates.extend(text_candidates(metadata[key]))
+    years = set()
+    for key in ('/CreationDate', '/ModDate'):
+        value = parse_pdf_date(metadata.get(key, ''))
+        if value:
+            candidates.extend(date_candidates(value))
+            years.add(value.strftime('%Y'))
+    # 名字加年份是常见组合，如 zhang2023
+    for key in ('/Author', '/Title'):
+        words = [w for w in text_candidates(metadata.get(key, '')) if ' ' not in w]
+        for word in words[:4]:
+            candidates.extend(f'{word}{year}' for year in sorted(years))
+    return [c for c in dict.fromkeys(candidates) if c]
@@ -0,0 +1,620 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from config import Config
+from cpu_verify import quick_pass as cpu_quick_pass
+from dictionary import default_rules, filename_candidates, metadata_candidates
+from hash_modes import resolve_hash_mode, mode_description, UnsupportedHashError
+from hashcat_driver import (AsyncHashcatRun, ErrorEvent, FinishedEvent, ProgressEvent, RecoveredEvent,
+                            STOP_CANCELLED, STOP_TIMEOUT, format_password, format_speed)
+from jobs import (JobStore, read_outfile, ORIGIN_CLI, STATUS_ABANDONED, STATUS_FAILED, STATUS_FINISHED,
+                  STATUS_INTERRUPTED, STATUS_RUNNING)
+from options import DEFAULT_PROFILE, WATERMARKS_KEEP, WATERMARKS_REMOVE, WATERMARKS_REPORT
+from pdf2john import get_pdf_hash
+from pdf_logger import PdfLogger, log_error, log_info
+from planner import DictAttack, SpeedTable, build_plan, describe_stage, format_duration
+from result_cache import ResultCache, file_sha256
+from shard import ShardCoordinator
+from triage import triage_pdf, TriageResult, TRIAGE_LABELS, PATH_CRACK
+import metrics
+
+# Outcome.route 除分诊路径外的取值
+ROUTE_CACHED = 'cached'  # 命中结果缓存
+ROUTE_FAILED = 'failed'  # 哈希生成、破解或模式识别失败
+
+
+class Prepared(NamedTuple):
+    """分诊和哈希提取的结果，timings是各阶段耗时（秒）"""
+    path: str
+    triage: TriageResult
+    sha256: Optional[str]
+    hash_str: Optional[str]
+    timings: Dict[str, float]
+
+
+class Decrypted(NamedTuple):
+    """解密结果：data是未指定输出文件时解密后的内容（不复制的BytesIO），report和preview是去水印和预演的说明"""
+    elapsed: float
+    data: Optional[BytesIO] = None
+    report: Optional[str] = None
+    preview: Optional[str] = None
+
+
+class ProcessPlan(NamedTuple):
+    """处理文档的参数：攻击、时间预算（秒，None为不限）、输出路径（批量时为目录）和解密选项"""
+    attacks: Sequence = ()
+    budget: Optional[float] = None
+    output: Optional[str] = None
+    profile: str = DEFAULT_PROFILE
+    watermarks: str = WATERMARKS_KEEP
+    workers: Sequence = ()
+
+
+class Outcome(NamedTuple):
+    """一个文档的处理结果：route为分诊路径、ROUTE_CACHED或ROUTE_FAILED，output为解密后的文件（失败时为None）"""
+    path: str
+    route: str
+    password: Optional[bytes] = None
+    output: Optional[str] = None
+
+
+class JobResult(NamedTuple):
+    status: str
+    recovered: Dict[str, bytes]
+    message: Optional[str] = None
+
+
+def prepare_pdf(path: str, sha256: Optional[str] = None) -> Prepared:
+    """分诊，需要破解时生成哈希（在进程池中运行）；各阶段耗时随结果返回，由调用方记录指标"""
+    start_time = time.perf_counter()
+    triage = triage_pdf(path)
+    timings = {'triage': time.perf_counter() - start_time}
+    if triage.path != PATH_CRACK:
+        return Prepared(path, triage, sha256, None, timings)
+    sha256 = sha256 or file_sha256(path)
+    start_time = time.perf_counter()
+    hash_str = get_pdf_hash(path)
+    timings['extract'] = time.perf_counter() - start_time
+    return Prepared(path, triage, sha256, hash_str, timings)
+
+
+def observe_timings(timings: Dict[str, float]):
+    """记录子进程中测得的各阶段耗时，子进程中记录的指标不会汇总回来"""
+    for phase, seconds in timings.items():
+        metrics.observe(phase, seconds)
+
+
+def decrypt_pdf(source, password: Optional[bytes], output=None, profile: str = DEFAULT_PROFILE,
+                watermarks: str = WATERMARKS_KEEP) -> Decrypted:
+    """解密并去掉限制后写入output，output为None时返回装有解密后内容的BytesIO
+
+    内容不复制成bytes，大文件在内存中只有一份，由调用方直接交给下载。
+    watermarks为remove时去掉水印，为report时只检测会去掉的水印，输出不去水印。
+    pikepdf在这里才加载，只处理参数的调用方（如命令行 --help）不受影响。
+    """
+    from decrypt import decrypt
+    from watermark import inspect as inspect_watermarks
+    start_time = time.perf_counter()
+    preview = None
+    if watermarks == WATERMARKS_REPORT:
+        preview = inspect_watermarks(source, password).describe()
+    reports = []
+    buffer = decrypt(source, password, output, profile, remove_watermarks=watermarks == WATERMARKS_REMOVE,
+                     on_report=lambda report: reports.append(report.describe()))
+    return Decrypted(time.perf_counter() - start_time, buffer, ''.join(reports) or None, preview)
+
+
+def decrypted_path(input_path, output_dir=None, relative=None) -> Path:
+    """解密后文件的保存路径；保存到output_dir时relative是输入文件在其下的相对路径，默认只取文件名"""
+    input_path = Path(input_path)
+    name = f'{input_path.stem}_decrypted{input_path.suffix}'
+    if not output_dir:
+        return input_path.with_name(name)
+    return Path(output_dir) / Path(relative or input_path.name).with_name(name)
+
+
+def batch_outputs(paths, output_dir=None, names=None) -> Dict[str, Path]:
+    """批量处理时每个输入文件的输出路径，names是 输入文件 -> 输出目录下的相对路径
+
+    两个输入写到同一个输出文件，或输出文件就是另一个输入时抛出ValueError，不覆盖任何文件。
+    """
+    names = {str(path): relative for path, relative in (names or {}).items()}
+    outputs = {str(path): decrypted_path(path, output_dir, names.get(str(path))) for path in paths}
+    inputs = {os.path.normcase(os.path.abspath(path)): str(path) for path in paths}
+    seen = {}
+    for path, output in outputs.items():
+        key = os.path.normcase(os.path.abspath(output))
+        other = seen.setdefault(key, path)
+        if other != path:
+            raise ValueError(f'{other} 和 {path} 会写入同一个输出文件 {output}')
+        if key in inputs:
+            raise ValueError(f'{path} 的输出文件 {output} 会覆盖输入文件')
+    return outputs
+
+
+def source_candidates(log_name, sources=None) -> List[str]:
+    """各源文件的文件名和文档元数据候选"""
+    if not sources:
+        return filename_candidates(log_name)
+    candidates = [c for source in sources for c in metadata_candidates(source['path'], source.get('name'))]
+    return list(dict.fromkeys(candidates))
+
+
+class Reporter:
+    """引擎向前端报告的接口，默认什么都不做；日志由引擎自己记录"""
+
+    def message(self, text: str):
+        """给用户看的一条消息"""
+
+    def progress(self, job, event: ProgressEvent):
+        """hashcat（分片任务为合并后）的进度，分片任务从协调线程调用"""
+
+
+class Engine:
+    """命令行和网页端共用的异步处理引擎
+
+    用法::
+
+        async with Engine(reporter=reporter) as engine:
+            outcome = await engine.process('a.pdf', ProcessPlan(attacks=[MaskAttack('?d', 4, 8)]))
+
+    一个事件循环中可以同时处理多个文档：分诊、哈希提取和解密同时最多运行cpu_limit个，有多个时使用进程池；
+    hashcat用asyncio子进程运行，同时最多gpu_limit个。处理的协程被取消时（Ctrl-C、服务停止）
+    hashcat收到SIGINT，写入还原点后退出，任务标记为中断，可以继续；cancel()取消的任务标记为放弃。
+    """
+
+    def __init__(self, cpu_limit: Optional[int] = None, gpu_limit: Optional[int] = None,
+                 reporter: Optional[Reporter] = None, store: Optional[JobStore] = None):
+        self.cpu_limit = max(1, cpu_limit or Config.CPU_JOBS)
+        self.gpu_limit = max(1, gpu_limit or Config.MAX_GPU_JOBS)
+        self.reporter = reporter or Reporter()
+        self.store = store or JobStore()
+        self._cpu = asyncio.Semaphore(self.cpu_limit)
+        self._gpu = asyncio.Semaphore(self.gpu_limit)
+        self._pool = None
+        self._cpu_waiting = 0  # 等待或正在运行的CPU任务数
+        self._active = {}  # 任务ID -> 运行中的AsyncHashcatRun或ShardCoordinator
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def _report(self, text, logger=None, error=False, **fields):
+        """告诉用户并写入日志（任务日志或程序日志）"""
+        self.reporter.message(text)
+        if logger is not None:
+            (logger.error if error else logger.info)(text.strip(), **fields)
+        else:
+            (log_error if error else log_info)(text.strip(), **fields)
+
+    async def _cpu_call(self, func, *args):
+        """运行CPU密集的函数，同时运行的不超过cpu_limit个
+
+        同时有多个任务时在进程池中运行；只有一个时（如处理单个文档）直接在线程中运行，省去进程池的启动。
+        """
+        self._cpu_waiting += 1
+        try:
+            async with self._cpu:
+                if self._pool is None and (self._cpu_waiting == 1 or self.cpu_limit == 1):
+                    return await asyncio.to_thread(func, *args)
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(self.cpu_limit,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._cpu_waiting -= 1
+
+    async def prepare(self, path, sha256: Optional[str] = None) -> Prepared:
+        prepared = await self._cpu_call(prepare_pdf, str(path), sha256)
+        observe_timings(prepared.timings)
+        metrics.inc('files', path=prepared.triage.path)
+        log_info(f'{path} 处理路径: {TRIAGE_LABELS[prepared.triage.path]}', phase='triage')
+        return prepared
+
+    async def decrypt(self, path, password, output, plan: ProcessPlan) -> Optional[Decrypted]:
+        """在进程池中解密并保存到output，失败时返回None"""
+        log_info(f'开始解密PDF文件: {path}', phase='decrypt')
+        try:
+            result = await self._cpu_call(decrypt_pdf, str(path), password, str(output), plan.profile,
+                                          plan.watermarks)
+        except Exception as e:
+            self._report(f'❌ PDF解密失败：{str(e)}', error=True, phase='decrypt')
+            return None
+        metrics.observe('decrypt', result.elapsed)
+        if result.preview:
+            self._report(f'🧹 {path}: （预演）{result.preview}', phase='watermark')
+        if result.report:
+            self._report(f'🧹 {path}: {result.report}', phase='watermark')
+        log_info(f'PDF解密成功，已保存到: {output}', phase='decrypt')
+        return result
+
+    async def quick_pass(self, hash_strs, candidates=()) -> Dict[str, bytes]:
+        """启动hashcat前用CPU校验文件名、元数据候选和内置常见密码"""
+        if not Config.QUICK_PASS_LIMIT:
+            return {}
+        self.reporter.message('⚡ 正在快速验证常见密码...')
+        start_time = time.time()
+        # 快速验证自己使用进程池，这里只占一个CPU名额，避免和其他文档的分诊、解密争抢
+        async with self._cpu:
+            with metrics.timer('quick_pass'):
+                recovered = await asyncio.to_thread(cpu_quick_pass, hash_strs, extra=candidates)
+        msg = f'快速验证命中 {len(recovered)}/{len(hash_strs)} 个哈希，耗时 {time.time() - start_time:.1f} 秒'
+        self.reporter.message(f'⚡ {msg}' if recovered else msg)
+        log_info(msg, phase='quick_pass')
+        return recovered
+
+    def _show_plan(self, plan):
+        """显示攻击计划，超出时间预算的阶段不会执行"""
+        budget = format_duration(plan.budget) if plan.budget else '不限'
+        lines = [f'📋 攻击计划（时间预算 {budget}，预计共 {format_duration(plan.seconds)}）:']
+        lines.extend(f'  {i}. {describe_stage(stage)}' for i, stage in enumerate(plan.stages, 1))
+        self.reporter.message('\n'.join(lines))
+        for stage in plan.rejected:
+            self._report(f'  ❌ 已跳过 {describe_stage(stage)}', phase='plan')
+
+    async def crack(self, hash_strs, mode, desc, log_name, plan: ProcessPlan, sources=None) -> Dict[str, bytes]:
+        """先在CPU上快速验证常见密码，再按攻击计划依次运行hashcat，返回 哈希 -> 密码字节
+
+        plan.workers不为空时每个阶段的密钥空间分片给这些工作进程，否则由一个hashcat进程运行。
+        plan.budget同时是墙钟时间预算：每个任务只能使用剩余的预算，超时后hashcat被结束。
+        """
+        deadline = None if plan.budget is None else time.monotonic() + plan.budget
+        candidates = await asyncio.to_thread(source_candidates, log_name, sources)
+        recovered = await self.quick_pass(hash_strs, candidates)
+        if len(recovered) == len(hash_strs):
+            return recovered
+        attacks = list(plan.attacks)
+        rules = default_rules()
+        if candidates and rules:
+            # 快速验证已经校验过原样的候选，这里交给hashcat套用规则
+            attacks.insert(0, DictAttack(words=tuple(candidates), rules=tuple(str(r) for r in rules),
+                                         label='文档元数据候选'))
+        attack_plan = build_plan(mode, attacks, plan.budget)
+        self._show_plan(attack_plan)
+        for stage in attack_plan.stages:
+            remaining = [h for h in hash_strs if h not in recovered]
+            if not remaining:
+                break
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                self._report('⏰ 时间预算已用完，跳过剩余的攻击阶段', phase='plan')
+                break
+            stage_sources = [s for s in sources or [] if s['hash'] in remaining]
+            job = self.store.create_for_attack(log_name, remaining, mode, stage.attack, sources=stage_sources,
+                                               timeout=timeout)
+            result = await self.run_job(job, desc, workers=plan.workers)
+            recovered.update(result.recovered)
+        return recovered
+
+    def cancel(self, job_id: str) -> bool:
+        """取消运行中的任务：结束hashcat进程组或所有分片工作进程，可以从其他线程调用"""
+        active = self._active.get(job_id)
+        if active is None:
+            return False
+        if isinstance(active, ShardCoordinator):
+            active.cancel()
+        else:
+            active.stop(STOP_CANCELLED)
+        return True
+
+    def record(self, job, result: JobResult, **fields):
+        """把结果写入任务记录；放弃的任务已由 JobStore.abandon 记录"""
+        if result.status == STATUS_ABANDONED:
+            return
+        fields.update(status=result.status, pid=None, message=result.message,
+                      password=next(iter(result.recovered.values()), None))
+        if result.status == STATUS_FINISHED:
+            fields['progress'] = 1.0
+        self.store.update(job, **fields)
+
+    async def run_job(self, job, desc, cmd=None, workers=(), keep_files=False) -> JobResult:
+        """执行（或继续）一个破解任务，结果写入任务记录
+
+        给出workers时把密钥空间分片给这些工作进程，否则运行cmd（默认 job.build_command()）。
+        被中断的任务保留还原点；keep_files为False时结束的任务删除任务文件。
+        """
+        logger = PdfLogger(job.pdf_name, job=job.id, mode=job.mode, phase='shard' if workers else 'hashcat')
+        hash_strs = job.hashes()
+        result = JobResult(STATUS_INTERRUPTED, {})
+        start_time = time.time()
+        try:
+            # 上次运行可能已经破解成功，只是没来得及记录
+            recovered = read_outfile(job.out_file, hash_strs)
+            if len(recovered) == len(hash_strs):
+                logger.info('outfile中已有全部结果，无需再次运行hashcat')
+                result = JobResult(STATUS_FINISHED, recovered)
+            elif job.time_left() == 0:
+                result = JobResult(STATUS_FAILED, {}, '时间预算已用完')
+                self._report(f'⏰ 任务 {job.id} 的时间预算已用完', logger, error=True)
+            else:
+                async with self._gpu:
+                    if workers:
+                        result = await self._run_sharded(job, desc, workers, logger)
+                    else:
+                        result = await self._run_hashcat(job, desc, cmd or job.build_command(), logger)
+        except FileNotFoundError as e:
+            result = JobResult(STATUS_FAILED, {}, str(e))
+            self._report(f'❌ 错误：{str(e)}', logger, error=True)
+        except Exception as e:
+            result = JobResult(STATUS_FAILED, {}, str(e))
+            self._report(f'❌ 未知错误：{str(e)}', logger, error=True)
+        finally:
+            self._active.pop(job.id, None)
+            self.record(job, result, runtime=job.runtime + time.time() - start_time)
+            if result.status not in (STATUS_INTERRUPTED, STATUS_ABANDONED) and not keep_files:
+                logger.info(f'删除任务文件: {job.job_dir}')
+                self.store.remove_files(job)
+        return result
+
+    def _interrupted(self, job, logger, detail=''):
+        hint = f'，可使用 --resume {job.id} 继续' if job.origin == ORIGIN_CLI else ''
+        self._report(f'⏸️ 任务 {job.id} 已中断{hint}{detail}', logger)
+
+    async def _run_hashcat(self, job, desc, cmd, logger) -> JobResult:
+        Config.validate()  # 验证hashcat是否存在
+        hash_strs = job.hashes()
+        self.reporter.message(f'🔍 使用模式: {desc}（任务 {job.id}）')
+        logger.info(f'任务 {job.id}: {len(hash_strs)} 个哈希，哈希文件: {job.hash_file}，开始尝试模式: {desc}')
+        logger.command(cmd, '开始执行...')
+
+        run = AsyncHashcatRun(cmd, job.out_file, hash_strs, cwd=str(Config.HASHCAT_DIR), timeout=job.time_left(),
+                              labels={'mode': job.mode})
+        await run.start()
+        self._active[job.id] = run
+        self.store.update(job, status=STATUS_RUNNING, pid=run.process.pid, command=job.command or cmd)
+        errors = []
+        measured = None  # 最后一次包含设备速度的状态
+        finished = None
+        try:
+            async for event in run.events():
+                if isinstance(event, ProgressEvent):
+                    if event.speeds:
+                        measured = event
+                    self.reporter.progress(job, event)
+                elif isinstance(event, RecoveredEvent):
+                    self.reporter.message(f'🔑 已恢复 {len(run.recovered)}/{len(hash_strs)} 个哈希')
+                elif isinstance(event, ErrorEvent):
+                    logger.error(event.message)
+                    if not event.warning:
+                        errors.append(event.message)
+                elif isinstance(event, FinishedEvent):
+                    finished = event
+        except asyncio.CancelledError:
+            # hashcat在自己的进程组中收不到终端的Ctrl-C，转发给它，等它写入还原点后退出
+            await run.interrupt()
+            self._interrupted(job, logger)
+            raise
+        finally:
+            await run.terminate()
+            logger.command(cmd, run.output())
+        if measured is not None:
+            SpeedTable().record(job.mode, sum(measured.speeds.values()))
+
+        if finished is not None and finished.status == STOP_CANCELLED:
+            logger.info(f'任务 {job.id} 已取消')
+            return JobResult(STATUS_ABANDONED, {})
+        message = errors[-1] if errors else None
+        if finished is not None and finished.status == STOP_TIMEOUT:
+            message = '超出时间预算，已结束hashcat'
+            self._report(f'⏰ 任务 {job.id} {message}', logger, error=True)
+
+        recovered = read_outfile(job.out_file, hash_strs)
+        if recovered:
+            self._report(f'✅ 使用模式 {desc} 破解成功 {len(recovered)}/{len(hash_strs)} 个哈希', logger)
+            return JobResult(STATUS_FINISHED, recovered)
+        if errors:
+            self.reporter.message(f'❌ 模式 {desc} 失败原因：\n' + '\n'.join(f'  ⚠️ {e}' for e in errors))
+        if measured is not None:
+            self._report(f'📊 速度: {format_speed(sum(measured.speeds.values()))}，'
+                         f'进度: {measured.done}/{measured.total}', logger)
+        self._report(f'❌ 模式 {desc} 尝试失败', logger, error=True)
+        return JobResult(STATUS_FAILED, {}, message or job.exhausted_message())
+
+    async def _run_sharded(self, job, desc, workers, logger) -> JobResult:
+        """把任务的密钥空间分片给多个工作进程；协调器在线程中运行，中断时已完成的块保留供继续"""
+        coordinator = ShardCoordinator(job, workers, logger)
+        names = ', '.join(worker.name for worker in workers)
+        self.reporter.message(f'🔍 使用模式: {desc}（任务 {job.id}，工作进程: {names}）')
+        logger.info(f'开始分片破解，工作进程: {names}')
+        self._active[job.id] = coordinator
+        self.store.update(job, status=STATUS_RUNNING, pid=os.getpid())
+        future = asyncio.ensure_future(asyncio.to_thread(
+            coordinator.run, lambda event: self.reporter.progress(job, event), timeout=job.time_left()))
+        try:
+            recovered = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            coordinator.stop()
+            await future
+            self._interrupted(job, logger, '（已完成的块不再重复）')
+            raise
+        SpeedTable().record(job.mode, coordinator.measured)
+
+        if coordinator.cancelled:
+            logger.info(f'任务 {job.id} 已取消')
+            return JobResult(STATUS_ABANDONED, recovered)
+        if recovered:
+            self._report(f'✅ 使用模式 {desc} 破解成功 {len(recovered)}/{len(coordinator.hash_strs)} 个哈希', logger)
+            return JobResult(STATUS_FINISHED, recovered)
+        if coordinator.message:
+            self._report(f'  ⚠️ {coordinator.message}', logger, error=True)
+        self._report(f'❌ 模式 {desc} 尝试失败', logger, error=True)
+        return JobResult(STATUS_FAILED, {}, coordinator.message or job.exhausted_message())
+
+    async def process(self, path, plan: ProcessPlan) -> Outcome:
+        """处理单个文档：分诊，需要时生成哈希并破解，然后解密到 plan.output（默认保存在原文件旁）"""
+        path = Path(path)
+        output = Path(plan.output) if plan.output else decrypted_path(path)
+        self.reporter.message('正在检查是否需要破解...')
+        prepared = await self.prepare(path)
+        triage = prepared.triage
+        self._report(f'处理路径: {TRIAGE_LABELS[triage.path]}（耗时 {prepared.timings["triage"] * 1000:.0f} 毫秒）')
+        if triage.path == PATH_CRACK:
+            route, password = await self._crack_one(prepared, output, plan)
+            if route == ROUTE_FAILED:
+                return Outcome(str(path), route)
+        else:
+            route, password = triage.path, triage.password
+            if password:
+                self.reporter.message(f'🎉 无需破解，密码是: {format_password(password)}')
+
+        self.reporter.message('正在解密PDF...')
+        if await self.decrypt(path, password, output, plan) is None:
+            return Outcome(str(path), route, password)
+        self._report(f'✅ 解密完成！文件已保存到: {output}')
+        return Outcome(str(path), route, password, str(output))
+
+    async def _crack_one(self, prepared: Prepared, output, plan: ProcessPlan):
+        """查缓存或破解单个文档，返回 (处理路径, 密码)"""
+        cache = ResultCache()
+        cached = cache.lookup(file_sha256=prepared.sha256, hash_str=prepared.hash_str)
+        if cached:
+            metrics.inc('cache_hits')
+            self._report(f'⚡ 命中结果缓存（模式 {cached.mode}），无需破解')
+            return ROUTE_CACHED, cached.password
+        if not prepared.hash_str:
+            metrics.inc('failed')
+            self._report('⚠️ 该PDF未加密或格式异常', error=True)
+            return ROUTE_FAILED, None
+        log_info('生成的PDF哈希', hash=prepared.hash_str, phase='extract')
+        try:
+            mode, desc = resolve_hash_mode(prepared.hash_str)
+        except UnsupportedHashError as e:
+            metrics.inc('failed')
+            self._report(f'❌ hashcat无法处理该哈希：{str(e)}', error=True)
+            return ROUTE_FAILED, None
+
+        self.reporter.message('开始破解...')
+        log_info('开始破解PDF密码', phase='crack')
+        start_time = time.time()
+        sources = [{'path': os.path.abspath(prepared.path), 'sha256': prepared.sha256, 'hash': prepared.hash_str,
+                    'output': os.path.abspath(output)}]
+        password = (await self.crack([prepared.hash_str], mode, desc, Path(prepared.path).name, plan,
+                                     sources)).get(prepared.hash_str)
+        if password is None:
+            metrics.inc('failed')
+            self._report('❌ 破解失败', error=True)
+            return ROUTE_FAILED, None
+        metrics.inc('cracked')
+        timings = {'extract': prepared.timings['extract'], 'crack': time.time() - start_time}
+        cache.store(prepared.sha256, prepared.hash_str, password, mode, timings)
+        self._report(f'🎉 破解成功！密码是: {format_password(password)}')
+        return PATH_CRACK, password
+
+    async def process_batch(self, paths, plan: ProcessPlan, names=None) -> List[Outcome]:
+        """批量处理：并行分诊和生成哈希，每个hashcat模式只启动一次，再并行解密
+
+        plan.output为输出目录，names是 输入文件 -> 输出目录下的相对路径（默认只取文件名）。
+        输出文件冲突时在处理任何文件之前抛出ValueError。
+        """
+        outputs = batch_outputs(paths, plan.output, names)
+        for output in outputs.values():
+            output.parent.mkdir(parents=True, exist_ok=True)
+        self.reporter.message(f'正在分诊并生成 {len(paths)} 个文件的哈希...')
+        cache = ResultCache()
+        outcomes = {}  # 文件 -> Outcome
+        groups = {}    # 模式 -> (描述, {哈希: [Prepared]})
+        for prepared in await asyncio.gather(*(self.prepare(path) for path in paths)):
+            path, triage = prepared.path, prepared.triage
+            if triage.path != PATH_CRACK:
+                outcomes[path] = Outcome(path, triage.path, triage.password)
+                continue
+            cached = cache.lookup(file_sha256=prepared.sha256, hash_str=prepared.hash_str)
+            if cached:
+                metrics.inc('cache_hits')
+                log_info(f'{path} 命中结果缓存')
+                outcomes[path] = Outcome(path, ROUTE_CACHED, cached.password)
+                continue
+            outcomes[path] = Outcome(path, ROUTE_FAILED)
+            if not prepared.hash_str:
+                metrics.inc('failed')
+                log_error(f'{path} 哈希生成失败')
+                continue
+            try:
+                mode, desc = resolve_hash_mode(prepared.hash_str)
+            except UnsupportedHashError as e:
+                metrics.inc('failed')
+                self._report(f'❌ {path}: hashcat无法处理该哈希：{str(e)}', error=True)
+                continue
+            groups.setdefault(mode, (desc, {}))[1].setdefault(prepared.hash_str, []).append(prepared)
+
+        # 不同模式的hashcat任务同时排队，由gpu_limit限制同时运行的个数
+        for cracked in await asyncio.gather(*(self._crack_group(mode, desc, hashes, plan, outputs)
+                                              for mode, (desc, hashes) in groups.items())):
+            outcomes.update(cracked)
+
+        to_decrypt = [outcome for outcome in outcomes.values() if outcome.route != ROUTE_FAILED]
+        if to_decrypt:
+            self.reporter.message(f'正在并行解密 {len(to_decrypt)} 个文件...')
+            results = await asyncio.gather(*(
+                self.decrypt(outcome.path, outcome.password, outputs[outcome.path], plan) for outcome in to_decrypt))
+            for outcome, result in zip(to_decrypt, results):
+                if result is not None:
+                    outcomes[outcome.path] = outcome._replace(output=str(outputs[outcome.path]))
+        return [outcomes[str(path)] for path in paths]
+
+    async def _crack_group(self, mode, desc, hashes, plan: ProcessPlan, outputs) -> Dict[str, Outcome]:
+        """用一组任务破解同一模式的所有哈希，结果写入缓存；outputs是各文件的输出路径，供继续任务时解密"""
+        files = sum(len(items) for items in hashes.values())
+        self.reporter.message(f'开始破解模式 {desc}: {len(hashes)} 个哈希，{files} 个文件')
+        log_info(f'开始破解模式 {mode}: {len(hashes)} 个哈希', mode=mode, phase='crack')
+        start_time = time.time()
+        sources = [
+            {'path': os.path.abspath(item.path), 'sha256': item.sha256, 'hash': hash_str,
+             'output': os.path.abspath(outputs[item.path])}
+            for hash_str, items in hashes.items() for item in items
+        ]
+        recovered = await self.crack(list(hashes), mode, desc, f'batch_{mode}', plan, sources)
+        timings = {'crack': time.time() - start_time}
+        cache = ResultCache()
+        outcomes = {}
+        for hash_str, items in hashes.items():
+            password = recovered.get(hash_str)
+            for item in items:
+                if password is None:
+                    metrics.inc('failed')
+                    log_error(f'{item.path} 破解失败')
+                    outcomes[item.path] = Outcome(item.path, ROUTE_FAILED)
+                    continue
+                metrics.inc('cracked')
+                log_info(f'{item.path} 破解成功，密码: {format_password(password)}')
+                cache.store(item.sha256, hash_str, password, mode, timings)
+                outcomes[item.path] = Outcome(item.path, PATH_CRACK, password)
+        return outcomes
+
+    async def resume(self, job, plan: ProcessPlan) -> Dict[str, bytes]:
+        """从hashcat还原点（分片任务从未完成的块）继续中断的任务，并解密任务记录中的源文件"""
+        workers = ()
+        if job.shards_file.exists():
+            if not plan.workers:
+                self._report(f'❌ 错误：任务 {job.id} 是分片任务，需要用 --workers 或 PDFJOKER_WORKERS 指定工作进程',
+                             error=True)
+                return {}
+            workers = plan.workers
+        result = await self.run_job(job, mode_description(job.mode), cmd=job.resume_command(), workers=workers,
+                                    keep_files=True)
+        try:
+            cache = ResultCache()
+            for source in job.sources:
+                password = result.recovered.get(source['hash'])
+                if password is None:
+                    continue
+                cache.store(source.get('sha256'), source['hash'], password, job.mode)
+                metrics.inc('cracked')
+                self.reporter.message(f'🎉 {source["path"]} 破解成功！密码是: {format_password(password)}')
+                await self.decrypt(source['path'], password, source['output'], plan)
+        finally:
+            if result.status != STATUS_INTERRUPTED:
+                self.store.remove_files(job)
+        return result.recovered
@@ -0,0 +1,111 @@
+import re
+from typing import NamedTuple, Optional
+
+
+class HashMode(NamedTuple):
+    mode: str
+    desc: str
+
+
+class UnsupportedHashError(ValueError):
+    """hashcat无法处理的$pdf$哈希"""
+
+
+# (V, R, 密钥长度) -> hashcat模式，与hashcat各模块的解析校验保持一致
+PDF_HASH_MODES = {
+    (1, 2, 40): HashMode('10400', 'PDF 1.1 - 1.3 (Acrobat 2 - 4)'),
+    (2, 3, 128): HashMode('10500', 'PDF 1.4 - 1.6 (Acrobat 5 - 8)'),
+    (4, 4, 128): HashMode('10500', 'PDF 1.4 - 1.6 (Acrobat 5 - 8)'),
+    (5, 5, 256): HashMode('10600', 'PDF 1.7 Level 3 (Acrobat 9)'),
+    (5, 6, 256): HashMode('10700', 'PDF 1.7 Level 8 (Acrobat 10 - 11)'),
+}
+
+# hashcat只接受16或32字节的/ID
+DOCUMENT_ID_LENGTHS = (16, 32)
+
+# 哈希中的数据字段：偶数个十六进制字符，不允许空白
+_HEX_FIELD = re.compile(r'(?:[0-9a-fA-F]{2})*')
+
+
+def resolve_mode(version: int, revision: int, length: Optional[int] = None,
+                 handler: str = '/Standard') -> HashMode:
+    """根据加密字典的/V、/R、/Length和安全处理器确定唯一的hashcat模式"""
+    if handler != '/Standard':
+        raise UnsupportedHashError(f'hashcat不支持的安全处理器: {handler}')
+    if length is None:
+        length = 256 if version == 5 else 40
+    mode = PDF_HASH_MODES.get((version, revision, length))
+    if mode is None:
+        raise UnsupportedHashError(
+            f'hashcat不支持的加密参数: V={version}, R={revision}, Length={length}'
+        )
+    return mode
+
+
+def parse_pdf_hash(hash_str: str) -> dict:
+    """拆分pdf2john生成的$pdf$哈希字段"""
+    hash_str = hash_str.strip()
+    if not hash_str.startswith('$pdf$'):
+        raise UnsupportedHashError('不是$pdf$格式的哈希')
+    fields = hash_str[len('$pdf$'):].split('*')
+    # V*R*Length*P*EncryptMetadata*IDLen*ID*ULen*U*OLen*O[*...]
+    if len(fields) < 11 or len(fields) % 2 == 0:
+        raise UnsupportedHashError(f'$pdf$哈希字段数量异常: {len(fields)}')
+    try:
+        version, revision, length, perms, encrypt_metadata = (int(v) for v in fields[:5])
+        if encrypt_metadata not in (0, 1):
+            raise UnsupportedHashError(f'$pdf$哈希的EncryptMetadata字段异常: {encrypt_metadata}')
+        blobs = []
+        for i in range(5, len(fields), 2):
+            size = int(fields[i])
+            if not _HEX_FIELD.fullmatch(fields[i + 1]):
+                raise UnsupportedHashError(f'$pdf$哈希第{i + 2}个字段不是十六进制数据')
+            data = bytes.fromhex(fields[i + 1])
+            if size != len(data):
+                raise UnsupportedHashError(f'$pdf$哈希第{i + 1}个字段长度不匹配')
+            blobs.append(data)
+    except UnsupportedHashError:
+        raise
+    except ValueError as e:
+        raise UnsupportedHashError(f'$pdf$哈希格式错误: {e}') from e
+    return {
+        'version': version,
+        'revision': revision,
+        'length': length,
+        'permissions': perms,
+        'encrypt_metadata': bool(encrypt_metadata),
+        'document_id': blobs[0],
+        'udata': blobs[1],
+        'odata': blobs[2],
+        'extra': blobs[3:],
+    }
+
+
+def resolve_hash_mode(hash_str: str) -> HashMode:
+    """从$pdf$哈希确定hashcat模式，无法处理时抛出UnsupportedHashError"""
+    fields = parse_pdf_hash(hash_str)
+    mode = resolve_mode(fields['version'], fields['revision'], fields['length'])
+    if len(fields['document_id']) not in DOCUMENT_ID_LENGTHS:
+        raise UnsupportedHashError(f'模式 {mode.mode} 的/ID长度异常: {len(fields["document_id"])}')
+    # RC4模式的U/O固定为32字节，AES-256模式至少包含32字节的校验值
+    sizes = (len(fields['udata']), len(fields['odata']))
+    if min(sizes) < 32 or (mode.mode in ('10400', '10500') and max(sizes) != 32):
+        raise UnsupportedHashError(
+            f'模式 {mode.mode} 的U/O长度异常: '
+            f'{sizes[0]}/{sizes[1]}'
+        )
+    return mode
+
+
+def hash_key(hash_str: str) -> tuple:
+    """哈希的规范化键，用于把hashcat输出的哈希映射回原始哈希"""
+    fields = parse_pdf_hash(hash_str)
+    return fields['document_id'], fields['udata'][:32], fields['odata'][:32]
+
+
+def mode_description(mode: str) -> str:
+    """hashcat模式的描述"""
+    for hash_mode in PDF_HASH_MODES.values():
+        if hash_mode.mode == mode:
+            return hash_mode.desc
+    return f'hashcat mode {mode}'
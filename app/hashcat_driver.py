@@ -0,0 +1,532 @@
+import asyncio
+import atexit
+import json
+import os
+import queue
+import re
+import signal
+import threading
+import time
+import weakref
+from collections import deque
+from subprocess import Popen, PIPE, TimeoutExpired
+from typing import AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+from hash_modes import hash_key, UnsupportedHashError
+import metrics
+
+# 追加到hashcat命令中的状态输出参数：每秒输出一行JSON状态
+STATUS_ARGS = ['--status', '--status-json', '--status-timer', '1']
+
+# hashcat的状态码
+STATUS_NAMES = {
+    0: 'Initializing', 1: 'Autotuning', 2: 'Selftest', 3: 'Running', 4: 'Paused',
+    5: 'Exhausted', 6: 'Cracked', 7: 'Aborted', 8: 'Quit', 9: 'Bypass',
+    10: 'Aborted (Checkpoint)', 11: 'Aborted (Runtime)', 12: 'Running (Checkpoint Quit requested)',
+    13: 'Error', 14: 'Aborted (Finish)', 15: 'Running (Quit after attack requested)',
+}
+
+# 事件队列和输出尾部的上限，保证长时间运行时内存有界
+QUEUE_SIZE = 1000
+TAIL_LINES = 200
+
+
+class ProgressEvent(NamedTuple):
+    status: str
+    progress: float                 # 0 - 1
+    done: int
+    total: int
+    speeds: Dict[int, int]          # 设备ID -> H/s
+    eta: Optional[float]            # 剩余秒数
+    recovered: Tuple[int, int]      # (已恢复, 总数)
+    restore_point: int
+
+
+class RecoveredEvent(NamedTuple):
+    hash_str: str
+    password: bytes
+
+
+class ErrorEvent(NamedTuple):
+    message: str
+    warning: bool = False
+
+
+class FinishedEvent(NamedTuple):
+    returncode: int
+    status: str
+    recovered: Dict[str, bytes]
+
+
+Event = Union[ProgressEvent, RecoveredEvent, ErrorEvent, FinishedEvent]
+
+# hashcat退出码
+EXIT_STATUS = {0: 'Cracked', 1: 'Exhausted', 2: 'Aborted', 3: 'Aborted (Checkpoint)',
+               4: 'Aborted (Runtime)', 255: 'Error'}
+
+# 由我们提前结束hashcat的原因，作为FinishedEvent的status
+STOP_CRACKED = 'Cracked'
+STOP_CANCELLED = 'Cancelled'
+STOP_TIMEOUT = 'Timeout'
+
+# 运行中的hashcat，解释器退出时结束它们的进程组，不留下占用GPU的孤儿进程
+_live_runs = weakref.WeakSet()
+
+
+# asyncio版本读取输出行的缓冲上限，超长的行被跳过
+LINE_LIMIT = 1024 * 1024
+
+
+@atexit.register
+def _terminate_live_runs():
+    for run in list(_live_runs):
+        run.terminate_at_exit()
+
+
+def process_group_kwargs() -> dict:
+    """让子进程成为新进程组的组长，结束时可以连同它的子进程一起结束，终端的Ctrl-C也不会直接传给它"""
+    if os.name == 'nt':
+        import subprocess
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def format_speed(speed: float) -> str:
+    """把H/s格式化为hashcat风格的速度字符串"""
+    for unit in ('', 'k', 'M', 'G', 'T'):
+        if speed < 1000 or unit == 'T':
+            return f'{speed:.1f} {unit}H/s'
+        speed /= 1000
+
+
+# hashcat把含冒号、控制字符或非UTF-8字节的明文写成 $HEX[...]（--outfile-autohex，默认开启）
+_HEX_PLAIN = re.compile(rb'\$HEX\[((?:[0-9a-fA-F]{2})*)\]')
+
+
+def decode_plain(plain: bytes) -> bytes:
+    """把outfile中的明文还原为密码字节，解开 $HEX[...] 形式"""
+    match = _HEX_PLAIN.fullmatch(plain)
+    return bytes.fromhex(match.group(1).decode('ascii')) if match else plain
+
+
+def encode_plain(password: bytes) -> bytes:
+    """按hashcat的方式写入outfile的明文：不是可打印ASCII、含冒号或本身形如 $HEX[...] 时写成 $HEX[...]"""
+    if any(b < 0x20 or b > 0x7e or b == 0x3a for b in password) or _HEX_PLAIN.fullmatch(password):
+        return b'$HEX[' + password.hex().encode('ascii') + b']'
+    return password
+
+
+def password_bytes(password: Union[str, bytes, None]) -> Optional[bytes]:
+    """数据库中的密码转为字节；旧版本以文本保存，其中可能有未解开的 $HEX[...]"""
+    if isinstance(password, str):
+        return decode_plain(password.encode('utf-8'))
+    return password
+
+
+def format_password(password: Union[str, bytes, None]) -> str:
+    """显示用的密码：可打印的UTF-8原样显示，否则像hashcat一样显示为 $HEX[...]"""
+    if password is None or isinstance(password, str):
+        return password or ''
+    try:
+        text = password.decode('utf-8')
+    except UnicodeDecodeError:
+        text = None
+    if text is not None and text.isprintable() and not _HEX_PLAIN.fullmatch(password):
+        return text
+    return f'$HEX[{password.hex()}]'
+
+
+def parse_status_line(line: str) -> Optional[ProgressEvent]:
+    """解析一行 --status-json 输出，不是状态行时返回None"""
+    line = line.strip()
+    if not line.startswith('{'):
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'progress' not in data:
+        return None
+    done, total = (data.get('progress') or [0, 0])[:2]
+    speeds = {
+        device.get('device_id', i): int(device.get('speed', 0))
+        for i, device in enumerate(data.get('devices') or [])
+    }
+    eta = None
+    if data.get('estimated_stop'):
+        eta = max(0.0, data['estimated_stop'] - time.time())
+    recovered = tuple((data.get('recovered_hashes') or [0, 0])[:2])
+    return ProgressEvent(
+        status=STATUS_NAMES.get(data.get('status'), str(data.get('status'))),
+        progress=done / total if total else 0.0,
+        done=done,
+        total=total,
+        speeds=speeds,
+        eta=eta,
+        recovered=recovered,
+        restore_point=data.get('restore_point', 0),
+    )
+
+
+class OutfileReader:
+    """增量读取hashcat的 --outfile（哈希:密码），把结果映射回原始哈希
+
+    密码按字节处理：行在字节上拆分，$HEX[...] 形式的明文被解开，非UTF-8的字节原样保留。
+    """
+
+    def __init__(self, path, hash_strs: List[str]):
+        self.path = path
+        self.hash_strs = list(hash_strs)
+        self._by_key = {hash_key(h): h for h in self.hash_strs}
+        self._offset = 0
+        self.recovered: Dict[str, bytes] = {}
+
+    def read_new(self, final: bool = False) -> List[Tuple[str, bytes]]:
+        """返回上次读取之后新增的 (哈希, 密码)；final为True时也处理未换行的最后一行"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 运行中只处理完整的行，hashcat可能正在写入最后一行
+        end = len(data) if final else data.rfind(b'\n') + 1
+        self._offset += end
+        found = []
+        for line in data[:end].splitlines():
+            # $pdf$哈希本身不含冒号，第一个冒号之后都是密码
+            cracked_hash, sep, plain = line.partition(b':')
+            if not sep:
+                continue
+            password = decode_plain(plain)
+            try:
+                hash_str = self._by_key.get(hash_key(cracked_hash.decode('ascii')))
+            except (UnicodeDecodeError, UnsupportedHashError):
+                hash_str = None
+            if hash_str is None and len(self.hash_strs) == 1:
+                hash_str = self.hash_strs[0]
+            if hash_str is not None and hash_str not in self.recovered:
+                self.recovered[hash_str] = password
+                found.append((hash_str, password))
+        return found
+
+
+class HashcatRun:
+    """一次hashcat运行，以类型化事件流的形式提供进度、结果和错误
+
+    用法::
+
+        with HashcatRun(cmd, out_file, hash_strs, cwd, timeout=3600) as run:
+            for event in run.events():
+                ...
+
+    命令中应包含STATUS_ARGS和 --outfile；读取线程和事件队列都有上限，
+    输出只保留最近TAIL_LINES行。hashcat在自己的进程组中运行：outfile中出现全部
+    哈希的结果、调用stop()取消或超过timeout秒时，整个进程组被结束并回收，
+    FinishedEvent的status分别为STOP_CRACKED、STOP_CANCELLED和STOP_TIMEOUT。
+
+    启动到第一次Running状态的耗时记为 hashcat_startup 阶段（含内核编译），之后到退出记为
+    crack 阶段；各设备的速度记入 hashcat_speed 仪表。labels是这些指标的标签，如模式和工作进程。
+    """
+
+    def __init__(self, cmd, out_file, hash_strs, cwd=None, popen_kwargs=None, timeout=None, stop_on_hit=True,
+                 labels=None):
+        self.cmd = [str(c) for c in cmd]
+        self.cwd = cwd
+        self.outfile = OutfileReader(out_file, hash_strs)
+        self.popen_kwargs = popen_kwargs or {}
+        self.timeout = timeout
+        self.stop_on_hit = stop_on_hit
+        self.labels = labels or {}
+        self.process = None
+        self.stop_reason: Optional[str] = None
+        self.tail = deque(maxlen=TAIL_LINES)
+        self.last_progress: Optional[ProgressEvent] = None
+        self._events = queue.Queue(maxsize=QUEUE_SIZE)
+        self._deadline = None
+        self._lock = threading.Lock()
+        self._started_at = None
+        self._running_at = None  # 第一次进入Running状态的时间
+        self._last_check = 0.0  # 上次检查outfile和停止条件的时间
+        self._ended = False
+
+    @property
+    def recovered(self) -> Dict[str, bytes]:
+        return self.outfile.recovered
+
+    def start(self):
+        self.process = Popen(self.cmd, stdout=PIPE, stderr=PIPE, text=True, bufsize=1,
+                             cwd=self.cwd, **{**process_group_kwargs(), **self.popen_kwargs})
+        self._record_start()
+        for stream, is_error in ((self.process.stdout, False), (self.process.stderr, True)):
+            threading.Thread(target=self._pump, args=(stream, is_error), daemon=True).start()
+        return self
+
+    def __enter__(self):
+        return self if self.process is not None else self.start()
+
+    def __exit__(self, *exc_info):
+        self.terminate()
+
+    def _pump(self, stream, is_error):
+        for line in stream:
+            self._events.put((is_error, line.rstrip('\r\n')))
+        self._events.put((is_error, None))
+
+    def events(self, poll_interval: float = 0.5) -> Iterator[Event]:
+        """按顺序产生事件，最后一个事件总是FinishedEvent
+
+        每隔poll_interval秒检查一次outfile和超时，不依赖hashcat的状态输出。
+        """
+        if self.process is None:
+            self.start()
+        open_streams = 2
+        self._last_check = time.monotonic()
+        while open_streams:
+            try:
+                is_error, line = self._events.get(timeout=poll_interval)
+            except queue.Empty:
+                is_error, line = False, ''
+            if line is None:
+                open_streams -= 1
+                continue
+            yield from self._handle_line(is_error, line, poll_interval)
+        yield from self._finish(self.process.wait())
+
+    def _handle_line(self, is_error: bool, line: str, poll_interval: float) -> List[Event]:
+        """处理一行输出（等待超时时为空行），返回要产生的事件；同步和asyncio版本共用
+
+        收到状态行或距上次检查已有poll_interval秒时，检查outfile中的新结果和停止条件。
+        """
+        if line:
+            self.tail.append(line)
+        events = []
+        progress = None
+        if is_error:
+            if line.strip():
+                events.append(ErrorEvent(line.strip(), warning='WARNING' in line))
+        else:
+            progress = parse_status_line(line)
+            if progress is not None:
+                self.last_progress = progress
+                self._record_progress(progress)
+                events.append(progress)
+            elif 'ERROR' in line or 'FAILED' in line:
+                events.append(ErrorEvent(line.strip()))
+        if progress is not None or time.monotonic() - self._last_check >= poll_interval:
+            self._last_check = time.monotonic()
+            events.extend(self._recovered_events())
+            self._check_stop()
+        return events
+
+    def _finish(self, returncode: int) -> List[Event]:
+        """进程退出后的事件：outfile中剩余的结果，最后是FinishedEvent"""
+        self._record_end()
+        events: List[Event] = list(self._recovered_events(final=True))
+        status = (self.stop_reason or EXIT_STATUS.get(returncode)
+                  or (self.last_progress.status if self.last_progress else 'Error'))
+        events.append(FinishedEvent(returncode, status, dict(self.recovered)))
+        return events
+
+    def _record_start(self):
+        """进程启动后登记运行中的hashcat，开始计时"""
+        _live_runs.add(self)
+        self._started_at = time.monotonic()
+        metrics.add_gauge('hashcat_processes', 1)
+        if self.timeout is not None:
+            self._deadline = time.monotonic() + self.timeout
+
+    def _record_progress(self, event: ProgressEvent):
+        if self._running_at is None and event.status == 'Running':
+            self._running_at = time.monotonic()
+        for device, speed in event.speeds.items():
+            metrics.set_gauge('hashcat_speed', speed, device=device, **self.labels)
+
+    def _record_end(self):
+        """进程退出后记录启动和破解阶段的耗时，只记录一次"""
+        with self._lock:
+            if self._ended:
+                return
+            self._ended = True
+        metrics.add_gauge('hashcat_processes', -1)
+        now = time.monotonic()
+        running_at = self._running_at or now
+        metrics.observe('hashcat_startup', running_at - self._started_at, **self.labels)
+        if self._running_at is not None:
+            metrics.observe('crack', now - self._running_at, **self.labels)
+
+    def _recovered_events(self, final=False):
+        for hash_str, password in self.outfile.read_new(final):
+            yield RecoveredEvent(hash_str, password)
+
+    def _check_stop(self):
+        """全部哈希都已恢复或超时时结束hashcat，不等它自己退出"""
+        if self.stop_on_hit and len(self.recovered) == len(self.outfile.hash_strs):
+            self.stop(STOP_CRACKED)
+        elif self._deadline is not None and time.monotonic() >= self._deadline:
+            self.stop(STOP_TIMEOUT)
+
+    def stop(self, reason: str = STOP_CANCELLED, timeout: float = 10):
+        """结束hashcat的进程组并记录原因，可以从其他线程调用"""
+        with self._lock:
+            if self.stop_reason is None and self.process is not None and self.process.poll() is None:
+                self.stop_reason = reason
+        self.terminate(timeout)
+
+    def _signal_group(self, sig=None):
+        """给整个进程组发送信号，sig为None时强制结束（Windows上只能结束hashcat本身）"""
+        try:
+            if os.name == 'nt':
+                if sig is None:
+                    self.process.kill()
+                else:
+                    self.process.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                os.killpg(self.process.pid, signal.SIGKILL if sig is None else sig)
+        except OSError:
+            pass
+
+    def terminate_at_exit(self):
+        self.terminate(timeout=5)
+
+    def interrupt(self, timeout: float = 10):
+        """像终端Ctrl-C一样给进程组发送SIGINT，等hashcat写入还原点后退出；timeout秒后仍未退出时才terminate()"""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self._signal_group(signal.SIGINT)
+        try:
+            self.process.wait(timeout=timeout)
+        except TimeoutExpired:
+            pass
+        self.terminate(timeout)
+
+    def terminate(self, timeout: float = 10):
+        """请求hashcat的进程组退出（会写入还原点），超时后强制结束并回收进程"""
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is not None:
+                return
+            self._signal_group(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=timeout)
+            except TimeoutExpired:
+                self._signal_group()
+                self.process.wait()
+        finally:
+            _live_runs.discard(self)
+            self._record_end()
+
+    def output(self) -> str:
+        """最近的输出，用于写入日志"""
+        return '\n'.join(self.tail)
+
+
+class AsyncHashcatRun(HashcatRun):
+    """HashcatRun的asyncio版本：用 asyncio.create_subprocess_exec 启动hashcat，事件以异步迭代器提供
+
+    用法::
+
+        run = AsyncHashcatRun(cmd, out_file, hash_strs, cwd, timeout=3600)
+        try:
+            async for event in run.events():
+                ...
+        finally:
+            await run.terminate()
+
+    同一个事件循环中可以同时运行多个hashcat，不占用线程。stop()是同步的，可以从其他线程调用：
+    它立即给进程组发送SIGTERM，events()在进程退出后结束，超过kill_after秒仍未退出时强制结束。
+    输出行的解析和事件的生成与HashcatRun共用，这里只有读取输出的部分不同。
+    """
+
+    kill_after = 10
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stop_requested_at = None
+        self._pumps = []
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd, stdout=PIPE, stderr=PIPE, cwd=self.cwd, limit=LINE_LIMIT,
+            **{**process_group_kwargs(), **self.popen_kwargs})
+        self._record_start()
+        self._events = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._pumps = [asyncio.ensure_future(self._pump(stream, is_error))
+                       for stream, is_error in ((self.process.stdout, False), (self.process.stderr, True))]
+        return self
+
+    async def _pump(self, stream, is_error):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                continue  # 超过LINE_LIMIT的行已被丢弃
+            if not line:
+                break
+            await self._events.put((is_error, line.decode('utf-8', errors='replace').rstrip('\r\n')))
+        await self._events.put((is_error, None))
+
+    async def events(self, poll_interval: float = 0.5) -> AsyncIterator[Event]:
+        """按顺序产生事件，最后一个事件总是FinishedEvent"""
+        if self.process is None:
+            await self.start()
+        open_streams = 2
+        self._last_check = time.monotonic()
+        while open_streams:
+            try:
+                is_error, line = await asyncio.wait_for(self._events.get(), poll_interval)
+            except asyncio.TimeoutError:
+                is_error, line = False, ''
+            if line is None:
+                open_streams -= 1
+                continue
+            for event in self._handle_line(is_error, line, poll_interval):
+                yield event
+        for event in self._finish(await self.process.wait()):
+            yield event
+
+    def _check_stop(self):
+        super()._check_stop()
+        if self._stop_requested_at is not None and time.monotonic() - self._stop_requested_at >= self.kill_after:
+            self._signal_group()
+
+    def stop(self, reason: str = STOP_CANCELLED, timeout: float = None):
+        """记录原因并给进程组发送SIGTERM，不等待退出"""
+        with self._lock:
+            if self.stop_reason is not None or self.process is None or self.process.returncode is not None:
+                return
+            self.stop_reason = reason
+            self._stop_requested_at = time.monotonic()
+        self._signal_group(signal.SIGTERM)
+
+    async def interrupt(self, timeout: float = 10):
+        """像终端Ctrl-C一样给进程组发送SIGINT，等hashcat写入还原点后退出；timeout秒后仍未退出时才terminate()"""
+        if self.process is None or self.process.returncode is not None:
+            return
+        self._signal_group(signal.SIGINT)
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        await self.terminate(timeout)
+
+    async def terminate(self, timeout: float = 10):
+        """请求hashcat的进程组退出（会写入还原点），超时后强制结束并回收进程"""
+        if self.process is None:
+            return
+        try:
+            if self.process.returncode is not None:
+                return
+            self._signal_group(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(self.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                self._signal_group()
+                await self.process.wait()
+        finally:
+            _live_runs.discard(self)
+            self._record_end()
+
+    def terminate_at_exit(self):
+        # 解释器退出时事件循环已经停止，只能直接结束进程组
+        if self.process is not None and self.process.returncode is None:
+            self._signal_group()
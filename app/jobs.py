@@ -0,0 +1,488 @@
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import Config
+from dictionary import write_wordlist
+from hashcat_driver import OutfileReader, STATUS_ARGS, password_bytes
+from planner import DictAttack, describe_attack, mask_prefix, read_mask_file
+
+# 任务状态
+STATUS_PENDING = 'pending'
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_INTERRUPTED = 'interrupted'
+STATUS_FINISHED = 'finished'
+STATUS_FAILED = 'failed'
+STATUS_ABANDONED = 'abandoned'
+TERMINAL_STATUSES = (STATUS_FINISHED, STATUS_FAILED, STATUS_ABANDONED)
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+STATUS_LABELS = {
+    STATUS_PENDING: '创建中',
+    STATUS_QUEUED: '排队中',
+    STATUS_RUNNING: '破解中',
+    STATUS_INTERRUPTED: '已中断',
+    STATUS_FINISHED: '已完成',
+    STATUS_FAILED: '失败',
+    STATUS_ABANDONED: '已取消',
+}
+
+# 两个前端共用的hashcat选项
+HASHCAT_OPTIONS = [
+    '-w', '4',  # 工作负载配置文件
+    '--force',  # 忽略警告
+    '-O',  # 优化内核以减少内存使用
+]
+
+# 任务来源：命令行任务由CLI自己继续，网页任务由后台进程池执行
+ORIGIN_CLI = 'cli'
+ORIGIN_WEB = 'web'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    pdf_name TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    mask TEXT NOT NULL,
+    min_len INTEGER NOT NULL,
+    max_len INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER,
+    command TEXT,
+    sources TEXT,
+    password BLOB,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    origin TEXT NOT NULL DEFAULT 'cli',
+    progress REAL NOT NULL DEFAULT 0,
+    speed TEXT,
+    message TEXT,
+    attack TEXT,
+    timeout REAL,
+    runtime REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, origin, created_at);
+'''
+
+# 旧版本数据库缺少的列
+_MIGRATIONS = {
+    'origin': "ALTER TABLE jobs ADD COLUMN origin TEXT NOT NULL DEFAULT 'cli'",
+    'progress': 'ALTER TABLE jobs ADD COLUMN progress REAL NOT NULL DEFAULT 0',
+    'speed': 'ALTER TABLE jobs ADD COLUMN speed TEXT',
+    'message': 'ALTER TABLE jobs ADD COLUMN message TEXT',
+    'attack': 'ALTER TABLE jobs ADD COLUMN attack TEXT',
+    'timeout': 'ALTER TABLE jobs ADD COLUMN timeout REAL',
+    'runtime': 'ALTER TABLE jobs ADD COLUMN runtime REAL NOT NULL DEFAULT 0',
+}
+_COLUMNS = ('id, pdf_name, mode, mask, min_len, max_len, status, pid, command, sources, password, '
+            'created_at, updated_at, origin, progress, speed, message, attack, timeout, runtime')
+
+
+@dataclass
+class Job:
+    id: str
+    pdf_name: str
+    mode: str
+    mask: str
+    min_len: int
+    max_len: int
+    status: str = STATUS_RUNNING
+    pid: Optional[int] = None
+    command: List[str] = field(default_factory=list)
+    sources: List[dict] = field(default_factory=list)
+    password: Optional[bytes] = None  # 破解出的密码字节
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    origin: str = ORIGIN_CLI
+    progress: float = 0.0
+    speed: Optional[str] = None
+    message: Optional[str] = None
+    attack: dict = field(default_factory=dict)  # 字典攻击的参数，掩码攻击为空
+    timeout: Optional[float] = None  # 墙钟时间预算（秒），None表示不限
+    runtime: float = 0.0  # 已经运行的秒数，中断后继续时累计
+
+    @property
+    def session(self) -> str:
+        """hashcat会话名"""
+        return f'pdfjoker_{self.id}'
+
+    @property
+    def job_dir(self) -> Path:
+        return Config.JOBS_DIR / self.id
+
+    @property
+    def hash_file(self) -> Path:
+        return self.job_dir / 'hashes.txt'
+
+    @property
+    def out_file(self) -> Path:
+        return self.job_dir / 'cracked.txt'
+
+    @property
+    def restore_file(self) -> Path:
+        return self.job_dir / f'{self.session}.restore'
+
+    @property
+    def candidates_file(self) -> Path:
+        """内存候选（如元数据候选）写入的字典"""
+        return self.job_dir / 'candidates.txt'
+
+    @property
+    def shards_file(self) -> Path:
+        """分片破解的块划分和已完成的块"""
+        return self.job_dir / 'shards.json'
+
+    @property
+    def shards_dir(self) -> Path:
+        """分片破解各块的outfile"""
+        return self.job_dir / 'shards'
+
+    def time_left(self) -> Optional[float]:
+        """剩余的时间预算（秒），不限时返回None"""
+        if self.timeout is None:
+            return None
+        return max(0.0, self.timeout - self.runtime)
+
+    def hashes(self) -> List[str]:
+        with open(self.hash_file, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def attack_args(self) -> List[str]:
+        """新任务的hashcat参数（不含可执行文件和设备等前端选项）"""
+        return [
+            '--session', self.session,
+            '--restore-file-path', str(self.restore_file),
+            '-m', self.mode,
+            *self.attack_mode_args(),
+            '--potfile-disable',
+            '--outfile', str(self.out_file),
+            '--outfile-format', '1,2',  # 输出 哈希:密码
+            *STATUS_ARGS,
+        ]
+
+    def build_command(self, devices=None) -> List[str]:
+        """新任务的完整hashcat命令；devices为 -d 的设备列表，默认取 Config.HASHCAT_DEVICES"""
+        devices = Config.HASHCAT_DEVICES if devices is None else devices
+        return [
+            str(Config.HASHCAT_BIN),
+            *(['-d', devices] if devices else []),
+            *self.attack_args(),
+            *HASHCAT_OPTIONS,
+        ]
+
+    def attack_mode_args(self, length=None, path=str, hash_file=True) -> List[str]:
+        """攻击方式参数；给出length时只攻击该长度的掩码（分片时使用，--skip/--limit 不支持 --increment）
+
+        掩码文件同样不支持 --skip/--limit，分片时length是文件中掩码的序号。
+        path把本机路径换成工作节点上的路径，hash_file为False时省略哈希文件（用于 --keyspace）。
+        """
+        hashes = [path(self.hash_file)] if hash_file else []
+        attack_mode = self.attack.get('attack_mode')
+        markov = ['--markov-hcstat2', path(Config.MARKOV_HCSTAT2)] if Config.MARKOV_HCSTAT2 else []
+        if attack_mode is None and length is not None:
+            return ['-a', '3', *markov, *hashes, mask_prefix(self.mask, length)]
+        if attack_mode is None:
+            return [
+                '-a', '3',
+                '--increment',
+                '--increment-min', str(self.min_len),
+                '--increment-max', str(self.max_len),
+                *markov,
+                *hashes,
+                self.mask,
+            ]
+        if attack_mode == 3 and length is not None:
+            mask = self.mask_file_masks()[length]
+            charsets = [arg for i, charset in enumerate(mask.custom_charsets, 1) for arg in (f'-{i}', charset)]
+            return ['-a', '3', *markov, *charsets, *hashes, mask.mask]
+        wordlist = path(self.attack['wordlist'])
+        if attack_mode == 3:
+            return ['-a', '3', *markov, *hashes, wordlist]
+        if attack_mode == 6:
+            return ['-a', '6', *markov, *hashes, wordlist, self.mask]
+        if attack_mode == 7:
+            return ['-a', '7', *markov, *hashes, self.mask, wordlist]
+        args = ['-a', '0', *hashes, wordlist]
+        for rules in self.attack.get('rules', []):
+            args.extend(['-r', path(rules)])
+        return args
+
+    def mask_file_masks(self):
+        """掩码文件任务中按顺序排列的掩码"""
+        return read_mask_file(self.attack['wordlist'])
+
+    def input_files(self) -> List[str]:
+        """hashcat需要读取的文件：哈希文件、字典、规则文件和Markov统计表"""
+        files = [str(self.hash_file)]
+        if self.attack:
+            files.append(self.attack['wordlist'])
+            files.extend(self.attack.get('rules', []))
+        if Config.MARKOV_HCSTAT2 and self.attack.get('attack_mode') != 0:
+            files.append(Config.MARKOV_HCSTAT2)
+        return files
+
+    def exhausted_message(self) -> str:
+        """候选全部试完仍未破解时的说明"""
+        if self.attack.get('attack_mode') == 3:
+            return '密码不在掩码文件的掩码中'
+        return '密码不在当前字典中' if self.attack else '密码不在当前掩码和长度范围内'
+
+    def describe(self) -> str:
+        """攻击方式的简短说明"""
+        if not self.attack:
+            return f'{self.mask} (长度 {self.min_len}-{self.max_len})'
+        return describe_attack(DictAttack(
+            wordlist=self.attack['wordlist'], rules=tuple(self.attack.get('rules', [])),
+            attack_mode=self.attack['attack_mode'], mask=self.mask, label=self.attack.get('label', ''),
+        ))
+
+    def resume_command(self) -> List[str]:
+        """从hashcat还原点继续；还没有还原点时重新执行原命令"""
+        if self.restore_file.exists():
+            return [
+                str(Config.HASHCAT_BIN),
+                '--session', self.session,
+                '--restore',
+                '--restore-file-path', str(self.restore_file),
+            ]
+        return list(self.command)
+
+
+def read_outfile(out_path, hash_strs) -> Dict[str, bytes]:
+    """解析hashcat的outfile，把恢复的密码（字节）映射回原始哈希"""
+    reader = OutfileReader(out_path, hash_strs)
+    reader.read_new(final=True)
+    return reader.recovered
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """持久化的破解任务记录，支持中断后从hashcat还原点继续"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.JOBS_DB
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, statement in _MIGRATIONS.items():
+                if existing and column not in existing:
+                    conn.execute(statement)
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        return Job(
+            id=row[0], pdf_name=row[1], mode=row[2], mask=row[3],
+            min_len=row[4], max_len=row[5], status=row[6], pid=row[7],
+            command=json.loads(row[8] or '[]'), sources=json.loads(row[9] or '[]'),
+            password=password_bytes(row[10]), created_at=row[11], updated_at=row[12],
+            origin=row[13], progress=row[14], speed=row[15], message=row[16],
+            attack=json.loads(row[17] or '{}'), timeout=row[18], runtime=row[19],
+        )
+
+    def create(self, pdf_name, hash_strs, mode, mask, min_len, max_len, sources=None,
+               origin=ORIGIN_CLI, status=STATUS_RUNNING, attack=None, timeout=None) -> Job:
+        """创建任务目录并写入哈希文件；timeout是任务的墙钟时间预算（秒）"""
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex[:12], pdf_name=pdf_name, mode=mode, mask=mask,
+            min_len=min_len, max_len=max_len, status=status, sources=sources or [],
+            created_at=now, updated_at=now, origin=origin,
+            pid=os.getpid() if status == STATUS_RUNNING else None,
+            attack=attack or {}, timeout=timeout,
+        )
+        job.job_dir.mkdir(parents=True, exist_ok=True)
+        with open(job.hash_file, 'w') as f:
+            f.write('\n'.join(hash_strs) + '\n')
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f'INSERT INTO jobs ({_COLUMNS}) VALUES ({", ".join("?" * 20)})',
+                (job.id, job.pdf_name, job.mode, job.mask, job.min_len, job.max_len,
+                 job.status, job.pid, json.dumps(job.command), json.dumps(job.sources),
+                 job.password, job.created_at, job.updated_at, job.origin,
+                 job.progress, job.speed, job.message, json.dumps(job.attack), job.timeout, job.runtime)
+            )
+        return job
+
+    def create_for_attack(self, pdf_name, hash_strs, mode, attack, **kwargs) -> Job:
+        """按攻击计划中的一个攻击创建任务；内存候选写入任务目录下的字典"""
+        if not isinstance(attack, DictAttack):
+            return self.create(pdf_name, hash_strs, mode, attack.mask, attack.min_len, attack.max_len, **kwargs)
+        params = {
+            'attack_mode': attack.attack_mode,
+            'wordlist': str(attack.wordlist),
+            'rules': [str(rules) for rules in attack.rules],
+            'label': attack.label,
+        }
+        job = self.create(pdf_name, hash_strs, mode, attack.mask, 0, 0, attack=params, **kwargs)
+        if attack.words:
+            write_wordlist(job.candidates_file, attack.words)
+            self.update(job, attack={**params, 'wordlist': str(job.candidates_file)})
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(f'SELECT {_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def update(self, job: Job, **fields):
+        """更新任务字段并同步到数据库"""
+        fields['updated_at'] = time.time()
+        for key, value in fields.items():
+            setattr(job, key, value)
+        columns = ', '.join(f'{key} = ?' for key in fields)
+        values = [json.dumps(v) if key in ('command', 'sources', 'attack') else v for key, v in fields.items()]
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*values, job.id))
+
+    def list(self, statuses=None, origin=None, limit=None, newest_first=False) -> List[Job]:
+        conditions, params = [], []
+        if statuses:
+            conditions.append(f'status IN ({", ".join("?" * len(statuses))})')
+            params.extend(statuses)
+        if origin:
+            conditions.append('origin = ?')
+            params.append(origin)
+        query = f'SELECT {_COLUMNS} FROM jobs'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at' + (' DESC' if newest_first else '')
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def interrupted(self, origin=None) -> List[Job]:
+        """可以继续的任务：已标记中断，或标记运行中但进程已不存在"""
+        jobs = []
+        for job in self.list((STATUS_RUNNING, STATUS_INTERRUPTED), origin):
+            if job.status == STATUS_RUNNING and _pid_alive(job.pid):
+                continue
+            if job.status == STATUS_RUNNING:
+                self.update(job, status=STATUS_INTERRUPTED, pid=None)
+            jobs.append(job)
+        return jobs
+
+    def claim(self, origin=ORIGIN_WEB) -> Optional[Job]:
+        """原子地取出最早排队的任务并标记为运行中"""
+        conn = self._connect()
+        conn.isolation_level = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                f'SELECT {_COLUMNS} FROM jobs WHERE status = ? AND origin = ? ORDER BY created_at LIMIT 1',
+                (STATUS_QUEUED, origin)
+            ).fetchone()
+            if row:
+                # 在hashcat启动前先记录当前进程，避免被误判为中断
+                conn.execute(
+                    'UPDATE jobs SET status = ?, pid = ?, updated_at = ? WHERE id = ?',
+                    (STATUS_RUNNING, os.getpid(), time.time(), row[0])
+                )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = self._row_to_job(row)
+        job.status, job.pid = STATUS_RUNNING, os.getpid()
+        return job
+
+    def requeue_interrupted(self, origin=ORIGIN_WEB) -> int:
+        """把中断的任务重新排队，由后台进程池从还原点继续"""
+        jobs = self.interrupted(origin)
+        for job in jobs:
+            self.update(job, status=STATUS_QUEUED, pid=None)
+        return len(jobs)
+
+    def requeue(self, job_id: str) -> bool:
+        """把一个中断的任务重新排队，由后台进程池从还原点继续；任务不存在、仍在运行或已结束时返回False"""
+        job = self.get(job_id)
+        if job is None or job.status not in (STATUS_RUNNING, STATUS_INTERRUPTED):
+            return False
+        if job.status == STATUS_RUNNING and _pid_alive(job.pid):
+            return False
+        with closing(self._connect()) as conn, conn:
+            # 只在状态未被其他进程改变时更新，同一个任务不会被重复排队
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, pid = NULL, updated_at = ? WHERE id = ? AND status = ?',
+                (STATUS_QUEUED, time.time(), job_id, job.status)
+            )
+        return cursor.rowcount == 1
+
+    def queue_position(self, job: Job) -> int:
+        """排在该任务前面的任务数"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                'SELECT COUNT(*) FROM jobs WHERE status = ? AND origin = ? AND created_at < ?',
+                (STATUS_QUEUED, job.origin, job.created_at)
+            ).fetchone()[0]
+
+    def abandon(self, job: Job):
+        self.update(job, status=STATUS_ABANDONED, pid=None)
+        self.remove_files(job)
+
+    def remove_session_files(self, job: Job):
+        """删除哈希、还原点、分片记录和hashcat会话文件，保留任务的源文件"""
+        for path in (job.hash_file, job.out_file, job.restore_file, job.shards_file):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        shutil.rmtree(job.shards_dir, ignore_errors=True)
+        # 分片的每个块使用 会话名_块号 作为会话名
+        for pattern in (f'{job.session}.*', f'{job.session}_*'):
+            for path in Config.HASHCAT_DIR.glob(pattern):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def remove_files(self, job: Job):
+        """删除任务目录和hashcat在自身目录下留下的会话文件"""
+        self.remove_session_files(job)
+        shutil.rmtree(job.job_dir, ignore_errors=True)
+
+    def gc(self, max_age=None):
+        """回收已结束任务的文件，超过保留期的中断任务视为放弃"""
+        max_age = Config.JOB_RETENTION if max_age is None else max_age
+        cutoff = time.time() - max_age
+        for job in self.interrupted():
+            if job.updated_at < cutoff:
+                self.abandon(job)
+        for job in self.list(TERMINAL_STATUSES):
+            if job.updated_at >= cutoff:
+                # 网页任务的源文件保留到过期，供下载解密结果
+                self.remove_session_files(job)
+                continue
+            self.remove_files(job)
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM jobs WHERE id = ?', (job.id,))
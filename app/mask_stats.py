@@ -0,0 +1,283 @@
+import argparse
+import lzma
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from config import Config
+from dictionary import iter_words
+from planner import MaskAttack, SpeedTable, format_duration, format_hcmask, mask_positions, parse_duration
+from result_cache import ResultCache
+
+# 每个字节的字符类别，对应hashcat内置字符集 ?l ?u ?d ?s；控制字符和非ASCII字节为 ?b
+_CLASS_TABLE = bytes(
+    ord('l') if 97 <= b <= 122 else
+    ord('u') if 65 <= b <= 90 else
+    ord('d') if 48 <= b <= 57 else
+    ord('s') if 32 <= b <= 126 else
+    ord('b')
+    for b in range(256)
+)
+
+# 前后缀按类别的连续片段切分，字母不分大小写（如 Admin2023! -> Admin、2023、!）
+_TOKEN = re.compile(rb'[lu]+|d+|s+|b+')
+
+# 本部署已破解的密码来自真实文件，统计时的权重高于语料中的一行
+RECOVERED_WEIGHT = 10
+
+# 出现次数少于这个值的掩码不输出
+MIN_COUNT = 2
+
+# 前后缀的最大长度；更长的片段多半是整个单词，交给字典攻击更合适
+MAX_AFFIX = 8
+
+# hcstat2的LZMA2参数，与 xz --format=raw -9e 相同
+_HCSTAT2_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 9 | lzma.PRESET_EXTREME}]
+
+
+class MaskStats:
+    """密码长度、字符类别结构和常见前后缀的统计，计数按样本权重累加"""
+
+    def __init__(self):
+        self.total = 0
+        self.skipped = 0  # 空行和超过 Config.MASK_STATS_MAX_LENGTH 的行
+        self.lengths = Counter()
+        self.structures = Counter()  # 类别结构，如 b'ullllldddds'
+        self.prefixes = Counter()    # (前缀, 其余部分的类别结构)
+        self.suffixes = Counter()    # (其余部分的类别结构, 后缀)
+
+    def add(self, password: bytes, weight: int = 1):
+        if not password or len(password) > Config.MASK_STATS_MAX_LENGTH:
+            self.skipped += weight
+            return
+        classes = password.translate(_CLASS_TABLE)
+        self.total += weight
+        self.lengths[len(password)] += weight
+        self.structures[classes] += weight
+        first = _TOKEN.match(classes).end()
+        if first == len(classes):
+            return
+        # 反转后匹配开头即最后一个片段，避免从每个位置向后搜索
+        last = len(classes) - _TOKEN.match(classes[::-1]).end()
+        if first <= MAX_AFFIX and b'b' not in classes[:first]:
+            self.prefixes[(password[:first], classes[first:])] += weight
+        if len(classes) - last <= MAX_AFFIX and b'b' not in classes[last:]:
+            self.suffixes[(classes[:last], password[last:])] += weight
+
+    def update(self, passwords: Iterable[bytes], weight: int = 1):
+        for password in passwords:
+            self.add(password, weight)
+
+
+class RankedMask(NamedTuple):
+    attack: MaskAttack
+    count: int        # 匹配的样本数（加权）
+    keyspace: int
+    structure: bytes  # 所属的类别结构，前后缀掩码是其中的一部分
+
+    @property
+    def density(self) -> float:
+        """每个候选命中样本的概率"""
+        return self.count / self.keyspace
+
+
+def _class_mask(classes: bytes) -> str:
+    return ''.join(f'?{chr(c)}' for c in classes)
+
+
+def _literal(text: bytes) -> str:
+    return text.decode('ascii').replace('?', '??')
+
+
+def rank_masks(stats: MaskStats, min_count: int = MIN_COUNT, max_masks: Optional[int] = None,
+               max_keyspace: Optional[int] = None) -> List[RankedMask]:
+    """按 匹配样本数 / 密钥空间 从高到低排列掩码，每个候选命中概率最高的掩码在前
+
+    带前后缀的掩码是对应类别结构的一部分，hashcat会重复尝试这部分候选，换来常见前后缀更早命中。
+    给出max_keyspace时跳过会使累计密钥空间超出的掩码。
+    """
+    max_masks = Config.MASK_STATS_MAX_MASKS if max_masks is None else max_masks
+    candidates = {}  # 掩码 -> [样本数, 类别结构]
+    affixes = [
+        *((_class_mask(classes), classes, count) for classes, count in stats.structures.items()),
+        *((_literal(prefix) + _class_mask(rest), prefix.translate(_CLASS_TABLE) + rest, count)
+          for (prefix, rest), count in stats.prefixes.items()),
+        *((_class_mask(rest) + _literal(suffix), rest + suffix.translate(_CLASS_TABLE), count)
+          for (rest, suffix), count in stats.suffixes.items()),
+    ]
+    for mask, structure, count in affixes:
+        entry = candidates.setdefault(mask, [0, structure])
+        entry[0] += count
+    ranked = []
+    for mask, (count, structure) in candidates.items():
+        if count < min_count:
+            continue
+        positions = mask_positions(mask)
+        space = 1
+        for size in positions:
+            space *= size
+        ranked.append(RankedMask(MaskAttack(mask, len(positions), len(positions)), count, space, structure))
+    ranked.sort(key=lambda r: (-r.density, -r.count, r.attack.mask))
+    selected, total = [], 0
+    for mask in ranked:
+        if len(selected) >= max_masks:
+            break
+        if max_keyspace is not None and total + mask.keyspace > max_keyspace:
+            continue
+        selected.append(mask)
+        total += mask.keyspace
+    return selected
+
+
+def coverage(stats: MaskStats, ranked: List[RankedMask]) -> List[Tuple[int, int]]:
+    """依次加入每个掩码后的 (累计密钥空间, 约可命中的样本数)
+
+    前后缀掩码按所属结构的样本数封顶，同一密码同时匹配前缀和后缀掩码时会多算，所以是上限。
+    """
+    covered = Counter()
+    full = set()
+    points, space = [], 0
+    for mask in ranked:
+        space += mask.keyspace
+        if mask.attack.mask == _class_mask(mask.structure):
+            full.add(mask.structure)
+        else:
+            covered[mask.structure] += mask.count
+        total = sum(min(count, stats.structures[structure]) for structure, count in covered.items()
+                    if structure not in full)
+        total += sum(stats.structures[structure] for structure in full)
+        points.append((space, total))
+    return points
+
+
+def samples(corpus: Iterable = (), recovered: bool = True,
+            recovered_weight: int = RECOVERED_WEIGHT) -> Iterator[Tuple[bytes, int]]:
+    """统计用的样本 (密码字节, 权重)：结果缓存中已破解的密码和语料文件的每一行"""
+    if recovered:
+        for password in ResultCache().passwords():
+            yield password, recovered_weight
+    for path in corpus:
+        for line in iter_words(path):
+            yield line, 1
+
+
+def analyze(corpus: Iterable = (), recovered: bool = True, recovered_weight: int = RECOVERED_WEIGHT) -> MaskStats:
+    stats = MaskStats()
+    for password, weight in samples(corpus, recovered, recovered_weight):
+        stats.add(password, weight)
+    return stats
+
+
+def write_mask_file(path, ranked: List[RankedMask]) -> int:
+    """按顺序写出.hcmask文件，hashcat -a 3 依次尝试其中的掩码"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.tmp')
+    with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+        for mask in ranked:
+            f.write(format_hcmask(mask.attack) + '\n')
+    os.replace(tmp, path)
+    return len(ranked)
+
+
+def write_hcstat2(path, corpus: Iterable = (), recovered: bool = True, recovered_weight: int = RECOVERED_WEIGHT):
+    """用hashcat-utils的hcstat2gen统计各位置的字符频率和转移，压缩为hashcat读取的LZMA2格式
+
+    样本通过标准输入流式传给hcstat2gen，权重按重复行数体现。
+    """
+    hcstat2gen = shutil.which(Config.HCSTAT2GEN)
+    if hcstat2gen is None:
+        raise FileNotFoundError(f'找不到hashcat-utils中的hcstat2gen，请用 PDFJOKER_HCSTAT2GEN 指定：{Config.HCSTAT2GEN}')
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        raw = os.path.join(tmp, 'raw.hcstat2')
+        with open(os.path.join(tmp, 'stderr'), 'w+b') as stderr:
+            process = subprocess.Popen([hcstat2gen, raw], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                       stderr=stderr)
+            try:
+                for password, weight in samples(corpus, recovered, recovered_weight):
+                    if password and len(password) <= Config.MASK_STATS_MAX_LENGTH:
+                        process.stdin.write((password + b'\n') * weight)
+            except BrokenPipeError:
+                pass  # hcstat2gen提前退出，下面按退出码报告
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                process.wait()
+            if process.returncode != 0:
+                stderr.seek(0)
+                error = stderr.read().decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f'hcstat2gen失败：{error or f"退出码 {process.returncode}"}')
+        compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=_HCSTAT2_FILTERS)
+        out = path.with_name(f'{path.name}.tmp')
+        with open(raw, 'rb') as src, open(out, 'wb') as dst:
+            while chunk := src.read(1024 * 1024):
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+        os.replace(out, path)
+
+
+def describe(stats: MaskStats, ranked: List[RankedMask], top: int = 10) -> str:
+    """统计摘要：样本数、常见长度、排在最前的掩码和密钥空间的覆盖情况"""
+    lines = [f'样本 {stats.total:,} 个（跳过 {stats.skipped:,} 个），生成 {len(ranked)} 个掩码']
+    if not stats.total or not ranked:
+        return '\n'.join(lines)
+    lengths = '，'.join(f'{length}位 {count / stats.total:.0%}' for length, count in stats.lengths.most_common(5))
+    lines.append(f'常见长度: {lengths}')
+    for mask in ranked[:top]:
+        lines.append(f'  {mask.attack.mask}  样本 {mask.count:,}，密钥空间 {mask.keyspace:,}')
+    points = coverage(stats, ranked)
+    total_space = points[-1][0]
+    for share in (0.01, 0.05, 0.25, 1.0):
+        covered = max((hit for space, hit in points if space <= total_space * share), default=0)
+        lines.append(f'前 {share:.0%} 的密钥空间约命中 {min(covered / stats.total, 1):.0%} 的样本')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从已破解的密码和语料统计密码规律，生成按可能性排序的掩码文件')
+    parser.add_argument('corpus', nargs='*', help='语料文件（每行一个密码，支持 .gz）')
+    parser.add_argument('-o', '--output', default=str(Config.MASK_DIR / 'learned.hcmask'),
+                        help='输出的.hcmask文件（默认在掩码目录中，网页端可以直接选择）')
+    parser.add_argument('--no-recovered', action='store_true', help='不使用结果缓存中已破解的密码')
+    parser.add_argument('--recovered-weight', type=int, default=RECOVERED_WEIGHT,
+                        help='每个已破解的密码相当于语料中的行数')
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT, help='掩码至少匹配的样本数')
+    parser.add_argument('--max-masks', type=int, default=Config.MASK_STATS_MAX_MASKS, help='最多输出的掩码数')
+    parser.add_argument('--budget', help='时间预算，如 2h、7d；给出时按实测速度截断掩码列表')
+    parser.add_argument('--hash-mode', default='10500', help='按预算截断时使用哪个hashcat模式的速度')
+    parser.add_argument('--hcstat2', metavar='PATH',
+                        help='同时生成Markov统计表（需要hashcat-utils的hcstat2gen），用 PDFJOKER_MARKOV_HCSTAT2 启用')
+    args = parser.parse_args()
+
+    try:
+        budget = parse_duration(args.budget) if args.budget else None
+        max_keyspace = None if budget is None else int(budget * SpeedTable().get(args.hash_mode))
+        stats = analyze(args.corpus, not args.no_recovered, args.recovered_weight)
+        ranked = rank_masks(stats, args.min_count, args.max_masks, max_keyspace)
+        if not ranked:
+            raise ValueError('样本不足，没有掩码达到最少样本数')
+        write_mask_file(args.output, ranked)
+        print(describe(stats, ranked))
+        if budget is not None:
+            seconds = sum(mask.keyspace for mask in ranked) / SpeedTable().get(args.hash_mode)
+            print(f'模式 {args.hash_mode} 预计 {format_duration(seconds)}（预算 {format_duration(budget)}）')
+        print(f'✅ 掩码文件: {args.output}')
+        if args.hcstat2:
+            write_hcstat2(args.hcstat2, args.corpus, not args.no_recovered, args.recovered_weight)
+            print(f'✅ Markov统计表: {args.hcstat2}')
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f'❌ {str(e)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
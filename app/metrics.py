@@ -0,0 +1,225 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from config import Config
+
+# 指标名前缀
+PREFIX = 'pdfjoker'
+
+# 阶段耗时直方图的桶上限（秒），从毫秒级的哈希提取到数天的破解
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 4 * 3600, 86400, math.inf)
+
+# 各指标的说明，未列出的指标没有 HELP 行
+HELP = {
+    'phase_seconds': '各阶段耗时：triage 分诊、extract 哈希提取、quick_pass CPU快速验证、'
+                     'hashcat_startup hashcat启动和内核编译、crack 破解、decrypt 解密',
+    'files': '处理的文件数，按处理路径分类',
+    'cache_hits': '命中结果缓存、无需破解的文件数',
+    'cracked': '破解成功的文件数',
+    'failed': '失败的文件数（哈希生成失败、不支持的哈希或未找到密码）',
+    'hashcat_processes': '正在运行的hashcat进程数',
+    'hashcat_speed': '最近一次测得的hashcat速度（H/s），按模式、工作进程和设备分类',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+class Metrics:
+    """进程内的指标：计数器、仪表和阶段耗时直方图，可以从任何线程记录
+
+    render() 输出Prometheus文本格式，summary() 输出供命令行汇总的JSON结构。
+    """
+
+    def __init__(self):
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._phases: Dict[Labels, _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """计数器加value"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_gauge(self, name, delta, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, phase, seconds, **labels):
+        """记录一个阶段的耗时（秒）"""
+        key = _labels({'phase': phase, **labels})
+        with self._lock:
+            self._phases.setdefault(key, _Histogram()).observe(max(0.0, seconds))
+
+    @contextmanager
+    def timer(self, phase, **labels):
+        """记录with块的耗时，块内抛出异常时也记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start, **labels)
+
+    def render(self) -> str:
+        """Prometheus文本格式（0.0.4）"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            phases = {key: (list(h.buckets), h.count, h.sum) for key, h in self._phases.items()}
+        lines = []
+
+        def header(name, kind, suffix=''):
+            if name in HELP:
+                lines.append(f'# HELP {PREFIX}_{name}{suffix} {HELP[name]}')
+            lines.append(f'# TYPE {PREFIX}_{name}{suffix} {kind}')
+
+        if phases:
+            header('phase_seconds', 'histogram')
+            for labels, (buckets, count, total) in sorted(phases.items()):
+                for bound, value in zip(BUCKETS, buckets):
+                    lines.append(f'{PREFIX}_phase_seconds_bucket{_format_labels(labels, ("le", _format_value(bound)))} '
+                                 f'{value}')
+                lines.append(f'{PREFIX}_phase_seconds_sum{_format_labels(labels)} {_format_value(total)}')
+                lines.append(f'{PREFIX}_phase_seconds_count{_format_labels(labels)} {count}')
+        for series, kind, suffix in ((counters, 'counter', '_total'), (gauges, 'gauge', '')):
+            for name in sorted({name for name, _ in series}):
+                header(name, kind, suffix)
+                for (series_name, labels), value in sorted(series.items()):
+                    if series_name == name:
+                        lines.append(f'{PREFIX}_{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """各阶段的次数、总耗时、平均和最长耗时，以及计数器和仪表的当前值"""
+        with self._lock:
+            phases = {
+                _series_name(labels): {'count': h.count, 'seconds': round(h.sum, 3),
+                                       'mean': round(h.sum / h.count, 3), 'max': round(h.max, 3)}
+                for labels, h in self._phases.items()
+            }
+            counters = {_series_name(labels, name): value for (name, labels), value in sorted(self._counters.items())}
+            gauges = {_series_name(labels, name): value for (name, labels), value in sorted(self._gauges.items())}
+        return {'phases': dict(sorted(phases.items())), 'counters': counters, 'gauges': gauges}
+
+
+def _series_name(labels: Labels, name: Optional[str] = None) -> str:
+    """JSON汇总中的键：phase 标签作为名字，其余标签写在花括号中，如 crack{mode="10500"}"""
+    labels = dict(labels)
+    if name is None:
+        name = labels.pop('phase')
+    return name + _format_labels(_labels(labels))
+
+
+# 当前进程的指标；进程池子进程中的记录不会汇总回来，由父进程根据返回的耗时记录
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def inc(name, value=1, **labels):
+    _metrics.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    _metrics.set_gauge(name, value, **labels)
+
+
+def add_gauge(name, delta, **labels):
+    _metrics.add_gauge(name, delta, **labels)
+
+
+def observe(phase, seconds, **labels):
+    _metrics.observe(phase, seconds, **labels)
+
+
+def timer(phase, **labels):
+    return _metrics.timer(phase, **labels)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            body, content_type = _metrics.render(), 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/metrics.json':
+            body, content_type = json.dumps(_metrics.summary(), ensure_ascii=False), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # 抓取请求不写入日志
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_server(port=None, host=None) -> Optional[ThreadingHTTPServer]:
+    """在后台线程中提供 /metrics（Prometheus文本）和 /metrics.json，端口为0时不启动
+
+    每个进程只启动一次；端口被占用时抛出OSError。
+    """
+    global _server
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or Config.METRICS_HOST, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+    return _server
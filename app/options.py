@@ -0,0 +1,11 @@
+# 解密输出的可选项，命令行参数和网页侧栏直接使用，不需要加载pikepdf
+
+# 保存方式，对应 decrypt.SAVE_PROFILES 中的pikepdf保存参数
+DEFAULT_PROFILE = 'fast'
+PROFILE_LABELS = {'fast': '最快（保留原压缩）', 'compact': '最小（重新压缩）', 'web': '线性化（网页快速查看）'}
+
+# 解密时对水印的处理：保留、去掉、只报告会去掉的内容
+WATERMARKS_KEEP = 'keep'
+WATERMARKS_REMOVE = 'remove'
+WATERMARKS_REPORT = 'report'
+WATERMARK_ACTIONS = {WATERMARKS_KEEP: '保留水印', WATERMARKS_REMOVE: '去掉水印', WATERMARKS_REPORT: '只检测水印（预演）'}
@@ -1,18 +1,27 @@
 from io import BytesIO
 from typing import Optional, Union
-from pyhanko.pdf_utils.misc import PdfReadError
-from pyhanko.pdf_utils.reader import PdfFileReader
+from pdf_scan import ScanError, scan_pdf_hash
 
 
 def get_pdf_hash(pdf_file: Union[str, bytes]) -> Optional[str]:
     """Generate John the Ripper compatible hash from a PDF file.
 
+    The lightweight extractor in pdf_scan is tried first; files it cannot
+    handle are parsed with the full pyhanko reader.
+
     Args:
         pdf_file: Either a file path (str) or PDF file bytes
 
     Returns:
         String containing the hash in John format, or None if not encrypted
     """
+    try:
+        return scan_pdf_hash(pdf_file)
+    except (ScanError, OSError):
+        pass
+
+    # pyhanko only loads for files the scanner cannot handle
+    from pyhanko.pdf_utils.misc import PdfReadError
     try:
         if isinstance(pdf_file, str):
             with open(pdf_file, 'rb') as f:
@@ -26,6 +35,7 @@ def get_pdf_hash(pdf_file: Union[str, bytes]) -> Optional[str]:
 
 def _process_pdf(stream) -> Optional[str]:
     """Internal function to process PDF stream"""
+    from pyhanko.pdf_utils.reader import PdfFileReader
     pdf = PdfFileReader(stream)
     if not pdf.encrypt_dict:
         return None
@@ -0,0 +1,210 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import Config
+
+# 同时保持打开的日志文件数，超过时关闭最久未写入的文件
+MAX_OPEN_FILES = 64
+
+# 每批最多写入的记录数
+BATCH_SIZE = 1000
+
+
+class _Flush:
+    """写入线程处理到这里时通知等待方"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogWriter:
+    """后台日志写入线程：记录先进入队列，按批写入并按大小轮转，文件句柄复用
+
+    调用方只做一次不阻塞的入队，队列满时丢弃记录并在之后补记丢弃数量。
+    """
+
+    def __init__(self, max_bytes=None, backups=None, queue_size=None):
+        self.max_bytes = Config.LOG_MAX_BYTES if max_bytes is None else max_bytes
+        self.backups = Config.LOG_BACKUPS if backups is None else backups
+        self._queue = queue.Queue(Config.LOG_QUEUE_SIZE if queue_size is None else queue_size)
+        self._files = OrderedDict()  # 路径 -> (文件, 当前大小)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, path, record: dict):
+        """把一条记录放入队列，不等待磁盘写入"""
+        try:
+            self._queue.put_nowait((str(path), record))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+
+    def flush(self, timeout=5.0) -> bool:
+        """等待已入队的记录全部写入磁盘"""
+        marker = _Flush()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            # 写入期间到达的记录在下一批中一起写入
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._write_batch(batch)
+            if stop:
+                for handle, _ in self._files.values():
+                    handle.close()
+                self._files.clear()
+                return
+
+    def _write_batch(self, batch) -> bool:
+        lines = OrderedDict()  # 路径 -> [行]
+        markers = []
+        stop = False
+        for item in batch:
+            if item is None:
+                stop = True
+            elif isinstance(item, _Flush):
+                markers.append(item)
+            else:
+                path, record = item
+                lines.setdefault(path, []).append(self._format(record))
+        if self._dropped and lines:
+            with self._lock:
+                dropped, self._dropped = self._dropped, 0
+            path = next(iter(lines))
+            lines[path].append(self._format({'ts': time.time(), 'level': 'WARNING',
+                                             'msg': f'日志队列已满，丢弃了 {dropped} 条记录'}))
+        for path, entries in lines.items():
+            try:
+                self._append(path, ''.join(entries).encode('utf-8'))
+            except OSError:
+                pass
+        for marker in markers:
+            marker.done.set()
+        return stop
+
+    @staticmethod
+    def _format(record: dict) -> str:
+        record = dict(record)
+        record['ts'] = datetime.fromtimestamp(record['ts']).isoformat(timespec='milliseconds')
+        return json.dumps(record, ensure_ascii=False, default=str) + '\n'
+
+    def _open(self, path):
+        if path in self._files:
+            self._files.move_to_end(path)
+            return self._files[path]
+        if len(self._files) >= MAX_OPEN_FILES:
+            _, (handle, _) = self._files.popitem(last=False)
+            handle.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'ab')
+        self._files[path] = (handle, handle.tell())
+        return self._files[path]
+
+    def _append(self, path, data: bytes):
+        handle, size = self._open(path)
+        if size and self.max_bytes and size + len(data) > self.max_bytes:
+            handle.close()
+            del self._files[path]
+            self._rotate(path)
+            handle, size = self._open(path)
+        handle.write(data)
+        handle.flush()
+        self._files[path] = (handle, size + len(data))
+
+    def _rotate(self, path):
+        """app.log -> app.log.1 -> app.log.2 ...，超过保留数量的删除"""
+        if self.backups <= 0:
+            os.remove(path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{path}.{i}'):
+                os.replace(f'{path}.{i}', f'{path}.{i + 1}')
+        os.replace(path, f'{path}.1')
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> LogWriter:
+    """当前进程的日志写入线程（fork出的子进程会重新创建）"""
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                _writer = LogWriter()
+                _writer_pid = os.getpid()
+                atexit.register(_writer.close)
+    return _writer
+
+
+def _record(level, msg, fields):
+    return {'ts': time.time(), 'level': level, 'msg': msg, **{k: v for k, v in fields.items() if v is not None}}
+
+
+def log_info(msg, **fields):
+    """写入程序日志"""
+    get_writer().write(Config.APP_LOG, _record('INFO', msg, fields))
+
+
+def log_error(msg, **fields):
+    """写入程序日志和错误日志"""
+    record = _record('ERROR', msg, fields)
+    writer = get_writer()
+    writer.write(Config.APP_LOG, record)
+    writer.write(Config.ERROR_LOG, record)
+
+
+def log_command(cmd, output, **fields):
+    """记录执行的命令和输出"""
+    get_writer().write(Config.APP_LOG, _record('INFO', '执行命令', {**fields, 'cmd': cmd, 'output': output}))
+
+
+class PdfLogger:
+    """单个PDF（或任务）的日志，文件名由 Config.get_pdf_log_path 生成
+
+    每条记录是一行JSON，带上构造时给出的任务号、模式等字段，调用时可以再加 phase 等字段。
+    """
+
+    def __init__(self, pdf_name, **context):
+        self.log_file = Config.get_pdf_log_path(pdf_name)
+        self.context = {'pdf': pdf_name, **context}
+        self._writer = get_writer()
+        self.info(f'开始处理PDF文件: {pdf_name}')
+
+    def _write(self, level, msg, fields):
+        self._writer.write(self.log_file, _record(level, msg, {**self.context, **fields}))
+
+    def info(self, msg, **fields):
+        """记录普通日志"""
+        self._write('INFO', msg, fields)
+
+    def error(self, error_msg, **fields):
+        """记录错误日志"""
+        self._write('ERROR', error_msg, fields)
+
+    def command(self, cmd, output, **fields):
+        """记录命令和输出"""
+        self._write('INFO', '执行命令', {**fields, 'cmd': cmd, 'output': output})
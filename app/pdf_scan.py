@@ -0,0 +1,591 @@
+"""Lightweight extractor for the PDF trailer and encryption dictionary.
+
+Instead of building a full pyhanko reader, the file is memory-mapped and only
+the objects needed for the $pdf$ hash are parsed: ``startxref`` is located
+from the tail, the cross-reference chain (classic tables, xref streams,
+hybrid files and incremental updates via ``/Prev``) is followed, and just
+the trailer ``/ID`` and the ``/Encrypt`` dictionary are resolved.
+
+Anything unusual raises ScanError so callers can fall back to pyhanko.
+"""
+import mmap
+import os
+import re
+import zlib
+from typing import NamedTuple, Optional, Union
+
+# How far from the end of the file to look for startxref
+TAIL_SIZE = 4096
+
+_WHITESPACE = b' \t\r\n\f\x00'
+_DELIMITERS = b'()<>[]{}/%'
+_NUMBER_RE = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_REF_RE = re.compile(rb'\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])')
+_OBJ_RE = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+_NAME_RE = re.compile(rb'/[^\s()<>\[\]{}/%]*')
+_KEYWORD_RE = re.compile(rb'[A-Za-z]+')
+_ESCAPES = {
+    ord('n'): b'\n', ord('r'): b'\r', ord('t'): b'\t', ord('b'): b'\b',
+    ord('f'): b'\f', ord('('): b'(', ord(')'): b')', ord('\\'): b'\\',
+}
+
+
+class ScanError(Exception):
+    """The file cannot be handled by the lightweight extractor."""
+
+
+class Ref(NamedTuple):
+    num: int
+    gen: int
+
+
+class _Parser:
+    """Minimal PDF object parser working directly on a bytes-like buffer."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def skip_whitespace(self, pos: int) -> int:
+        data = self.data
+        size = len(data)
+        while pos < size:
+            char = data[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif char == ord('%'):
+                while pos < size and data[pos] not in b'\r\n':
+                    pos += 1
+            else:
+                break
+        return pos
+
+    def parse(self, pos: int):
+        """Parse one object at ``pos``, returning ``(value, end_position)``."""
+        data = self.data
+        pos = self.skip_whitespace(pos)
+        if pos >= len(data):
+            raise ScanError('unexpected end of data')
+        char = data[pos]
+        if char == ord('<'):
+            if data[pos + 1:pos + 2] == b'<':
+                return self._parse_dict(pos + 2)
+            return self._parse_hex_string(pos + 1)
+        if char == ord('('):
+            return self._parse_literal_string(pos + 1)
+        if char == ord('['):
+            return self._parse_array(pos + 1)
+        if char == ord('/'):
+            return self._parse_name(pos)
+        match = _NUMBER_RE.match(data, pos)
+        if match:
+            token = match.group()
+            if b'.' in token:
+                return float(token), match.end()
+            ref = _REF_RE.match(data, match.end())
+            if ref:
+                return Ref(int(token), int(ref.group(1))), ref.end()
+            return int(token), match.end()
+        match = _KEYWORD_RE.match(data, pos)
+        if match:
+            keyword = match.group()
+            if keyword == b'true':
+                return True, match.end()
+            if keyword == b'false':
+                return False, match.end()
+            if keyword == b'null':
+                return None, match.end()
+        raise ScanError(f'unexpected token at offset {pos}')
+
+    def _parse_dict(self, pos: int):
+        result = {}
+        while True:
+            pos = self.skip_whitespace(pos)
+            if self.data[pos:pos + 2] == b'>>':
+                return result, pos + 2
+            key, pos = self._parse_name(pos)
+            value, pos = self.parse(pos)
+            result[key] = value
+
+    def _parse_array(self, pos: int):
+        result = []
+        while True:
+            pos = self.skip_whitespace(pos)
+            if self.data[pos:pos + 1] == b']':
+                return result, pos + 1
+            value, pos = self.parse(pos)
+            result.append(value)
+
+    def _parse_name(self, pos: int):
+        match = _NAME_RE.match(self.data, pos)
+        if not match:
+            raise ScanError(f'expected a name at offset {pos}')
+        raw = match.group()
+        name = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), raw)
+        return name.decode('latin-1'), match.end()
+
+    def _parse_hex_string(self, pos: int):
+        end = self.data.find(b'>', pos)
+        if end < 0:
+            raise ScanError('unterminated hex string')
+        digits = bytes(c for c in self.data[pos:end] if c not in _WHITESPACE)
+        if len(digits) % 2:
+            digits += b'0'
+        try:
+            return bytes.fromhex(digits.decode('ascii')), end + 1
+        except ValueError as e:
+            raise ScanError(f'invalid hex string at offset {pos}') from e
+
+    def _parse_literal_string(self, pos: int):
+        data = self.data
+        size = len(data)
+        out = bytearray()
+        depth = 1
+        while pos < size:
+            char = data[pos]
+            pos += 1
+            if char == ord('\\'):
+                if pos >= size:
+                    break
+                char = data[pos]
+                pos += 1
+                if char in _ESCAPES:
+                    out += _ESCAPES[char]
+                elif ord('0') <= char <= ord('7'):
+                    digits = bytes([char])
+                    while len(digits) < 3 and pos < size and ord('0') <= data[pos] <= ord('7'):
+                        digits += bytes([data[pos]])
+                        pos += 1
+                    out.append(int(digits, 8) & 0xFF)
+                elif char == ord('\r'):
+                    # Line continuation, swallow an optional LF
+                    if pos < size and data[pos] == ord('\n'):
+                        pos += 1
+                elif char != ord('\n'):
+                    out.append(char)
+                continue
+            if char == ord('('):
+                depth += 1
+            elif char == ord(')'):
+                depth -= 1
+                if depth == 0:
+                    return bytes(out), pos
+            out.append(char)
+        raise ScanError('unterminated literal string')
+
+    def parse_indirect(self, pos: int, resolve_length=None):
+        """Parse ``N G obj ... [stream ... endstream]`` at ``pos``.
+
+        Returns ``(num, value, stream_bytes_or_None)``.
+        """
+        match = _OBJ_RE.match(self.data, pos)
+        if not match:
+            raise ScanError(f'no object header at offset {pos}')
+        value, pos = self.parse(match.end())
+        stream = None
+        if isinstance(value, dict):
+            after = self.skip_whitespace(pos)
+            if self.data[after:after + 6] == b'stream':
+                start = after + 6
+                if self.data[start:start + 2] == b'\r\n':
+                    start += 2
+                elif self.data[start:start + 1] in (b'\n', b'\r'):
+                    start += 1
+                length = value.get('/Length')
+                if isinstance(length, Ref):
+                    length = resolve_length(length) if resolve_length else None
+                if isinstance(length, int) and \
+                        self.data[start + length:start + length + 20].lstrip().startswith(b'endstream'):
+                    end = start + length
+                else:
+                    end = self.data.find(b'endstream', start)
+                    if end < 0:
+                        raise ScanError('unterminated stream')
+                    end = start + len(self.data[start:end].rstrip(b'\r\n'))
+                stream = self.data[start:end]
+        return int(match.group(1)), value, stream
+
+
+def _decode_stream(stream_dict: dict, raw: bytes) -> bytes:
+    filters = stream_dict.get('/Filter')
+    params = stream_dict.get('/DecodeParms')
+    if isinstance(filters, list):
+        if len(filters) > 1:
+            raise ScanError('chained stream filters are not supported')
+        filters = filters[0] if filters else None
+        params = params[0] if isinstance(params, list) and params else params
+    if filters is None:
+        data = bytes(raw)
+    elif filters == '/FlateDecode':
+        try:
+            data = zlib.decompressobj().decompress(raw)
+        except zlib.error as e:
+            raise ScanError(f'corrupt flate stream: {e}') from e
+    else:
+        raise ScanError(f'unsupported stream filter {filters}')
+
+    predictor = params.get('/Predictor', 1) if isinstance(params, dict) else 1
+    if predictor == 1:
+        return data
+    if predictor < 10:
+        raise ScanError(f'unsupported predictor {predictor}')
+    columns = params.get('/Columns', 1)
+    return _png_unpredict(data, columns)
+
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    row_size = columns + 1
+    previous = bytearray(columns)
+    out = bytearray()
+    for start in range(0, len(data) - len(data) % row_size, row_size):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + row_size])
+        if kind == 1:
+            for i in range(1, columns):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            for i in range(columns):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind == 3:
+            for i in range(columns):
+                left = row[i - 1] if i else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(columns):
+                left = row[i - 1] if i else 0
+                upper_left = previous[i - 1] if i else 0
+                estimate = left + previous[i] - upper_left
+                pa, pb, pc = abs(estimate - left), abs(estimate - previous[i]), abs(estimate - upper_left)
+                nearest = left if pa <= pb and pa <= pc else previous[i] if pb <= pc else upper_left
+                row[i] = (row[i] + nearest) & 0xFF
+        elif kind != 0:
+            raise ScanError(f'unsupported PNG predictor row type {kind}')
+        out += row
+        previous = row
+    return bytes(out)
+
+
+class _Document:
+    """Cross-reference chain and object resolution for one buffer."""
+
+    def __init__(self, data):
+        self.data = data
+        self.parser = _Parser(data)
+        self.offsets = {}  # object number -> offset or (object stream number, index)
+        self.trailer = {}
+        self._object_streams = {}
+        self._load_xref_chain()
+
+    def _load_xref_chain(self):
+        tail_start = max(0, len(self.data) - TAIL_SIZE)
+        index = self.data.rfind(b'startxref', tail_start)
+        if index < 0:
+            raise ScanError('startxref not found')
+        match = re.compile(rb'startxref\s+(\d+)').match(self.data, index)
+        if not match:
+            raise ScanError('malformed startxref')
+
+        offset = int(match.group(1))
+        visited = set()
+        while offset is not None:
+            if offset in visited or offset >= len(self.data):
+                raise ScanError(f'invalid xref offset {offset}')
+            visited.add(offset)
+            trailer = self._load_xref_section(offset)
+            # Sections are read newest first, so existing keys take precedence
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            if isinstance(trailer.get('/XRefStm'), int) and trailer['/XRefStm'] not in visited:
+                visited.add(trailer['/XRefStm'])
+                self._load_xref_stream(trailer['/XRefStm'])
+            offset = trailer.get('/Prev')
+            if offset is not None and not isinstance(offset, int):
+                raise ScanError('invalid /Prev entry')
+
+    def _load_xref_section(self, offset: int) -> dict:
+        pos = self.parser.skip_whitespace(offset)
+        if self.data[pos:pos + 4] == b'xref':
+            return self._load_xref_table(pos + 4)
+        return self._load_xref_stream(pos)
+
+    def _load_xref_table(self, pos: int) -> dict:
+        subsection = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*\r?\n?')
+        entry = re.compile(rb'\s*(\d{1,10})\s+(\d{1,5})\s+([nf])')
+        while True:
+            pos = self.parser.skip_whitespace(pos)
+            if self.data[pos:pos + 7] == b'trailer':
+                trailer, _ = self.parser.parse(pos + 7)
+                if not isinstance(trailer, dict):
+                    raise ScanError('malformed trailer')
+                return trailer
+            match = subsection.match(self.data, pos)
+            if not match:
+                raise ScanError(f'malformed xref table at offset {pos}')
+            first, count = int(match.group(1)), int(match.group(2))
+            pos = match.end()
+            for num in range(first, first + count):
+                row = entry.match(self.data, pos)
+                if not row:
+                    raise ScanError(f'malformed xref entry at offset {pos}')
+                pos = row.end()
+                if row.group(3) == b'n':
+                    self.offsets.setdefault(num, int(row.group(1)))
+                else:
+                    self.offsets.setdefault(num, None)
+
+    def _load_xref_stream(self, pos: int) -> dict:
+        _, stream_dict, raw = self.parser.parse_indirect(pos)
+        if raw is None or stream_dict.get('/Type') != '/XRef':
+            raise ScanError(f'no xref stream at offset {pos}')
+        data = _decode_stream(stream_dict, raw)
+        widths = stream_dict.get('/W')
+        if not isinstance(widths, list) or len(widths) != 3:
+            raise ScanError('invalid /W in xref stream')
+        index = stream_dict.get('/Index', [0, stream_dict.get('/Size', 0)])
+        row_size = sum(widths)
+        row = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for num in range(first, first + count):
+                start = row * row_size
+                row += 1
+                if start + row_size > len(data):
+                    raise ScanError('truncated xref stream')
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[start:start + width], 'big'))
+                    start += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.offsets.setdefault(num, fields[1])
+                elif kind == 2:
+                    self.offsets.setdefault(num, (fields[1], fields[2]))
+                else:
+                    self.offsets.setdefault(num, None)
+        return stream_dict
+
+    def resolve(self, value, depth: int = 0):
+        """Resolve indirect references, recursing into containers."""
+        if depth > 32:
+            raise ScanError('reference nesting too deep')
+        if isinstance(value, Ref):
+            return self.resolve(self._load_object(value.num), depth + 1)
+        if isinstance(value, dict):
+            return {k: self.resolve(v, depth + 1) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(v, depth + 1) for v in value]
+        return value
+
+    def resolve_stream(self, ref):
+        """Return ``(stream_dict, raw_bytes)`` for a stream stored at a file offset."""
+        location = self.offsets.get(ref.num) if isinstance(ref, Ref) else None
+        if not isinstance(location, int):
+            raise ScanError('stream is not stored at a file offset')
+        _, stream_dict, raw = self.parser.parse_indirect(location, self._resolve_length)
+        if raw is None:
+            raise ScanError(f'object {ref.num} is not a stream')
+        return stream_dict, raw
+
+    def _load_object(self, num: int):
+        location = self.offsets.get(num)
+        if location is None:
+            raise ScanError(f'object {num} not found')
+        if isinstance(location, tuple):
+            return self._load_from_object_stream(*location, num)
+        found, value, _ = self.parser.parse_indirect(location, self._resolve_length)
+        if found != num:
+            raise ScanError(f'expected object {num} at offset {location}, found {found}')
+        return value
+
+    def _resolve_length(self, ref: Ref):
+        location = self.offsets.get(ref.num)
+        if not isinstance(location, int):
+            return None
+        _, value, _ = self.parser.parse_indirect(location)
+        return value
+
+    def _load_from_object_stream(self, stream_num: int, index: int, num: int):
+        if stream_num not in self._object_streams:
+            location = self.offsets.get(stream_num)
+            if not isinstance(location, int):
+                raise ScanError(f'object stream {stream_num} not found')
+            _, stream_dict, raw = self.parser.parse_indirect(location, self._resolve_length)
+            if raw is None or stream_dict.get('/Type') != '/ObjStm':
+                raise ScanError(f'object {stream_num} is not an object stream')
+            data = _decode_stream(stream_dict, raw)
+            parser = _Parser(data)
+            header, pos = [], 0
+            for _ in range(2 * stream_dict.get('/N', 0)):
+                value, pos = parser.parse(pos)
+                header.append(value)
+            entries = {n: stream_dict.get('/First', 0) + off for n, off in zip(header[::2], header[1::2])}
+            self._object_streams[stream_num] = (parser, entries)
+        parser, entries = self._object_streams[stream_num]
+        if num not in entries:
+            raise ScanError(f'object {num} missing from object stream {stream_num}')
+        return parser.parse(entries[num])[0]
+
+
+def _open_buffer(pdf_file):
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ScanError('empty file')
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return pdf_file
+
+
+def scan_pdf_hash(pdf_file: Union[str, bytes, os.PathLike]) -> Optional[str]:
+    """Build the same $pdf$ hash as pdf2john without a full pyhanko reader.
+
+    Args:
+        pdf_file: Either a file path (memory-mapped) or PDF file bytes
+
+    Returns:
+        String containing the hash in John format, or None if not encrypted
+
+    Raises:
+        ScanError: The file needs the full pyhanko reader.
+    """
+    data = _open_buffer(pdf_file)
+    try:
+        return _scan(data)
+    except (IndexError, KeyError, TypeError, ValueError, RecursionError) as e:
+        raise ScanError(f'malformed PDF structure: {e}') from e
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def _scan(data) -> Optional[str]:
+    doc = _Document(data)
+    if doc.trailer.get('/Encrypt') is None:
+        return None
+
+    encrypt_dict = doc.resolve(doc.trailer['/Encrypt'])
+    if not isinstance(encrypt_dict, dict) or encrypt_dict.get('/Filter') != '/Standard':
+        raise ScanError('not a standard security handler')
+    document_id = doc.resolve(doc.trailer.get('/ID'))
+    if not isinstance(document_id, list) or not document_id or not isinstance(document_id[0], bytes):
+        raise ScanError('missing document /ID')
+
+    version = encrypt_dict.get('/V')
+    revision = encrypt_dict.get('/R')
+    perms = encrypt_dict.get('/P')
+    length = encrypt_dict.get('/Length', 40)
+    if not all(isinstance(v, int) for v in (version, revision, perms, length)):
+        raise ScanError('non-integer encryption parameters')
+
+    # Same component selection as pdf2john._process_pdf
+    max_len = {2: 32, 3: 32, 4: 32, 5: 48, 6: 48}.get(revision, 48)
+    keys = ('/U', '/O', '/OE', '/UE') if revision >= 5 else ('/U', '/O')
+    passwords = []
+    for key in keys:
+        value = encrypt_dict.get(key)
+        if key in ('/U', '/O') and not isinstance(value, bytes):
+            raise ScanError(f'missing {key} entry')
+        if isinstance(value, bytes) and value:
+            passwords.extend([str(len(value[:max_len])), value[:max_len].hex()])
+
+    encrypt_metadata = encrypt_dict.get('/EncryptMetadata', True)
+    return "*".join([
+        f"$pdf${version}",
+        str(revision),
+        str(length),
+        str(perms),
+        str(int(bool(encrypt_metadata))),
+        str(len(document_id[0])),
+        document_id[0].hex(),
+        "*".join(passwords)
+    ])
+
+
+INFO_KEYS = ('/Title', '/Author', '/Subject', '/Keywords', '/Creator', '/Producer',
+             '/CreationDate', '/ModDate')
+
+_XMP_FIELDS = {
+    'dc:title': '/Title', 'dc:creator': '/Author', 'dc:subject': '/Keywords',
+    'pdf:Keywords': '/Keywords', 'pdf:Producer': '/Producer', 'xmp:CreatorTool': '/Creator',
+    'xmp:CreateDate': '/CreationDate', 'xmp:ModifyDate': '/ModDate',
+}
+
+
+def _decode_text(value) -> Optional[str]:
+    """Decode a PDF text string, rejecting bytes that do not look like text.
+
+    Encrypted strings are random bytes and almost never survive strict UTF-16
+    or UTF-8 decoding followed by the printable check.
+    """
+    if not isinstance(value, bytes) or not value:
+        return None
+    try:
+        if value.startswith(b'\xfe\xff'):
+            text = value[2:].decode('utf-16-be')
+        else:
+            text = value.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    text = text.strip()
+    return text if text and text.isprintable() else None
+
+
+def _parse_xmp(xml: bytes) -> dict:
+    text = xml.decode('utf-8', errors='replace')
+    found = {}
+    for tag, key in _XMP_FIELDS.items():
+        # Element form, possibly wrapping an rdf:Alt/Seq/Bag of rdf:li items
+        match = re.search(rf'<{tag}\b[^>]*>(.*?)</{tag}>', text, re.S)
+        if match:
+            items = re.findall(r'<rdf:li\b[^>]*>(.*?)</rdf:li>', match.group(1), re.S) or [match.group(1)]
+            values = [re.sub(r'<[^>]+>', '', item).strip() for item in items]
+        else:
+            # Attribute form: <rdf:Description xmp:CreateDate="...">
+            values = re.findall(rf'\b{tag}="([^"]*)"', text)
+        values = [v for v in values if v]
+        if values and key not in found:
+            found[key] = ' '.join(values)
+    return found
+
+
+def scan_metadata(pdf_file: Union[str, bytes, os.PathLike]) -> dict:
+    """Collect document metadata that can be read without the password.
+
+    In an encrypted file the /Info strings are encrypted along with the rest of
+    the document unless the string crypt filter is /Identity, so only values
+    that decode to plausible text are kept. The XMP stream is used when it is
+    stored unencrypted (/EncryptMetadata false).
+
+    Args:
+        pdf_file: Either a file path (memory-mapped) or PDF file bytes
+
+    Returns:
+        Dict mapping /Info keys (see INFO_KEYS) to text
+
+    Raises:
+        ScanError: The file structure cannot be read by the lightweight parser.
+    """
+    data = _open_buffer(pdf_file)
+    try:
+        doc = _Document(data)
+        found = {}
+        # Only the catalog itself: resolving it fully would load the page tree
+        root = doc.trailer.get('/Root')
+        if isinstance(root, Ref):
+            root = doc._load_object(root.num)
+        metadata = root.get('/Metadata') if isinstance(root, dict) else None
+        if isinstance(metadata, Ref):
+            try:
+                stream_dict, raw = doc.resolve_stream(metadata)
+                found.update(_parse_xmp(_decode_stream(stream_dict, raw)))
+            except (ScanError, zlib.error):
+                pass
+        info = doc.resolve(doc.trailer.get('/Info'))
+        if isinstance(info, dict):
+            for key in INFO_KEYS:
+                text = _decode_text(info.get(key))
+                if text:
+                    found.setdefault(key, text)
+        return found
+    except (IndexError, KeyError, TypeError, ValueError, RecursionError) as e:
+        raise ScanError(f'malformed PDF structure: {e}') from e
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
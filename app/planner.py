@@ -0,0 +1,325 @@
+import json
+import math
+import os
+import re
+from typing import List, NamedTuple, Optional, Sequence, Union
+from config import Config
+from dictionary import count_rules, count_words
+
+# hashcat内置字符集的大小
+CHARSET_SIZES = {'l': 26, 'u': 26, 'd': 10, 'h': 16, 'H': 16, 's': 33, 'a': 95, 'b': 256}
+
+# 没有实测速度时使用的默认速度（H/s），约为中端单GPU（RTX 3060一档）上hashcat的基准速度，
+# 宁可估慢也不估快：预计耗时偏长时掩码会被多裁剪一些，第一次实测后由SpeedTable中的速度取代
+DEFAULT_SPEEDS = {
+    '10400': 500_000_000,  # RC4-40，MD5一次
+    '10500': 25_000_000,  # RC4-128，MD5和RC4各迭代50/20次
+    '10600': 3_000_000_000,  # AES-256 R5，SHA-256一次
+    '10700': 30_000,  # AES-256 R6，至少64轮SHA-2/AES
+}
+FALLBACK_SPEED = 100_000
+
+# 实测速度的指数平均权重
+SPEED_WEIGHT = 0.3
+
+# 宇宙年龄（秒），用于提示不可能完成的任务
+UNIVERSE_AGE = 4.35e17
+
+
+class MaskAttack(NamedTuple):
+    mask: str
+    min_len: int
+    max_len: int
+    custom_charsets: tuple = ()  # hashcat -1 .. -4
+
+
+class DictAttack(NamedTuple):
+    wordlist: str = ''
+    rules: tuple = ()  # hashcat规则文件，-a 0 时按乘积组合
+    attack_mode: int = 0  # 0: 字典+规则；3: 掩码文件（.hcmask，按文件顺序）；6: 字典+掩码；7: 掩码+字典
+    mask: str = ''  # 混合攻击的掩码
+    words: tuple = ()  # 内存中的候选（如元数据候选），创建任务时写入字典文件
+    label: str = ''
+
+
+Attack = Union[MaskAttack, DictAttack]
+
+
+class Stage(NamedTuple):
+    attack: Attack
+    keyspace: int
+    seconds: float
+    trimmed: bool = False
+
+
+class Plan(NamedTuple):
+    stages: List[Stage]
+    rejected: List[Stage]
+    budget: Optional[float]
+
+    @property
+    def seconds(self) -> float:
+        return sum(stage.seconds for stage in self.stages)
+
+
+def _charset_size(charset: str, custom_sizes: Sequence[int] = ()) -> int:
+    """自定义字符集的大小，可以引用内置字符集（如 ?l?d_）"""
+    chars = set()
+    size = 0
+    i = 0
+    while i < len(charset):
+        if charset[i] == '?' and i + 1 < len(charset):
+            key = charset[i + 1]
+            if key in CHARSET_SIZES:
+                size += CHARSET_SIZES[key]
+            elif key.isdigit() and 0 < int(key) <= len(custom_sizes):
+                size += custom_sizes[int(key) - 1]
+            else:
+                chars.add(key)
+            i += 2
+        else:
+            chars.add(charset[i])
+            i += 1
+    return min(256, size + len(chars))
+
+
+def _mask_tokens(mask: str) -> List[str]:
+    """把掩码拆成位置，如 '?dab' -> ['?d', 'a', 'b']"""
+    tokens = []
+    i = 0
+    while i < len(mask):
+        if mask[i] != '?':
+            tokens.append(mask[i])
+            i += 1
+            continue
+        if i + 1 >= len(mask):
+            raise ValueError(f'掩码以单独的?结尾: {mask}')
+        tokens.append(mask[i:i + 2])
+        i += 2
+    return tokens
+
+
+def mask_positions(mask: str, custom_charsets: Sequence[str] = ()) -> List[int]:
+    """掩码每个位置的候选字符数"""
+    custom_sizes = []
+    for charset in custom_charsets:
+        custom_sizes.append(_charset_size(charset, custom_sizes))
+    positions = []
+    for token in _mask_tokens(mask):
+        key = token[-1]
+        if len(token) == 1 or key == '?':
+            positions.append(1)
+        elif key in CHARSET_SIZES:
+            positions.append(CHARSET_SIZES[key])
+        elif key in '1234':
+            if int(key) > len(custom_sizes):
+                raise ValueError(f'掩码引用了未定义的自定义字符集 ?{key}')
+            positions.append(custom_sizes[int(key) - 1])
+        else:
+            raise ValueError(f'未知的掩码字符集 ?{key}')
+    return positions
+
+
+def mask_prefix(mask: str, length: int) -> str:
+    """掩码的前length个位置，即 --increment 在该长度下使用的掩码"""
+    return ''.join(_mask_tokens(mask)[:length])
+
+
+def _split_hcmask(line: str) -> List[str]:
+    """按未转义的逗号拆分.hcmask的一行，\\, 是逗号本身"""
+    fields, current = [], []
+    i = 0
+    while i < len(line):
+        if line[i] == '\\' and i + 1 < len(line) and line[i + 1] in ',#':
+            current.append(line[i + 1])
+            i += 2
+            continue
+        if line[i] == ',':
+            fields.append(''.join(current))
+            current = []
+        else:
+            current.append(line[i])
+        i += 1
+    fields.append(''.join(current))
+    return fields
+
+
+def format_hcmask(attack: MaskAttack) -> str:
+    """.hcmask中的一行：自定义字符集在前，逗号和行首的#需要转义"""
+    fields = [field.replace(',', '\\,') for field in (*attack.custom_charsets, attack.mask)]
+    line = ','.join(fields)
+    return f'\\{line}' if line.startswith('#') else line
+
+
+def read_mask_file(path) -> List[MaskAttack]:
+    """读取.hcmask掩码文件，每行是 [字符集1,][字符集2,]...掩码，按文件顺序返回固定长度的掩码攻击"""
+    attacks = []
+    with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line or line.startswith('#'):
+                continue
+            *charsets, mask = _split_hcmask(line)
+            if len(charsets) > 4 or not mask:
+                raise ValueError(f'{path} 第 {number} 行不是有效的掩码: {line}')
+            length = len(mask_positions(mask, charsets))
+            attacks.append(MaskAttack(mask, length, length, tuple(charsets)))
+    return attacks
+
+
+def expand_mask(mask: str, max_len: int) -> str:
+    """单字符集的预设（如 ?d）扩展为max_len位，配合 --increment 使用"""
+    if re.fullmatch(r'\?[a-zA-Z1-4]', mask):
+        return mask * max_len
+    return mask
+
+
+def keyspace(attack: Attack) -> int:
+    """--increment 范围内的精确候选数；字典攻击为 字典行数 x 规则数（或掩码候选数），掩码文件为各行之和"""
+    if isinstance(attack, DictAttack):
+        return _dict_keyspace(attack)
+    positions = mask_positions(attack.mask, attack.custom_charsets)
+    total = 0
+    for length in range(attack.min_len, min(attack.max_len, len(positions)) + 1):
+        total += math.prod(positions[:length])
+    return total
+
+
+def _dict_keyspace(attack: DictAttack) -> int:
+    if attack.attack_mode == 3:
+        return sum(keyspace(mask) for mask in read_mask_file(attack.wordlist))
+    words = len(attack.words) if attack.words else count_words(attack.wordlist)
+    if attack.attack_mode in (6, 7):
+        return words * math.prod(mask_positions(attack.mask))
+    return words * max(1, math.prod(count_rules(rules) for rules in attack.rules))
+
+
+def normalize_attack(attack: Attack) -> Attack:
+    """扩展单字符集预设，并把掩码和长度范围截到一致"""
+    if isinstance(attack, DictAttack):
+        return attack
+    tokens = _mask_tokens(expand_mask(attack.mask, attack.max_len))[:attack.max_len]
+    return attack._replace(mask=''.join(tokens), max_len=min(attack.max_len, len(tokens)))
+
+
+class SpeedTable:
+    """各hashcat模式的实测速度，保存在JSON文件中"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.SPEEDS_FILE
+        self._speeds = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._speeds = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, mode: str) -> float:
+        return self._speeds.get(str(mode)) or DEFAULT_SPEEDS.get(str(mode), FALLBACK_SPEED)
+
+    def record(self, mode: str, speed: float):
+        """用指数平均合并一次实测速度"""
+        if speed <= 0:
+            return
+        mode = str(mode)
+        old = self._speeds.get(mode)
+        self._speeds[mode] = speed if old is None else old + SPEED_WEIGHT * (speed - old)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._speeds, f)
+        os.replace(tmp, self.path)
+
+
+def estimate(mode: str, attack: Attack, speeds: Optional[SpeedTable] = None) -> Stage:
+    """估算一个攻击的候选数和耗时"""
+    attack = normalize_attack(attack)
+    space = keyspace(attack)
+    speed = (speeds or SpeedTable()).get(mode)
+    return Stage(attack, space, space / speed)
+
+
+def _trim(mode: str, stage: Stage, budget: float, speeds: SpeedTable) -> Optional[Stage]:
+    """缩小最大长度直到耗时不超过预算，无法满足时返回None；字典攻击不能裁剪"""
+    attack = stage.attack
+    if isinstance(attack, DictAttack):
+        return None
+    for max_len in range(attack.max_len - 1, attack.min_len - 1, -1):
+        trimmed = estimate(mode, attack._replace(max_len=max_len), speeds)
+        if trimmed.seconds <= budget:
+            return trimmed._replace(trimmed=True)
+    return None
+
+
+def build_plan(mode: str, attacks: Sequence[Attack], budget: Optional[float] = None,
+               speeds: Optional[SpeedTable] = None) -> Plan:
+    """按预计耗时从小到大排列攻击阶段，超出时间预算的阶段被裁剪或拒绝"""
+    speeds = speeds or SpeedTable()
+    stages = sorted((estimate(mode, attack, speeds) for attack in attacks), key=lambda s: s.seconds)
+    planned, rejected = [], []
+    remaining = budget
+    for stage in stages:
+        if stage.keyspace == 0:
+            rejected.append(stage)
+            continue
+        if remaining is not None and stage.seconds > remaining:
+            trimmed = _trim(mode, stage, remaining, speeds)
+            if trimmed is None:
+                rejected.append(stage)
+                continue
+            stage = trimmed
+        planned.append(stage)
+        if remaining is not None:
+            remaining -= stage.seconds
+    return Plan(planned, rejected, budget)
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """解析时间预算，如 3600、30m、2h、7d；0或none表示不限"""
+    text = str(text).strip().lower()
+    if text in ('', '0', 'none', 'inf'):
+        return None
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def format_duration(seconds: float) -> str:
+    """把秒数格式化为易读的中文时长"""
+    if seconds >= UNIVERSE_AGE:
+        return f'{seconds / UNIVERSE_AGE:.3g} 倍宇宙年龄'
+    if seconds < 1:
+        return '不到1秒'
+    parts = []
+    for unit, size in (('年', 365 * 86400), ('天', 86400), ('小时', 3600), ('分', 60), ('秒', 1)):
+        if seconds >= size:
+            value, seconds = divmod(seconds, size)
+            parts.append(f'{int(value)}{unit}')
+        if len(parts) == 2:
+            break
+    return ''.join(parts)
+
+
+def describe_stage(stage: Stage) -> str:
+    """一行阶段说明，用于命令行输出和页面提示"""
+    attack = stage.attack
+    if isinstance(attack, DictAttack):
+        return f'{describe_attack(attack)}: {stage.keyspace:,} 个候选，预计 {format_duration(stage.seconds)}'
+    if stage.keyspace == 0:
+        return f'{attack.mask} 长度 {attack.min_len} 起: 掩码长度不足'
+    note = '（已缩短）' if stage.trimmed else ''
+    return (f'{attack.mask} 长度 {attack.min_len}-{attack.max_len}{note}: '
+            f'{stage.keyspace:,} 个候选，预计 {format_duration(stage.seconds)}')
+
+
+def describe_attack(attack: DictAttack) -> str:
+    """字典攻击的简短说明，如 rockyou.txt + best64.rule"""
+    name = attack.label or os.path.basename(attack.wordlist)
+    if attack.attack_mode == 3:
+        return f'掩码文件 {name}'
+    if attack.attack_mode == 6:
+        return f'{name} + {attack.mask}'
+    if attack.attack_mode == 7:
+        return f'{attack.mask} + {name}'
+    return ' + '.join([name, *(os.path.basename(rules) for rules in attack.rules)])
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from typing import List, NamedTuple, Optional, Union
+from config import Config
+from hashcat_driver import password_bytes
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    file_sha256 TEXT,
+    hash TEXT NOT NULL,
+    password BLOB NOT NULL,
+    mode TEXT,
+    timings TEXT,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_sha256 ON results (file_sha256);
+CREATE INDEX IF NOT EXISTS idx_results_hash ON results (hash);
+CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used);
+'''
+
+
+class CacheEntry(NamedTuple):
+    password: bytes
+    mode: Optional[str]
+    timings: dict
+    created_at: float
+
+
+def file_sha256(pdf_file: Union[str, bytes]) -> str:
+    """计算文件内容的SHA-256，路径按块读取避免整文件载入内存"""
+    digest = hashlib.sha256()
+    if isinstance(pdf_file, (bytes, bytearray, memoryview)):
+        digest.update(pdf_file)
+    else:
+        with open(pdf_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_hash(hash_str: str) -> str:
+    """规范化$pdf$哈希，内容相同（/ID相同）的副本得到相同的键"""
+    return hash_str.strip().lower()
+
+
+class ResultCache:
+    """以文件SHA-256和$pdf$哈希为键的本地破解结果缓存（SQLite）"""
+
+    def __init__(self, db_path=None, ttl=None, max_entries=None):
+        self.db_path = db_path or Config.RESULT_CACHE_DB
+        self.ttl = Config.RESULT_CACHE_TTL if ttl is None else ttl
+        self.max_entries = Config.RESULT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(str(self.db_path), timeout=30)
+
+    def lookup(self, file_sha256: Optional[str] = None,
+               hash_str: Optional[str] = None) -> Optional[CacheEntry]:
+        """先按文件SHA-256查找，再按规范化哈希查找"""
+        now = time.time()
+        conditions = []
+        if file_sha256:
+            conditions.append(('file_sha256 = ?', file_sha256))
+        if hash_str:
+            conditions.append(('hash = ?', normalize_hash(hash_str)))
+        with closing(self._connect()) as conn, conn:
+            for condition, value in conditions:
+                row = conn.execute(
+                    f'SELECT rowid, password, mode, timings, created_at FROM results '
+                    f'WHERE {condition} AND created_at >= ? ORDER BY last_used DESC LIMIT 1',
+                    (value, now - self.ttl)
+                ).fetchone()
+                if row:
+                    conn.execute('UPDATE results SET last_used = ? WHERE rowid = ?', (now, row[0]))
+                    return CacheEntry(password_bytes(row[1]), row[2], json.loads(row[3] or '{}'), row[4])
+        return None
+
+    def passwords(self) -> List[bytes]:
+        """未过期记录中已破解的密码，每个哈希一条，用于统计密码规律"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT password FROM results WHERE created_at >= ? GROUP BY hash',
+                (time.time() - self.ttl,)
+            ).fetchall()
+        return [password_bytes(row[0]) for row in rows]
+
+    def store(self, file_sha256: Optional[str], hash_str: str, password: Union[bytes, str],
+              mode: Optional[str] = None, timings: Optional[dict] = None):
+        """记录破解结果（密码按字节保存）并执行淘汰"""
+        if isinstance(password, str):
+            password = password.encode('utf-8')
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'DELETE FROM results WHERE hash = ? AND file_sha256 IS ?',
+                (normalize_hash(hash_str), file_sha256)
+            )
+            conn.execute(
+                'INSERT INTO results (file_sha256, hash, password, mode, timings, created_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (file_sha256, normalize_hash(hash_str), password, mode,
+                 json.dumps(timings or {}), now, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        """删除过期记录，超出容量时按最近使用时间淘汰"""
+        conn.execute('DELETE FROM results WHERE created_at < ?', (now - self.ttl,))
+        conn.execute(
+            'DELETE FROM results WHERE rowid IN ('
+            'SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
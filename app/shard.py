@@ -0,0 +1,490 @@
+import json
+import math
+import os
+import posixpath
+import queue
+import shlex
+import subprocess
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+from config import Config
+from hashcat_driver import (ErrorEvent, FinishedEvent, HashcatRun, ProgressEvent, RecoveredEvent, STATUS_ARGS,
+                            STOP_CRACKED, encode_plain)
+from jobs import HASHCAT_OPTIONS, read_outfile
+
+# hashcat退出码：0 全部破解，1 穷尽；其他（出错、被信号结束、SSH断开）都视为工作进程失败
+_COMPLETED = (0, 1)
+
+# SSH不交互，连接不上时尽快失败
+SSH_OPTIONS = ['-o', 'BatchMode=yes', '-o', 'ConnectTimeout=10']
+
+# 查询 --keyspace 的超时（秒）
+KEYSPACE_TIMEOUT = 300
+
+
+class Chunk(NamedTuple):
+    index: int
+    length: Optional[int]  # 掩码攻击该块的密码长度，掩码文件为掩码的序号，字典攻击为None
+    skip: int              # --skip
+    limit: int             # --limit
+
+
+def split_keyspace(units, workers: int, chunks_per_worker: Optional[int] = None) -> List[Chunk]:
+    """把各长度的基础密钥空间切成大小相近的块，总块数约为 工作进程数 x chunks_per_worker
+
+    units是 (长度, 基础密钥空间) 的列表。--skip/--limit 的单位是hashcat --keyspace 报告的
+    基础密钥空间（不含放大器部分），且不能与 --increment 同时使用，所以每个长度单独切分。
+    """
+    chunks_per_worker = chunks_per_worker or Config.SHARD_CHUNKS_PER_WORKER
+    total = sum(space for _, space in units)
+    target = max(1, math.ceil(total / max(1, workers * chunks_per_worker)))
+    chunks = []
+    for length, space in units:
+        if space <= 0:
+            continue
+        size = math.ceil(space / math.ceil(space / target))
+        for skip in range(0, space, size):
+            chunks.append(Chunk(len(chunks), length, skip, min(size, space - skip)))
+    return chunks
+
+
+class LocalTransport:
+    """在本机运行hashcat，devices给出时用 -d 绑定设备"""
+
+    def __init__(self, devices=''):
+        self.devices = devices
+        self.name = f'local:{devices}' if devices else 'local'
+        self.cwd = str(Config.HASHCAT_DIR)
+
+    def prepare(self, job):
+        """准备任务文件，返回把本机路径换成工作节点上路径的函数"""
+        Config.validate()  # 验证hashcat是否存在
+        return str
+
+    def command(self, args) -> List[str]:
+        return [str(Config.HASHCAT_BIN), *(['-d', self.devices] if self.devices else []), *args]
+
+    def fetch(self, remote, local):
+        """把工作节点上的文件取回本机，本机工作进程无需操作"""
+
+    def stop(self, run, session):
+        run.stop()
+
+    def cleanup(self, job):
+        pass
+
+
+class SSHTransport:
+    """通过SSH在其他节点上运行hashcat，任务文件上传到节点的 Config.REMOTE_DIR 下
+
+    节点需要能用密钥免密登录，hashcat由 Config.REMOTE_HASHCAT 指定。
+    """
+
+    def __init__(self, host, devices=''):
+        self.host = host
+        self.devices = devices
+        self.name = f'ssh:{host}:{devices}' if devices else f'ssh:{host}'
+        self.cwd = None
+
+    def _ssh(self, remote_cmd, **kwargs) -> subprocess.CompletedProcess:
+        return subprocess.run(['ssh', *SSH_OPTIONS, self.host, remote_cmd], capture_output=True, **kwargs)
+
+    def _check(self, result):
+        if result.returncode != 0:
+            error = result.stderr.decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f'{self.name}: {error or f"退出码 {result.returncode}"}')
+
+    @staticmethod
+    def _remote_dir(job) -> str:
+        return posixpath.join(Config.REMOTE_DIR, job.id)
+
+    def prepare(self, job):
+        """上传哈希文件、字典和规则，返回把本机路径换成节点上路径的函数"""
+        remote_dir = self._remote_dir(job)
+        files = {}
+        for local in job.input_files():
+            files[local] = posixpath.join(remote_dir, f'{len(files)}_{os.path.basename(local)}')
+        self._check(self._ssh(f'mkdir -p {shlex.quote(posixpath.join(remote_dir, "shards"))}'))
+        for local, remote in files.items():
+            with open(local, 'rb') as f:
+                self._check(self._ssh(f'cat > {shlex.quote(remote)}', stdin=f))
+
+        def path(local) -> str:
+            if str(local) in files:
+                return files[str(local)]
+            # 任务目录下的其他文件（各块的outfile）放到节点任务目录的相同位置
+            return posixpath.join(remote_dir, Path(local).relative_to(job.job_dir).as_posix())
+        return path
+
+    def command(self, args) -> List[str]:
+        hashcat = Config.REMOTE_HASHCAT
+        remote = shlex.join([hashcat, *(['-d', self.devices] if self.devices else []), *map(str, args)])
+        if posixpath.dirname(hashcat):
+            # hashcat从自身目录查找OpenCL内核
+            remote = f'cd {shlex.quote(posixpath.dirname(hashcat))} && exec {remote}'
+        return ['ssh', *SSH_OPTIONS, self.host, remote]
+
+    def fetch(self, remote, local):
+        result = self._ssh(f'cat {shlex.quote(remote)}')
+        if result.returncode == 0:
+            Path(local).parent.mkdir(parents=True, exist_ok=True)
+            Path(local).write_bytes(result.stdout)
+
+    def stop(self, run, session):
+        # 结束本地的ssh进程不一定会结束节点上的hashcat，按会话名结束
+        try:
+            self._ssh(f'pkill -f -- {shlex.quote(f"--session {session} ")}', timeout=30)
+        except subprocess.TimeoutExpired:
+            pass
+        run.stop()
+
+    def cleanup(self, job):
+        try:
+            self._ssh(f'rm -rf {shlex.quote(self._remote_dir(job))}', timeout=60)
+        except subprocess.TimeoutExpired:
+            pass
+
+
+def parse_workers(spec) -> list:
+    """解析工作进程列表，如 local:1,local:2,ssh:user@gpu-box,ssh:gpu-box2:1"""
+    workers = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, rest = entry.partition(':')
+        if kind == 'local':
+            workers.append(LocalTransport(rest))
+        elif kind == 'ssh' and rest:
+            host, _, devices = rest.partition(':')
+            workers.append(SSHTransport(host, devices))
+        else:
+            raise ValueError(f'无法识别的工作进程：{entry}（应为 local、local:设备、ssh:主机 或 ssh:主机:设备）')
+    names = [worker.name for worker in workers]
+    if len(set(names)) != len(names):
+        raise ValueError(f'工作进程重复：{spec}')
+    return workers
+
+
+def query_keyspace(transport, args) -> int:
+    """用hashcat --keyspace 查询基础密钥空间（--skip/--limit 的单位）"""
+    result = subprocess.run(transport.command([*args, '--keyspace']), capture_output=True, text=True,
+                            cwd=transport.cwd, timeout=KEYSPACE_TIMEOUT)
+    for line in reversed(result.stdout.split()):
+        if line.isdigit():
+            return int(line)
+    output = (result.stderr or result.stdout).strip()
+    raise RuntimeError(f'{transport.name} 无法计算密钥空间：{output[-200:] or f"退出码 {result.returncode}"}')
+
+
+class ShardCoordinator:
+    """把一个任务的密钥空间分片给多个hashcat工作进程（本机设备或SSH节点）
+
+    用法::
+
+        coordinator = ShardCoordinator(job, parse_workers(Config.SHARD_WORKERS))
+        recovered = coordinator.run(on_progress=print_progress)
+
+    每个工作进程一个线程，从共享队列取块运行。工作进程失败时块重新排队交给其他进程，
+    全部哈希都恢复后立即停止所有工作进程。块的划分和已完成的块记录在任务目录的
+    shards.json 中，中断后继续时跳过已完成的块。
+    """
+
+    def __init__(self, job, workers, logger=None):
+        self.job = job
+        self.workers = list(workers)
+        self.logger = logger
+        self.hash_strs = job.hashes()
+        self.recovered: Dict[str, bytes] = read_outfile(job.out_file, self.hash_strs)
+        self.chunks: List[Chunk] = []
+        self.done = set()
+        self.message = None  # 没能完成全部块的原因
+        self.measured = 0    # 所有工作进程合计的最高速度（H/s）
+        self.cancelled = False
+        self.timed_out = False
+        self._queue = queue.Queue()
+        self._attempts = Counter()
+        self._paths = {}     # 工作进程名 -> 路径转换函数
+        self._running = {}   # 工作进程名 -> (HashcatRun, 传输, 会话名)
+        self._progress = {}  # 工作进程名 -> (块, ProgressEvent)
+        self._busy = 0       # 正在处理块的工作线程数
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._started = None
+
+    def _log(self, msg, error=False, **fields):
+        if self.logger is not None:
+            (self.logger.error if error else self.logger.info)(msg, phase='shard', **fields)
+
+    def plan(self, transport) -> List[Chunk]:
+        """划分块：继续中断的任务时读取原来的划分，否则用hashcat查询各长度的密钥空间"""
+        if self.job.shards_file.exists():
+            with open(self.job.shards_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.chunks = [Chunk(*chunk) for chunk in data['chunks']]
+            self.done = set(data['done'])
+            return self.chunks
+        path = self._paths[transport.name]
+        if self.job.attack.get('attack_mode') == 3:
+            lengths = range(len(self.job.mask_file_masks()))
+        elif self.job.attack:
+            lengths = [None]
+        else:
+            lengths = range(self.job.min_len, self.job.max_len + 1)
+        units = [
+            (length, query_keyspace(transport, ['-m', self.job.mode,
+                                                *self.job.attack_mode_args(length, path, hash_file=False),
+                                                *HASHCAT_OPTIONS]))
+            for length in lengths
+        ]
+        self.chunks = split_keyspace(units, len(self.workers))
+        self._save()
+        self._log(f'密钥空间 {sum(c.limit for c in self.chunks):,}，分为 {len(self.chunks)} 块')
+        return self.chunks
+
+    def _save(self):
+        tmp = self.job.shards_file.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'chunks': [list(chunk) for chunk in self.chunks], 'done': sorted(self.done)}, f)
+        os.replace(tmp, self.job.shards_file)
+
+    def _prepare(self) -> list:
+        """并行准备各工作进程，返回可用的工作进程"""
+        def prepare(transport):
+            try:
+                self._paths[transport.name] = transport.prepare(self.job)
+                return transport
+            except Exception as e:
+                self._log(f'工作进程 {transport.name} 不可用: {e}', error=True, worker=transport.name)
+                return None
+
+        with ThreadPoolExecutor(max_workers=len(self.workers)) as pool:
+            return [transport for transport in pool.map(prepare, self.workers) if transport is not None]
+
+    def run(self, on_progress=None, should_stop=None, poll_interval: float = 1.0,
+            timeout: Optional[float] = None) -> Dict[str, bytes]:
+        """运行所有块直到恢复全部哈希、块全部完成、被停止或超过timeout秒，返回 哈希 -> 密码字节
+
+        on_progress定期收到合并后的ProgressEvent；should_stop返回True时停止所有工作进程。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if len(self.recovered) == len(self.hash_strs):
+            return dict(self.recovered)
+        self.job.shards_dir.mkdir(parents=True, exist_ok=True)
+        ready = self._prepare()
+        threads = []
+        try:
+            if not ready:
+                self.message = '没有可用的工作进程'
+                return dict(self.recovered)
+            self.plan(ready[0])
+            for chunk in self.chunks:
+                if chunk.index not in self.done:
+                    self._queue.put(chunk)
+            self._started = (time.time(), self._done_keyspace())
+            threads = [threading.Thread(target=self._work, args=(transport,), name=f'shard-{transport.name}',
+                                        daemon=True) for transport in ready]
+            for thread in threads:
+                thread.start()
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                alive[0].join(poll_interval)
+                if should_stop is not None and not self._stop.is_set() and should_stop():
+                    self.cancel()
+                elif deadline is not None and not self._stop.is_set() and time.monotonic() >= deadline:
+                    self.timed_out = True
+                    self.message = '超出时间预算，已结束所有工作进程'
+                    self._log(self.message, error=True)
+                    self.stop()
+                if on_progress is not None:
+                    on_progress(self.progress())
+
+            remaining = len(self.chunks) - len(self.done)
+            if remaining and not self._stop.is_set() and self.message is None:
+                self.message = f'还有 {remaining} 块没有完成，工作进程都已失败'
+            return dict(self.recovered)
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            for transport in ready:
+                transport.cleanup(self.job)
+
+    def _work(self, transport):
+        """工作线程：反复取块运行，连续失败过多时退出，由其他工作进程接手"""
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                chunk = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                with self._lock:
+                    # 其他工作进程的块失败时会重新排队，全部空闲才退出
+                    if not self._busy:
+                        return
+                continue
+            with self._lock:
+                self._busy += 1
+            try:
+                completed = self._run_chunk(transport, chunk)
+            except Exception as e:
+                self._log(f'工作进程 {transport.name} 运行块 {chunk.index} 出错: {e}', error=True,
+                          worker=transport.name, chunk=chunk.index)
+                completed = False
+            try:
+                if self._stop.is_set():
+                    return
+                if completed:
+                    failures = 0
+                    with self._lock:
+                        self.done.add(chunk.index)
+                        self._save()
+                    continue
+                failures += 1
+                self._retry(chunk, transport)
+            finally:
+                with self._lock:
+                    # 与记录完成在同一把锁内移除，合并进度不会回退
+                    self._progress.pop(transport.name, None)
+                    self._busy -= 1
+            if failures >= Config.SHARD_WORKER_FAILURES:
+                self._log(f'工作进程 {transport.name} 连续失败 {failures} 次，不再分配块', error=True,
+                          worker=transport.name)
+                return
+
+    def _retry(self, chunk, transport):
+        """失败的块重新排队，失败次数过多时放弃"""
+        self._attempts[chunk.index] += 1
+        if self._attempts[chunk.index] < Config.SHARD_MAX_ATTEMPTS:
+            self._log(f'块 {chunk.index} 在 {transport.name} 上失败，重新排队', error=True,
+                      worker=transport.name, chunk=chunk.index)
+            self._queue.put(chunk)
+            return
+        self.message = f'块 {chunk.index} 失败 {self._attempts[chunk.index]} 次，已放弃'
+        self._log(self.message, error=True, chunk=chunk.index)
+
+    def _run_chunk(self, transport, chunk) -> bool:
+        """在一个工作进程上运行一个块，返回hashcat是否正常跑完该块"""
+        path = self._paths[transport.name]
+        session = f'{self.job.session}_{chunk.index}'
+        out_file = self.job.shards_dir / f'{chunk.index}.out'
+        args = [
+            '--session', session,
+            '--restore-disable',
+            '-m', self.job.mode,
+            *self.job.attack_mode_args(chunk.length, path),
+            '--skip', str(chunk.skip),
+            '--limit', str(chunk.limit),
+            '--potfile-disable',
+            '--outfile', path(out_file),
+            '--outfile-format', '1,2',  # 输出 哈希:密码
+            *STATUS_ARGS,
+            *HASHCAT_OPTIONS,
+        ]
+        run = HashcatRun(transport.command(args), out_file, self.hash_strs, cwd=transport.cwd,
+                         labels={'mode': self.job.mode, 'worker': transport.name})
+        with self._lock:
+            if self._stop.is_set():
+                return False
+            run.start()
+            self._running[transport.name] = (run, transport, session)
+        self._log(f'块 {chunk.index} 由 {transport.name} 运行', worker=transport.name, chunk=chunk.index)
+        finished = None
+        seen = 0
+        try:
+            for event in run.events():
+                if isinstance(event, ProgressEvent):
+                    with self._lock:
+                        self._progress[transport.name] = (chunk, event)
+                    # SSH节点的outfile不在本机，根据状态中的已恢复数决定何时取回
+                    if event.recovered[0] > seen:
+                        seen = event.recovered[0]
+                        self._collect(transport, out_file, path)
+                elif isinstance(event, RecoveredEvent):
+                    self._collect(transport, out_file, path)
+                elif isinstance(event, ErrorEvent) and not event.warning:
+                    self._log(event.message, error=True, worker=transport.name, chunk=chunk.index)
+                elif isinstance(event, FinishedEvent):
+                    finished = event
+        finally:
+            with self._lock:
+                self._running.pop(transport.name, None)
+            run.terminate()
+        self._collect(transport, out_file, path)
+        if self.logger is not None:
+            self.logger.command(run.cmd, run.output(), phase='shard', worker=transport.name, chunk=chunk.index)
+        # 块内命中全部哈希时hashcat被提前结束，也算跑完
+        return finished is not None and (finished.returncode in _COMPLETED or finished.status == STOP_CRACKED)
+
+    def _collect(self, transport, out_file, path):
+        """取回块的outfile，新恢复的密码追加到任务的outfile；全部恢复后停止所有工作进程"""
+        transport.fetch(path(out_file), out_file)
+        found = read_outfile(out_file, self.hash_strs)
+        with self._lock:
+            new = {hash_str: password for hash_str, password in found.items() if hash_str not in self.recovered}
+            if not new:
+                return
+            self.recovered.update(new)
+            with open(self.job.out_file, 'ab') as f:
+                for hash_str, password in new.items():
+                    f.write(hash_str.encode('ascii') + b':' + encode_plain(password) + b'\n')
+            finished = len(self.recovered) == len(self.hash_strs)
+        self._log(f'{transport.name} 恢复了 {len(new)} 个哈希', worker=transport.name)
+        if finished:
+            self.stop()
+
+    def cancel(self):
+        """取消任务：停止所有工作进程，可以从其他线程调用"""
+        self.cancelled = True
+        self.stop()
+
+    def stop(self):
+        """停止所有工作进程，不再分配新的块"""
+        self._stop.set()
+        with self._lock:
+            running = list(self._running.values())
+        for run, transport, session in running:
+            try:
+                transport.stop(run, session)
+            except Exception as e:
+                self._log(f'停止 {transport.name} 失败: {e}', error=True, worker=transport.name)
+
+    def _done_keyspace(self) -> int:
+        return sum(self.chunks[index].limit for index in self.done)
+
+    def progress(self) -> ProgressEvent:
+        """所有工作进程合并后的进度，单位是基础密钥空间"""
+        with self._lock:
+            done = self._done_keyspace()
+            speeds = {}
+            for name, (chunk, event) in self._progress.items():
+                done += int(chunk.limit * event.progress)
+                speeds[name] = sum(event.speeds.values())
+            running = bool(self._running)
+        total = sum(chunk.limit for chunk in self.chunks)
+        if len(self.recovered) == len(self.hash_strs):
+            status = 'Cracked'
+        else:
+            status = 'Running' if running else 'Exhausted'
+        self.measured = max(self.measured, sum(speeds.values()))
+        eta = None
+        if self._started is not None:
+            start_time, start_done = self._started
+            rate = (done - start_done) / max(1e-6, time.time() - start_time)
+            if rate > 0:
+                eta = (total - done) / rate
+        return ProgressEvent(
+            status=status,
+            progress=done / total if total else 0.0,
+            done=done,
+            total=total,
+            speeds=speeds,
+            eta=eta,
+            recovered=(len(self.recovered), len(self.hash_strs)),
+            restore_point=done,
+        )
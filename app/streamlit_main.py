@@ -1,253 +1,317 @@
 import os
-import tempfile
 import streamlit as st
-from pdf2john import get_pdf_hash
-from subprocess import Popen, PIPE
-from pikepdf import Pdf
-import time
-import re
+from hash_modes import resolve_hash_mode, UnsupportedHashError
+from planner import DictAttack, MaskAttack, build_plan, describe_stage, format_duration
+from dictionary import available_mask_files, available_rules, available_wordlists
+from triage import TRIAGE_LABELS, PATH_CRACK
+from result_cache import ResultCache
+from upload_cache import SizedLRU, UploadSpool
+from jobs import (STATUS_LABELS, STATUS_QUEUED, STATUS_RUNNING, STATUS_FINISHED, STATUS_FAILED,
+                  STATUS_INTERRUPTED, ACTIVE_STATUSES, ORIGIN_WEB)
+from worker import WorkerPool
+from pdf_logger import log_error, log_info
+from hashcat_driver import format_password
+from engine import decrypt_pdf, observe_timings, prepare_pdf
+from options import DEFAULT_PROFILE, PROFILE_LABELS, WATERMARK_ACTIONS, WATERMARKS_KEEP
 from config import Config
-from datetime import datetime
-
-class PdfLogger:
-    def __init__(self, pdf_name):
-        self.log_file = Config.get_pdf_log_path(pdf_name)
-        # 确保日志目录存在
-        self.log_file.parent.mkdir(exist_ok=True)
-        # 创建日志文件并写入开始信息
-        with open(self.log_file, 'w', encoding='utf-8') as f:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            f.write(f'[{timestamp}] 开始处理PDF文件: {pdf_name}\n')
-    
-    def info(self, msg):
-        """记录普通日志"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'[{timestamp}] {msg}\n')
+import metrics
+import time
+
+@st.cache_resource
+def start_metrics_server():
+    """每个服务进程只启动一次指标端点（PDFJOKER_METRICS_PORT），与后台破解进程池共用同一份指标"""
+    try:
+        return metrics.start_server()
+    except OSError as e:
+        log_error(f'无法提供指标：{str(e)}')
+        return None
+
+def count_once(uploaded_file, name, **labels):
+    """每个上传的文件只计数一次，页面重跑不会重复计数"""
+    counted = st.session_state.setdefault('counted', set())
+    key = (uploaded_file.file_id, name)
+    if key not in counted:
+        counted.add(key)
+        metrics.inc(name, **labels)
+
+@st.cache_resource
+def get_upload_cache():
+    """每个服务进程共用上传文件的落盘目录和按内容缓存的结果（分诊、哈希、解密）"""
+    return UploadSpool(), SizedLRU()
+
+def memoized(key, compute):
+    """按文件内容的SHA-256缓存计算结果，页面重跑和重复上传不再重新计算"""
+    _, memo = get_upload_cache()
+    return memo.get_or_compute(key, compute)
+
+def spool_upload(uploaded_file):
+    """把上传的文件写入磁盘一次，同一会话中按file_id记住；超出单文件或会话的上传限制时返回None"""
+    spool, _ = get_upload_cache()
+    uploads = st.session_state.setdefault('uploads', {})  # file_id -> SpooledUpload
+    upload = uploads.get(uploaded_file.file_id)
+    if upload is not None and spool.touch(upload):
+        return upload
+    if upload is None:
+        limit_mb = Config.UPLOAD_MAX_BYTES // 1024 ** 2
+        session_mb = Config.SESSION_UPLOAD_MAX_BYTES // 1024 ** 2
+        if uploaded_file.size > Config.UPLOAD_MAX_BYTES:
+            st.error(f'❌ 文件超过 {limit_mb} MB 的上限')
+            return None
+        if len(uploads) >= Config.SESSION_MAX_UPLOADS:
+            st.error(f'❌ 本次会话已上传 {len(uploads)} 个文件，达到上限，请刷新页面开始新会话')
+            return None
+        if sum(u.size for u in uploads.values()) + uploaded_file.size > Config.SESSION_UPLOAD_MAX_BYTES:
+            st.error(f'❌ 本次会话上传的文件累计超过 {session_mb} MB，请刷新页面开始新会话')
+            return None
+    # 新文件，或落盘的文件已被淘汰时重新写入
+    with st.spinner('⏳ 正在保存上传的文件...'):
+        upload = spool.spool(uploaded_file)
+    uploads[uploaded_file.file_id] = upload
+    return upload
+
+@st.cache_resource
+def get_worker_pool():
+    """每个服务进程只启动一个后台破解进程池，并回收已结束任务的文件"""
+    pool = WorkerPool()
+    pool.store.gc()
+    return pool.start()
+
+def show_job(pool, job):
+    """显示单个任务的状态、进度和结果"""
+    with st.container(border=True):
+        st.write(f'**{job.pdf_name}** | 模式 {job.mode} | {job.describe()} | {STATUS_LABELS[job.status]}')
+        if job.status == STATUS_QUEUED:
+            st.caption(f'前面还有 {pool.store.queue_position(job)} 个任务')
+        elif job.status == STATUS_RUNNING:
+            st.progress(min(job.progress, 1.0))
+            elapsed = time.time() - job.created_at
+            budget = f' | 时间预算: {format_duration(job.timeout)}' if job.timeout else ''
+            st.caption(f'进度: {job.progress * 100:.0f}% | 速度: {job.speed or "-"} | 已用时间: {elapsed:.0f}秒{budget}')
+            if job.message:
+                st.caption(job.message)
+        elif job.status == STATUS_FINISHED and job.password is not None:
+            st.success(f"🎉 破解成功！密码是: {format_password(job.password)}")
+            for source in job.sources:
+                if os.path.exists(source['path']):
+                    offer_download(source['path'], job.password, key=f'download_{job.id}',
+                                   sha256=source.get('sha256'))
+        elif job.status == STATUS_FAILED:
+            st.error(f'❌ 破解失败：{job.message or "未知错误"}')
+        
+        if job.status in ACTIVE_STATUSES:
+            if st.button('取消', key=f'cancel_{job.id}'):
+                pool.cancel(job)
+                st.rerun()
+        elif job.status == STATUS_INTERRUPTED:
+            if st.button('继续', key=f'resume_{job.id}'):
+                pool.resume(job)
+                st.rerun()
+
+def show_jobs():
+    """任务面板：有任务在排队或运行时每2秒刷新一次"""
+    pool = get_worker_pool()
+    jobs = pool.store.list(origin=ORIGIN_WEB, limit=20, newest_first=True)
+    if not jobs:
+        return
+    active = any(job.status in ACTIVE_STATUSES for job in jobs)
     
-    def error(self, error_msg):
-        """记录错误日志"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'[{timestamp}] ERROR: {error_msg}\n')
+    @st.fragment(run_every=2 if active else None)
+    def panel():
+        current = pool.store.list(origin=ORIGIN_WEB, limit=20, newest_first=True)
+        st.subheader('📋 破解任务')
+        for job in current:
+            show_job(pool, job)
+        if active and not any(job.status in ACTIVE_STATUSES for job in current):
+            # 所有任务都结束后整页刷新一次，停止定时刷新
+            st.rerun()
     
-    def command(self, cmd, output):
-        """记录命令和输出"""
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(f'\n[{timestamp}] 执行命令: {" ".join(cmd)}\n')
-            f.write(f'[{timestamp}] 命令输出:\n{output}\n')
-
-def parse_hashcat_progress(line):
-    """解析hashcat输出的进度信息"""
-    if 'Progress' in line:
-        match = re.search(r'Progress\.+:\s+(\d+)%\s+\((\d+)/(\d+)\)', line)
-        if match:
-            return int(match.group(1))
-    return None
-
-def crack_pdf_hash(hash_str, pdf_name, mask="?d", min_len=4, max_len=8):
-    logger = PdfLogger(pdf_name)
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(hash_str.encode())
-        tmp_path = tmp.name
-        logger.info(f'创建临时文件: {tmp_path}')
+    panel()
+
+def offer_download(path, password, key=None, sha256=None):
+    """解密PDF（上传后落盘的文件或任务保存的源文件）并提供下载，按侧栏设置去水印
+
+    解密结果按内容的SHA-256、密码和设置缓存，页面重跑时不再重新解密。
+    """
+    profile = st.session_state.get('save_profile', DEFAULT_PROFILE)
+    watermarks = st.session_state.get('watermarks', WATERMARKS_KEEP)
+    content_key = sha256 or path
     
-    # 按照不同PDF版本的hash模式依次尝试
-    hash_modes = [
-        ('10500', 'PDF 1.7 Level 8 (Acrobat 10 - 11)'),
-        ('10700', 'PDF 1.7 Level 3 (Acrobat 9)'),
-        ('10600', 'PDF 1.7 Level 3 (Acrobat 8)'),
-        ('10400', 'PDF 1.1 - 1.3 (Acrobat 2 - 4)')
-    ]
+    def run_decrypt():
+        log_info(f'开始解密PDF文件: {path}', phase='decrypt')
+        result = decrypt_pdf(path, password, profile=profile, watermarks=watermarks)
+        metrics.observe('decrypt', result.elapsed)
+        return result
     
     try:
-        Config.validate()  # 验证hashcat是否存在
-        logger.info('hashcat验证通过')
-        
-        for mode, desc in hash_modes:
-            st.write(f'🔍 尝试模式: {desc}')
-            logger.info(f'开始尝试模式: {desc}')
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            log_area = st.empty()
-            error_log = st.empty()
-            
-            cmd = [
-                str(Config.HASHCAT_BIN),
-                '-d', '1',
-                '-m', mode,
-                '-a', '3',
-                '--increment',
-                '--increment-min', str(min_len),
-                '--increment-max', str(max_len),
-                tmp_path,
-                mask,
-                '--potfile-disable',
-                '--status',
-                '--status-timer', '1',
-                '-w', '4',  # 工作负载配置文件
-                '--force',  # 忽略警告
-                '-O'  # 优化内核以减少内存使用
-            ]
-            
-            # 记录开始执行的命令
-            logger.info(f'开始执行模式 {desc}')
-            logger.command(cmd, '开始执行...')
-            
-            process = Popen(cmd, stdout=PIPE, stderr=PIPE, text=True, bufsize=1, cwd=str(Config.HASHCAT_DIR))
-            start_time = time.time()
-            logger.info(f'进程启动时间: {datetime.fromtimestamp(start_time).strftime("%Y-%m-%d %H:%M:%S")}')
-            
-            # 收集完整的输出
-            output_lines = []
-            error_output = []
-            while True:
-                line = process.stderr.readline()
-                if not line and process.poll() is not None:
-                    break
-                
-                # 收集所有输出
-                output_lines.append(line.strip())
-                
-                # 收集错误信息
-                if 'ERROR' in line or 'FAILED' in line or 'WARNING' in line:
-                    error_output.append(line.strip())
-                    error_log.text('⚠️ ' + '\n'.join(error_output))
-                    logger.error(f'Mode {desc}: {line.strip()}')
-                
-                # 更新进度
-                progress = parse_hashcat_progress(line)
-                if progress is not None:
-                    progress_bar.progress(progress / 100)
-                    elapsed = time.time() - start_time
-                    status_msg = f'进度: {progress}% | 已用时间: {elapsed:.1f}秒'
-                    status_text.text(status_msg)
-                    logger.info(status_msg)
-                
-                # 显示详细日志
-                if 'Speed' in line:
-                    speed = re.search(r'Speed\.+:\s+([\d.]+ .H/s)', line)
-                    if speed:
-                        speed_msg = f'当前破解速度: {speed.group(1)}'
-                        log_area.text(speed_msg)
-                        log_info(speed_msg)
-                elif 'Recovered' in line:
-                    recovered = re.search(r'Recovered\.+:\s+(\d+)/(\d+)', line)
-                    if recovered and recovered.group(1) != '0':
-                        success_msg = f'✅ 使用模式 {desc} 破解成功！'
-                        st.success(success_msg)
-                        log_info(success_msg)
-                        password = None
-                        with open(tmp_path, 'r') as f:
-                            for line in f:
-                                if ':' in line:
-                                    password = line.split(':')[-1].strip()
-                                    log_info(f'找到密码: {password}')
-                                    break
-                        # 记录完整输出
-                        log_command(cmd, '\n'.join(output_lines))
-                        return password
-            
-            # 记录完整输出
-            log_command(cmd, '\n'.join(output_lines))
-            
-            # 显示失败原因
-            if error_output:
-                error_msg = f'❌ 模式 {desc} 失败原因：\n' + '\n'.join(error_output)
-                st.error(error_msg)
-                log_error(error_msg)
-            else:
-                msg = f'❌ 模式 {desc} 尝试失败，切换到下一个模式'
-                st.warning(msg)
-                log_info(msg)
-        
-        msg = '❌ 所有模式都尝试失败'
-        st.error(msg)
-        log_error(msg)
-        return None
-    except FileNotFoundError as e:
-        msg = f'❌ 错误：{str(e)}'
-        st.error(msg)
-        log_error(msg)
-        return None
-    except Exception as e:
-        msg = f'❌ 未知错误：{str(e)}'
-        st.error(msg)
-        log_error(msg)
-        return None
-    finally:
-        log_info(f'删除临时文件: {tmp_path}')
-        os.unlink(tmp_path)
-
-def decrypt_pdf(input_file, password, output_file):
-    try:
-        log_info(f'开始解密PDF文件: {input_file}')
-        with Pdf.open(input_file, password=password) as pdf:
-            pdf.save(output_file)
-            pdf.remove_all_restrictions()
-            log_info(f'PDF解密成功，已保存到: {output_file}')
+        result = memoized(('decrypt', content_key, password, profile, watermarks), run_decrypt)
     except Exception as e:
         msg = f'❌ PDF解密失败：{str(e)}'
         st.error(msg)
         log_error(msg)
+        return
+    if result.preview:
+        st.info(f'🧹 预演：{result.preview}')
+    if result.report:
+        st.caption(f'🧹 {result.report}')
+    st.download_button(
+        "📥 下载解密后的PDF",
+        result.data,
+        file_name="decrypted.pdf",
+        mime="application/pdf",
+        key=key
+    )
 
 def main():
+    start_metrics_server()
     st.title("📄 PDF解锁工具")
     uploaded_file = st.file_uploader("上传PDF文件", type="pdf")
+    st.sidebar.selectbox('解密后的保存方式', options=list(PROFILE_LABELS), format_func=PROFILE_LABELS.get,
+                         key='save_profile')
+    st.sidebar.selectbox('水印', options=list(WATERMARK_ACTIONS), format_func=WATERMARK_ACTIONS.get, key='watermarks',
+                         help='去掉水印注释、名为水印的图层和每页重复的图章；预演只显示会去掉的内容')
     
     if uploaded_file:
-        with st.spinner('⏳ 正在生成哈希...'):
-            hash_str = get_pdf_hash(uploaded_file.getvalue())
-            
-        if hash_str:
-            st.success("✅ 哈希生成成功！")
-            with st.expander("查看哈希详情"):
-                st.code(hash_str)
-            
-            # 在破解按钮前添加新的UI组件
-            mask_presets = {
-                '纯数字': '?d',  # 0-9
-                '小写字母': '?l',  # a-z
-                '大写字母': '?u',  # A-Z
-                '字母（大小写）': '?a',  # a-zA-Z
-                '字母数字': '?h',  # a-zA-Z0-9
-                '特殊字符': '?s',  # 特殊字符(!@#$等)
-                '全部字符': '?b',  # 所有可能字符
-                '自定义': ''
-            }
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                min_len = st.number_input('最小密码长度', 1, 48, 4)
-            with col2:
-                max_len = st.number_input('最大密码长度', 1, 48, 8)
-            
-            selected_mask = st.selectbox('预设掩码模式', options=list(mask_presets.keys()))
-            custom_mask = st.text_input('自定义掩码模式', disabled=(selected_mask != '自定义'))
-            pr
-            if st.button("🚀 开始破解"):
-                final_mask = custom_mask if selected_mask == '自定义' else mask_presets[selected_mask]
-                with st.spinner('⚡ 正在破解中...'):
-                    password = crack_pdf_hash(hash_str, final_mask, min_len, max_len)
-                    
-                if password:
-                    st.balloons()
-                    st.success(f"🎉 破解成功！密码是: {password}")
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
-                        decrypt_pdf(uploaded_file, password, tmp.name)
-                        with open(tmp.name, 'rb') as f:
-                            st.download_button(
-                                "📥 下载解密后的PDF",
-                                f.read(),
-                                file_name="decrypted.pdf",
-                                mime="application/pdf"
-                            )
+        handle_upload(uploaded_file)
+    show_jobs()
+
+def show_estimate(hash_str, attack, budget):
+    """显示预计耗时；超出预算时缩短长度范围，无法满足时返回None"""
+    if attack is None:
+        return None
+    try:
+        mode, _ = resolve_hash_mode(hash_str)
+        plan = build_plan(mode, [attack], budget)
+    except (UnsupportedHashError, ValueError, OSError) as e:
+        st.error(f'❌ {str(e)}')
+        return None
+    if not plan.stages:
+        stage = plan.rejected[0]
+        if stage.keyspace == 0:
+            st.error(f'❌ {describe_stage(stage)}')
+        else:
+            st.error(f'❌ {stage.keyspace:,} 个候选，预计需要 {format_duration(stage.seconds)}，'
+                     f'超出时间预算，请缩小字符集、长度范围或字典')
+        return None
+    stage = plan.stages[0]
+    if stage.trimmed:
+        st.warning(f'⚠️ 原长度范围超出时间预算，已缩短为 {stage.attack.min_len}-{stage.attack.max_len}：'
+                   f'{describe_stage(stage)}')
+    else:
+        st.info(f'📋 {describe_stage(stage)}')
+    return stage
+
+def handle_upload(uploaded_file):
+    """分诊上传的文件，需要破解时提交到后台队列；分诊和哈希提取按内容缓存"""
+    upload = spool_upload(uploaded_file)
+    if upload is None:
+        return
+    path = str(upload.path)
+    
+    def prepare():
+        prepared = prepare_pdf(path, upload.sha256)
+        observe_timings(prepared.timings)
+        return prepared
+    
+    with st.spinner('⏳ 正在检查是否需要破解...'):
+        start_time = time.time()
+        prepared = memoized(('prepare', upload.sha256), prepare)
+        elapsed = time.time() - start_time
+    triage = prepared.triage
+    count_once(uploaded_file, 'files', path=triage.path)
+    
+    if triage.path != PATH_CRACK:
+        st.success(f'⚡ 无需破解（处理路径: {TRIAGE_LABELS[triage.path]}，耗时 {elapsed * 1000:.0f} 毫秒）')
+        if triage.password:
+            st.info(f'密码是: {format_password(triage.password)}')
+        offer_download(path, triage.password, sha256=upload.sha256)
+        return
+    st.info(f'处理路径: {TRIAGE_LABELS[triage.path]}')
+    
+    hash_str = prepared.hash_str
+    cached = ResultCache().lookup(file_sha256=upload.sha256, hash_str=hash_str)
+    
+    if cached:
+        count_once(uploaded_file, 'cache_hits')
+        st.success(f'⚡ 命中结果缓存（模式 {cached.mode}），无需破解。密码是: {format_password(cached.password)}')
+        offer_download(path, cached.password, sha256=upload.sha256)
+    elif hash_str:
+        st.success("✅ 哈希生成成功！")
+        with st.expander("查看哈希详情"):
+            st.code(hash_str)
+        
+        budget_options = {'1小时': 3600, '1天': 86400, '7天': 7 * 86400, '30天': 30 * 86400, '不限': None}
+        budget_name = st.selectbox('时间预算', options=list(budget_options.keys()), index=2,
+                                   help='用于估算攻击范围，也是任务的最长运行时间，用完时结束hashcat')
+        attack_type = st.radio('攻击方式', ['掩码', '字典', '掩码文件'], horizontal=True)
+        if attack_type == '字典':
+            attack = select_dict_attack()
+        elif attack_type == '掩码文件':
+            attack = select_mask_file_attack()
         else:
-            msg = "⚠️ 该PDF未加密或格式异常"
-            st.warning(msg)
-            log_error(msg)
+            attack = select_mask_attack()
+        stage = show_estimate(hash_str, attack, budget_options[budget_name])
+        if st.button("🚀 开始破解", disabled=stage is None):
+            try:
+                job = get_worker_pool().submit(uploaded_file.name, hash_str, stage.attack, upload.path,
+                                               timeout=budget_options[budget_name], sha256=upload.sha256)
+                st.success(f'✅ 已加入破解队列（任务 {job.id}），关闭页面不会中断破解，稍后回来查看结果')
+            except UnsupportedHashError as e:
+                st.error(f'❌ hashcat无法处理该哈希：{str(e)}')
+    else:
+        count_once(uploaded_file, 'failed')
+        msg = "⚠️ 该PDF未加密或格式异常"
+        st.warning(msg)
+        log_error(msg)
+
+def select_mask_attack():
+    """掩码攻击的参数"""
+    mask_presets = {
+        '纯数字': '?d',  # 0-9
+        '小写字母': '?l',  # a-z
+        '大写字母': '?u',  # A-Z
+        '字母（大小写）': '?a',  # a-zA-Z
+        '字母数字': '?h',  # a-zA-Z0-9
+        '特殊字符': '?s',  # 特殊字符(!@#$等)
+        '全部字符': '?b',  # 所有可能字符
+        '自定义': ''
+    }
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        min_len = st.number_input('最小密码长度', 1, 48, 4)
+    with col2:
+        max_len = st.number_input('最大密码长度', 1, 48, 8)
+    
+    selected_mask = st.selectbox('预设掩码模式', options=list(mask_presets.keys()))
+    custom_mask = st.text_input('自定义掩码模式', disabled=(selected_mask != '自定义'))
+    final_mask = custom_mask if selected_mask == '自定义' else mask_presets[selected_mask]
+    return MaskAttack(final_mask, min_len, max_len) if final_mask else None
+
+def select_mask_file_attack():
+    """掩码目录中按可能性排序的.hcmask文件（mask_stats.py 生成），按文件顺序执行"""
+    mask_files = {path.name: path for path in available_mask_files()}
+    if not mask_files:
+        st.warning('⚠️ 掩码目录中没有.hcmask文件，请先运行 python app/mask_stats.py 生成')
+        return None
+    name = st.selectbox('掩码文件', options=list(mask_files.keys()))
+    return DictAttack(str(mask_files[name]), attack_mode=3)
+
+def select_dict_attack():
+    """字典攻击的参数：字典目录中的字典、hashcat自带的规则和可选的混合掩码"""
+    wordlists = {path.name: path for path in available_wordlists()}
+    if not wordlists:
+        st.warning('⚠️ 字典目录中没有字典文件，请放入字典后刷新页面')
+        return None
+    wordlist = st.selectbox('字典', options=list(wordlists.keys()))
+    hybrid = st.selectbox('混合攻击', options=['不使用', '字典后追加掩码', '字典前添加掩码'])
+    if hybrid == '不使用':
+        rules = {path.name: path for path in available_rules()}
+        selected = st.multiselect('规则', options=list(rules.keys()))
+        return DictAttack(str(wordlists[wordlist]), tuple(str(rules[name]) for name in selected))
+    mask = st.text_input('混合掩码', '?d?d?d?d')
+    if not mask:
+        return None
+    return DictAttack(str(wordlists[wordlist]), attack_mode=6 if hybrid == '字典后追加掩码' else 7, mask=mask)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+from io import BytesIO
+from typing import Iterable, NamedTuple, Optional, Union
+
+# 处理路径
+PATH_UNENCRYPTED = 'unencrypted'  # 未加密，直接去除限制
+PATH_EMPTY_USER = 'empty_user'    # 仅有所有者密码，空用户密码即可打开
+PATH_TRIVIAL = 'trivial'          # 内置弱密码命中
+PATH_CRACK = 'crack'              # 需要交给hashcat破解
+
+TRIAGE_LABELS = {
+    PATH_UNENCRYPTED: '未加密',
+    PATH_EMPTY_USER: '空用户密码直接打开',
+    PATH_TRIVIAL: '弱密码命中',
+    PATH_CRACK: 'hashcat破解',
+}
+
+# 内置弱密码列表，空密码单独检查
+TRIVIAL_PASSWORDS = (
+    '1234', '12345', '123456', '1234567', '12345678', '123456789', '0000',
+    '000000', '111111', '888888', '666666', '123123', 'password', 'Password',
+    'passw0rd', 'admin', 'pdf', 'PDF', 'test', 'qwerty', 'abc123', 'owner',
+    'user', 'secret',
+)
+
+
+class TriageResult(NamedTuple):
+    path: str
+    password: Optional[bytes] = None
+
+
+def triage_pdf(pdf_file: Union[str, bytes],
+               candidates: Iterable[str] = TRIVIAL_PASSWORDS) -> TriageResult:
+    """破解前的分诊：检查空用户密码和内置弱密码，能打开的PDF无需启动hashcat
+
+    Args:
+        pdf_file: PDF文件路径或文件内容
+        candidates: 空密码之后依次尝试的候选密码
+
+    Returns:
+        TriageResult，path为处理路径，password为可用于解密的密码字节
+    """
+    # 用到时才加载pyhanko，只需要处理路径常量的模块（如命令行 --help）不受影响
+    from pyhanko.pdf_utils.misc import PdfReadError
+    try:
+        if isinstance(pdf_file, str):
+            with open(pdf_file, 'rb') as f:
+                return _triage_stream(f, candidates)
+        else:
+            return _triage_stream(BytesIO(pdf_file), candidates)
+    except (PdfReadError, RuntimeError) as e:
+        print(f"Error processing PDF: {e}")
+        return TriageResult(PATH_CRACK)
+
+
+def _triage_stream(stream, candidates) -> TriageResult:
+    from pyhanko.pdf_utils.reader import PdfFileReader
+    pdf = PdfFileReader(stream)
+    if not pdf.encrypt_dict:
+        return TriageResult(PATH_UNENCRYPTED, b'')
+
+    # 空用户密码由安全处理器按/U校验，成功即说明只设置了所有者密码
+    if _try_password(pdf, b''):
+        return TriageResult(PATH_EMPTY_USER, b'')
+
+    for password in candidates:
+        # 按字节尝试，命中的字节就是解密时使用的密码
+        password = password.encode('utf-8')
+        if _try_password(pdf, password):
+            return TriageResult(PATH_TRIVIAL, password)
+    return TriageResult(PATH_CRACK)
+
+
+def _try_password(pdf, password: bytes) -> bool:
+    from pyhanko.pdf_utils.crypt import AuthStatus
+    from pyhanko.pdf_utils.misc import PdfReadError
+    try:
+        result = pdf.decrypt(password)
+    except (PdfReadError, ValueError):
+        return False
+    return result.status != AuthStatus.FAILED
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Callable, Hashable, NamedTuple, Optional
+from config import Config
+
+# 流式写入和计算SHA-256的块大小
+CHUNK_SIZE = 1024 * 1024
+
+# 分诊结果、哈希等小对象在缓存中按这个大小计
+SMALL_ENTRY = 1024
+
+
+def entry_size(value) -> int:
+    """缓存条目的大致大小：字节串和BytesIO按长度，元组按各项之和，其他按SMALL_ENTRY"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, BytesIO):
+        with value.getbuffer() as view:
+            return view.nbytes
+    if isinstance(value, tuple):
+        return sum(entry_size(item) for item in value) or SMALL_ENTRY
+    return SMALL_ENTRY
+
+
+class SizedLRU:
+    """按总大小限制的LRU缓存，超过max_bytes时淘汰最久未用的条目，可以从多个线程访问
+
+    单个超过max_bytes的值不缓存，只返回给调用方。
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = Config.MEMO_MAX_BYTES if max_bytes is None else max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # 键 -> (值, 大小)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key: Hashable, value, size: Optional[int] = None):
+        size = entry_size(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        """命中时直接返回，否则计算并缓存；并发的相同计算不去重，结果相同"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SpooledUpload(NamedTuple):
+    sha256: str
+    path: Path
+    size: int
+
+
+class UploadSpool:
+    """把上传的文件流式写入磁盘一次，按SHA-256命名；相同内容只保存一份
+
+    目录总大小超过max_bytes时删除最久未用的文件。分诊、哈希提取和解密都从这个路径读取，
+    不再反复复制上传内容。
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Path(directory or Config.UPLOAD_DIR)
+        self.max_bytes = Config.UPLOAD_SPOOL_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, sha256: str) -> Path:
+        return self.directory / f'{sha256}.pdf'
+
+    def spool(self, stream: BinaryIO) -> SpooledUpload:
+        """从头读取stream写入磁盘，返回内容的SHA-256和保存路径"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        stream.seek(0)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while chunk := stream.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            path = self.path(digest.hexdigest())
+            with self._lock:
+                if path.exists():
+                    os.remove(tmp)
+                    os.utime(path)  # 标记为最近使用
+                else:
+                    os.replace(tmp, path)
+                self._evict(keep=path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        finally:
+            stream.seek(0)
+        return SpooledUpload(digest.hexdigest(), path, size)
+
+    def touch(self, upload: SpooledUpload) -> bool:
+        """标记为最近使用，文件已被淘汰时返回False"""
+        try:
+            os.utime(upload.path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _evict(self, keep: Path):
+        files = []
+        for path in self.directory.glob('*.pdf'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,325 @@
+import multiprocessing
+import re
+from functools import partial
+from io import BytesIO
+from os import PathLike
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from pikepdf import Array, Dictionary, Name, Pdf, parse_content_stream, unparse_content_stream
+from config import Config
+
+# 内容流中绘制XObject的指令（/Name Do）
+_DO_PATTERN = re.compile(rb'/([^\s/\[\]()<>{}%]+)\s*Do\b')
+
+# 图层名中表示水印的关键字
+_LAYER_PATTERN = re.compile(r'watermark|水印|wasserzeichen|filigrane', re.IGNORECASE)
+
+ObjGen = Tuple[int, int]
+
+
+class Watermarks(NamedTuple):
+    """检测到的水印：图层、XObject（对象号 -> 说明）和需要逐页处理内容流的页"""
+    layers: Dict[ObjGen, str]
+    xobjects: Dict[ObjGen, str]
+    pages: List[int]
+
+
+class WatermarkReport(NamedTuple):
+    pages: int              # 内容流被修改的页数
+    annotations: int        # /Watermark 注释
+    sections: int           # 水印标记内容（/Artifact /Watermark 和水印图层的 /OC 段）
+    stamps: int             # 重复的XObject图章的绘制次数
+    layers: Tuple[str, ...]
+    xobjects: Tuple[str, ...]
+
+    @property
+    def empty(self) -> bool:
+        return not (self.annotations or self.sections or self.stamps or self.layers)
+
+    def describe(self) -> str:
+        if self.empty:
+            return '未发现水印'
+        parts = []
+        if self.annotations:
+            parts.append(f'水印注释 {self.annotations} 个')
+        if self.sections:
+            parts.append(f'水印标记内容 {self.sections} 段')
+        if self.stamps:
+            parts.append(f'重复图章 {self.stamps} 处（{", ".join(self.xobjects)}）')
+        if self.layers:
+            parts.append(f'水印图层 {", ".join(self.layers)}')
+        return f'{"、".join(parts)}，涉及 {self.pages} 页'
+
+
+def _inherited(page, key):
+    """页面自身或页面树上继承的属性"""
+    node = page
+    for _ in range(64):  # 防止损坏的循环引用
+        if node is None:
+            return None
+        value = node.get(key)
+        if value is not None:
+            return value
+        node = node.get(Name.Parent)
+    return None
+
+
+def _named(resources, category) -> Dict[str, ObjGen]:
+    """资源字典中某类资源的 名字 -> 对象号（直接对象没有对象号，不会被当作水印）"""
+    if resources is None or category not in resources:
+        return {}
+    return {str(name)[1:]: obj.objgen for name, obj in resources[category].items() if obj.is_indirect}
+
+
+def _content(page) -> bytes:
+    contents = page.get(Name.Contents)
+    if contents is None:
+        return b''
+    if isinstance(contents, Array):
+        return b'\n'.join(stream.read_bytes() for stream in contents)
+    return contents.read_bytes()
+
+
+def _is_acrobat_watermark(xobject) -> bool:
+    """Acrobat“添加水印”生成的表单XObject带有 /PieceInfo /ADBE_CompoundType /Private /Watermark"""
+    try:
+        return xobject.PieceInfo.ADBE_CompoundType.Private == Name.Watermark
+    except (AttributeError, KeyError, TypeError):
+        return False
+
+
+def find_watermarks(pdf: Pdf, stamp_ratio: Optional[float] = None) -> Watermarks:
+    """检测常见的水印：名字像水印的可选内容图层、Acrobat水印XObject、
+    在至少stamp_ratio比例的页面上绘制的同一个XObject（重复图章，默认不检测：信头和Logo也每页都有）
+
+    只用正则扫描内容流中的绘制指令，不做完整解析，大文档也很快。
+    """
+    stamp_ratio = Config.WATERMARK_STAMP_RATIO if stamp_ratio is None else stamp_ratio
+    layers = {}
+    properties = pdf.Root.get(Name.OCProperties)
+    if properties is not None:
+        for ocg in properties.get(Name.OCGs, []):
+            name = str(ocg.get(Name.Name, ''))
+            if ocg.is_indirect and _LAYER_PATTERN.search(name):
+                layers[ocg.objgen] = name
+
+    xobjects = {}
+    checked = set()
+    drawn = {}  # 对象号 -> 绘制它的页数
+    pages = []  # (页序号, 绘制的XObject, 是否可能含水印标记内容)
+    for index, page in enumerate(pdf.pages):
+        page = page.obj
+        data = _content(page)
+        names = _named(_inherited(page, Name.Resources), Name.XObject)
+        used = {names[name] for name in (raw.decode('latin-1') for raw in _DO_PATTERN.findall(data))
+                if name in names}
+        for objgen in used:
+            drawn[objgen] = drawn.get(objgen, 0) + 1
+            if objgen not in checked:
+                checked.add(objgen)
+                xobject = pdf.get_object(objgen)
+                oc = xobject.get(Name.OC)
+                if _is_acrobat_watermark(xobject):
+                    xobjects[objgen] = f'Acrobat水印 {objgen[0]} 0 R'
+                elif oc is not None and oc.is_indirect and oc.objgen in layers:
+                    xobjects[objgen] = f'图层 {layers[oc.objgen]} 中的 {objgen[0]} 0 R'
+        pages.append((index, used, b'/Watermark' in data or bool(layers and b'/OC' in data)))
+
+    total = len(pdf.pages)
+    if total >= Config.WATERMARK_STAMP_MIN_PAGES and stamp_ratio:
+        for objgen, count in drawn.items():
+            if objgen not in xobjects and count >= total * stamp_ratio:
+                xobjects[objgen] = f'{objgen[0]} 0 R（{count}/{total} 页）'
+
+    # 只有绘制了水印XObject或可能含水印标记内容的页需要解析内容流
+    return Watermarks(layers, xobjects, [index for index, used, marked in pages
+                                         if marked or any(objgen in xobjects for objgen in used)])
+
+
+def _is_watermark_section(operands, properties, layers) -> bool:
+    """BDC的标记内容是否为水印：/Artifact <</Subtype /Watermark>> 或属于水印图层的 /OC"""
+    if len(operands) < 2:
+        return False
+    tag, props = operands[0], operands[1]
+    if isinstance(props, Name):
+        props = properties.get(str(props)[1:])
+    if props is None:
+        return False
+    if tag == Name.OC:
+        return props.is_indirect and props.objgen in layers
+    return tag == Name.Artifact and isinstance(props, Dictionary) and props.get(Name.Subtype) == Name.Watermark
+
+
+def filter_page(page, xobjects: Iterable[ObjGen], layers: Iterable[ObjGen]) -> Tuple[Optional[bytes], int, int]:
+    """去掉一页内容流中的水印，返回 (新内容流, 去掉的标记内容段数, 去掉的图章绘制次数)
+
+    内容没有变化时新内容流为None。
+    """
+    xobjects, layers = set(xobjects), set(layers)
+    resources = _inherited(page, Name.Resources)
+    names = {name for name, objgen in _named(resources, Name.XObject).items() if objgen in xobjects}
+    properties = {}
+    if resources is not None and Name.Properties in resources:
+        properties = {str(name)[1:]: obj for name, obj in resources.Properties.items()}
+
+    result = []
+    sections = stamps = 0
+    depth = 0  # 大于0时位于要去掉的标记内容中，值为嵌套层数
+    for instruction in parse_content_stream(page):
+        operator = str(instruction.operator)
+        if depth:
+            if operator in ('BMC', 'BDC'):
+                depth += 1
+            elif operator == 'EMC':
+                depth -= 1
+            continue
+        if operator == 'BDC' and _is_watermark_section(instruction.operands, properties, layers):
+            depth = 1
+            sections += 1
+            continue
+        if operator == 'Do' and str(instruction.operands[0])[1:] in names:
+            stamps += 1
+            continue
+        result.append(instruction)
+    if not sections and not stamps:
+        return None, 0, 0
+    return unparse_content_stream(result), sections, stamps
+
+
+# 工作进程中打开的文档和检测结果
+_pdf = None
+_xobjects = ()
+_layers = ()
+
+
+def _init_worker(source, password, xobjects, layers):
+    global _pdf, _xobjects, _layers
+    _pdf = _open(source, password)
+    _xobjects, _layers = xobjects, layers
+
+
+def _filter_pages(indices: List[int], dry_run: bool = False) -> List[Tuple[int, Optional[bytes], int, int]]:
+    """在工作进程中处理一批页面，返回 (页序号, 新内容流, 标记内容段数, 图章绘制次数)"""
+    results = []
+    for index in indices:
+        data, sections, stamps = filter_page(_pdf.pages[index].obj, _xobjects, _layers)
+        results.append((index, None if dry_run else data, sections, stamps))
+    return results
+
+
+def _open(source, password) -> Pdf:
+    """打开路径、字节或文件对象（与 decrypt.open_pdf 相同，这里不能导入decrypt）"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    elif not isinstance(source, (str, PathLike)):
+        source.seek(0)
+    return Pdf.open(source, password=password or '')
+
+
+def _picklable(source):
+    """传给工作进程的源文件：路径或字节；文件对象读出全部内容，不改变它的读取位置"""
+    if isinstance(source, (str, PathLike)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    position = source.tell()
+    try:
+        source.seek(0)
+        return source.read()
+    finally:
+        source.seek(position)
+
+
+def _batches(items: List[int], size: int) -> Iterable[List[int]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _remove_layers(pdf: Pdf, layers):
+    """从 /OCProperties 的图层列表和默认配置中去掉水印图层"""
+    properties = pdf.Root.get(Name.OCProperties)
+    if properties is None:
+        return
+
+    def keep(array):
+        kept = []
+        for item in array:
+            if isinstance(item, Array):
+                item = Array(keep(item))
+            elif getattr(item, 'is_indirect', False) and item.objgen in layers:
+                continue
+            kept.append(item)
+        return kept
+
+    properties.OCGs = Array(keep(properties.get(Name.OCGs, [])))
+    config = properties.get(Name.D)
+    if config is not None:
+        for key in (Name.ON, Name.OFF, Name.Order, Name.Locked):
+            if key in config:
+                config[key] = Array(keep(config[key]))
+
+
+def strip_watermarks(pdf: Pdf, source=None, password: Optional[Union[str, bytes]] = None, dry_run: bool = False,
+                     processes: Optional[int] = None) -> WatermarkReport:
+    """逐页去掉检测到的水印，dry_run为True时只统计不修改
+
+    给出source（路径或字节）且需要处理的页数不少于 Config.WATERMARK_INLINE_PAGES 时，
+    页面分批交给进程池解析和重写内容流，由本进程写回；进程池的子进程中总是逐页串行处理。
+    """
+    found = find_watermarks(pdf)
+    pages = [page.obj for page in pdf.pages]
+    annotations = 0
+    for page in pages:
+        annots = page.get(Name.Annots)
+        if annots is None:
+            continue
+        kept = [annot for annot in annots if not (
+            annot.get(Name.Subtype) == Name.Watermark
+            or (annot.get(Name.OC) is not None and annot.OC.is_indirect and annot.OC.objgen in found.layers))]
+        if len(kept) != len(annots):
+            annotations += len(annots) - len(kept)
+            if not dry_run:
+                page.Annots = Array(kept)
+
+    processes = processes or Config.WATERMARK_PROCESSES
+    xobjects, layers = tuple(found.xobjects), tuple(found.layers)
+    if (source is None or processes <= 1 or len(found.pages) < Config.WATERMARK_INLINE_PAGES
+            or multiprocessing.parent_process() is not None):
+        results = [(index, *filter_page(pages[index], xobjects, layers)) for index in found.pages]
+    else:
+        source = _picklable(source)
+        size = max(1, min(Config.WATERMARK_BATCH_PAGES, len(found.pages) // processes + 1))
+        # spawn可以安全地在多线程的服务进程（如Streamlit后台线程）中使用
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes, initializer=_init_worker, initargs=(source, password, xobjects, layers)) as pool:
+            work = pool.imap(partial(_filter_pages, dry_run=dry_run), _batches(found.pages, size))
+            results = [result for batch in work for result in batch]
+
+    changed = sections = stamps = 0
+    for index, data, page_sections, page_stamps in results:
+        if not page_sections and not page_stamps:
+            continue
+        changed += 1
+        sections += page_sections
+        stamps += page_stamps
+        if not dry_run:
+            pages[index].Contents = pdf.make_stream(data)
+    if not dry_run:
+        if found.layers:
+            _remove_layers(pdf, found.layers)
+        for page in pages:
+            # 已不再绘制的水印XObject从页面资源中去掉，保存时不再写出
+            resources = _inherited(page, Name.Resources)
+            if resources is not None and Name.XObject in resources:
+                for name, objgen in _named(resources, Name.XObject).items():
+                    if objgen in found.xobjects:
+                        del resources.XObject[f'/{name}']
+    return WatermarkReport(changed, annotations, sections, stamps, tuple(found.layers.values()),
+                           tuple(found.xobjects.values()))
+
+
+def inspect(source, password: Optional[Union[str, bytes]] = None) -> WatermarkReport:
+    """只检测不修改：报告去水印时会去掉的内容"""
+    with _open(source, password) as pdf:
+        return strip_watermarks(pdf, source, password, dry_run=True)
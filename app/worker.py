@@ -0,0 +1,227 @@
+import asyncio
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Union
+from config import Config
+from dictionary import metadata_candidates
+from engine import Engine, JobResult, Reporter
+from hashcat_driver import format_speed
+from hash_modes import mode_description, resolve_hash_mode
+from jobs import (JobStore, read_outfile, ORIGIN_WEB, STATUS_ABANDONED, STATUS_FAILED,
+                  STATUS_FINISHED, STATUS_INTERRUPTED, STATUS_PENDING, STATUS_QUEUED)
+from pdf_logger import PdfLogger, log_info
+from result_cache import ResultCache, file_sha256
+from shard import parse_workers
+import metrics
+
+# 进度写入数据库的最小间隔（秒）
+PROGRESS_INTERVAL = 1.0
+
+
+class JobReporter(Reporter):
+    """把hashcat进度按PROGRESS_INTERVAL写入任务记录，页面从数据库读取
+
+    任务在数据库中已被放弃（如另一个服务进程取消了它）时结束该任务的hashcat。
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._last_update = {}  # 任务ID -> 上次写入的时间
+
+    def progress(self, job, event):
+        now = time.time()
+        if now - self._last_update.get(job.id, 0.0) < PROGRESS_INTERVAL:
+            return
+        self._last_update[job.id] = now
+        current = self.pool.store.get(job.id)
+        if current is None or current.status == STATUS_ABANDONED:
+            self.pool.engine.cancel(job.id)
+            return
+        fields = {'progress': event.progress}
+        # 结束时的状态不再包含设备速度，保留最后一次测得的速度
+        if event.speeds:
+            fields['speed'] = format_speed(sum(event.speeds.values()))
+        self.pool.store.update(job, **fields)
+
+    def forget(self, job):
+        self._last_update.pop(job.id, None)
+
+
+class WorkerPool:
+    """后台破解进程池，持有所有hashcat进程
+
+    任务排队保存在JobStore中，页面只负责提交任务和查询状态，
+    页面重跑或关闭都不会影响正在运行的hashcat。任务由后台线程中的一个事件循环执行，
+    同时最多size个，hashcat和快速验证由Engine运行。
+    """
+
+    def __init__(self, size=None, store=None, poll_interval=2.0):
+        self.size = size or Config.MAX_GPU_JOBS
+        self.store = store or JobStore()
+        self.poll_interval = poll_interval
+        self.reporter = JobReporter(self)
+        self.engine = None
+        self._loop = None
+        self._wakeup = None
+        self._stopping = False
+        self._thread = None
+        self._tasks = {}  # 任务ID -> asyncio.Task
+
+    def start(self):
+        """启动事件循环线程，服务重启前中断的任务会从还原点继续"""
+        requeued = self.store.requeue_interrupted(ORIGIN_WEB)
+        if requeued:
+            log_info(f'重新排队 {requeued} 个中断的任务', phase='hashcat')
+        ready = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._serve(ready)), name='hashcat-workers',
+                                        daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """停止取新任务；运行中的hashcat写入还原点后退出，任务标记为中断"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._request_stop)
+
+    def _request_stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def _notify(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def submit(self, pdf_name, hash_str, attack, source: Union[bytes, str, Path], devices=None, timeout=None,
+               sha256=None):
+        """提交破解任务（掩码或字典攻击），无法处理的哈希会抛出UnsupportedHashError
+
+        source是PDF的内容或路径（如网页端落盘的上传文件），sha256已知时不再重新计算。
+
+        devices是传给hashcat -d 的设备列表，默认取 Config.HASHCAT_DEVICES；
+        配置了 PDFJOKER_WORKERS 时任务改为分片给这些工作进程。
+        timeout是任务的墙钟时间预算（秒），用完时结束hashcat，None表示不限。
+        """
+        mode, _ = resolve_hash_mode(hash_str)
+        job = self.store.create_for_attack(pdf_name, [hash_str], mode, attack,
+                                           origin=ORIGIN_WEB, status=STATUS_PENDING, timeout=timeout)
+        # 保存上传的文件，破解完成后解密供下载
+        source_path = job.job_dir / 'source.pdf'
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source_path.write_bytes(source)
+        else:
+            try:
+                # 硬链接避免复制大文件，落盘目录淘汰该文件也不影响任务
+                os.link(source, source_path)
+            except OSError:
+                shutil.copyfile(source, source_path)
+        cmd = job.build_command(devices)
+        sources = [{'path': str(source_path), 'sha256': sha256 or file_sha256(source),
+                    'hash': hash_str, 'name': pdf_name}]
+        self.store.update(job, sources=sources, command=cmd, status=STATUS_QUEUED)
+        self._notify()
+        return job
+
+    def resume(self, job) -> bool:
+        """把一个中断的任务重新排队，从还原点继续"""
+        if not self.store.requeue(job.id):
+            return False
+        self._notify()
+        return True
+
+    def cancel(self, job):
+        """取消排队或运行中的任务，运行中的hashcat进程组立即被结束"""
+        if self.engine is not None:
+            self.engine.cancel(job.id)
+        self.store.abandon(job)
+
+    async def _serve(self, ready):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.engine = Engine(gpu_limit=self.size, reporter=self.reporter, store=self.store)
+        ready.set()
+        try:
+            while not self._stopping:
+                job = self.store.claim(ORIGIN_WEB) if len(self._tasks) < self.size else None
+                if job is not None:
+                    task = asyncio.create_task(self._execute(job), name=f'job-{job.id}')
+                    self._tasks[job.id] = task
+                    task.add_done_callback(lambda _, job_id=job.id: self._done(job_id))
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    # 运行它的服务进程已退出的任务标记为中断，由用户在页面上选择继续
+                    self.store.interrupted(ORIGIN_WEB)
+                self._wakeup.clear()
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            self.engine.close()
+
+    def _done(self, job_id):
+        self._tasks.pop(job_id, None)
+        self._wakeup.set()
+
+    def _abandoned(self, job) -> bool:
+        current = self.store.get(job.id)
+        return current is None or current.status == STATUS_ABANDONED
+
+    async def _execute(self, job):
+        logger = PdfLogger(job.pdf_name, job=job.id, mode=job.mode)
+        result = JobResult(STATUS_INTERRUPTED, {})
+        try:
+            hash_strs = job.hashes()
+            # 上次运行可能已经破解成功，只是没来得及记录
+            recovered = read_outfile(job.out_file, hash_strs)
+            # 新任务先在CPU上快速验证文档元数据候选和常见密码，命中时无需启动hashcat
+            if (len(recovered) < len(hash_strs) and Config.QUICK_PASS_LIMIT
+                    and not job.restore_file.exists() and not job.shards_file.exists()):
+                self.store.update(job, message='正在快速验证常见密码')
+                candidates = await asyncio.to_thread(
+                    lambda: [c for source in job.sources
+                             for c in metadata_candidates(source['path'], source.get('name'))])
+                recovered = await self.engine.quick_pass(hash_strs, candidates)
+                if len(recovered) < len(hash_strs):
+                    self.store.update(job, message=None)
+                else:
+                    logger.info(f'任务 {job.id} 快速验证命中', phase='quick_pass')
+            if len(recovered) == len(hash_strs):
+                result = JobResult(STATUS_FINISHED, recovered)
+                self.engine.record(job, result)
+            elif self._abandoned(job):
+                # 快速验证期间被取消
+                result = JobResult(STATUS_ABANDONED, {})
+            else:
+                logger.info(f'任务 {job.id} 开始执行', phase='hashcat')
+                result = await self.engine.run_job(job, mode_description(job.mode), cmd=job.resume_command(),
+                                                   workers=parse_workers(Config.SHARD_WORKERS), keep_files=True)
+        except asyncio.CancelledError:
+            # 服务停止：run_job已经记录了中断，快速验证期间停止时在这里记录
+            self.store.update(job, status=STATUS_INTERRUPTED, pid=None)
+            raise
+        except Exception as e:
+            result = JobResult(STATUS_FAILED, {}, str(e))
+            logger.error(f'任务 {job.id} 失败: {result.message}', phase='finish')
+            self.engine.record(job, result)
+        finally:
+            self.reporter.forget(job)
+        self._finish(job, result, logger)
+
+    def _finish(self, job, result, logger):
+        """成功的结果写入缓存，结束的任务清理会话文件；任务记录已由Engine更新"""
+        if result.status == STATUS_FINISHED:
+            cache = ResultCache()
+            for source in job.sources:
+                if source['hash'] in result.recovered:
+                    cache.store(source.get('sha256'), source['hash'], result.recovered[source['hash']], job.mode)
+            metrics.inc('cracked', sum(source['hash'] in result.recovered for source in job.sources))
+            logger.info(f'任务 {job.id} 破解成功', phase='finish')
+        elif result.status == STATUS_FAILED:
+            metrics.inc('failed', len(job.sources))
+        if result.status in (STATUS_FINISHED, STATUS_FAILED):
+            self.store.remove_session_files(job)
@@ -0,0 +1,124 @@
+"""生成基准测试用的加密PDF语料（已知密码）"""
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+from pikepdf import Dictionary, Encryption, Name, Pdf, Stream
+
+# 加密方式 -> pikepdf参数；R5只能借助qpdf命令行生成
+ENCRYPTIONS = {
+    'r2-rc4-40': {'R': 2, 'aes': False},
+    'r3-rc4-128': {'R': 3, 'aes': False},
+    'r4-rc4-128': {'R': 4, 'aes': False},
+    'r4-aes-128': {'R': 4, 'aes': True},
+    'r5-aes-256': {'R': 5, 'aes': True},
+    'r6-aes-256': {'R': 6, 'aes': True},
+}
+
+SIZES = {
+    '10k': 10 * 1024,
+    '1m': 1024 ** 2,
+    '50m': 50 * 1024 ** 2,
+    '500m': 500 * 1024 ** 2,
+}
+
+PROFILES = {
+    'quick': ['10k', '1m'],
+    'full': list(SIZES),
+}
+
+# 每页图片的最大字节数，大文件拆成多页
+CHUNK_SIZE = 4 * 1024 * 1024
+OWNER_PASSWORD = 'pdfjoker-bench-owner'
+
+
+def _add_page(pdf, rng, size):
+    """添加一页，内容是不可压缩的随机灰度图，使文件大小接近目标"""
+    width = 1024
+    height = max(1, size // width)
+    image = Stream(pdf, rng.randbytes(width * height))
+    image.Type = Name.XObject
+    image.Subtype = Name.Image
+    image.Width = width
+    image.Height = height
+    image.ColorSpace = Name.DeviceGray
+    image.BitsPerComponent = 8
+    content = Stream(pdf, b'q 612 0 0 792 0 0 cm /Im0 Do Q')
+    pdf.add_blank_page(page_size=(612, 792))
+    page = pdf.pages[-1]
+    page.Resources = Dictionary(XObject=Dictionary(Im0=image))
+    page.Contents = content
+
+
+def build_pdf(path, size, encryption, password, seed=0):
+    """生成一个大约size字节、用password加密的PDF"""
+    rng = random.Random(seed)
+    path = Path(path)
+    with Pdf.new() as pdf:
+        remaining = size
+        while remaining > 0:
+            chunk = min(remaining, CHUNK_SIZE)
+            _add_page(pdf, rng, chunk)
+            remaining -= chunk
+        pdf.docinfo['/Title'] = f'pdfjoker benchmark {path.stem}'
+        if encryption['R'] == 5:
+            return _build_r5(pdf, path, password)
+        # pikepdf只在AES加密时支持加密元数据，RC4需要显式关闭
+        pdf.save(path, encryption=Encryption(owner=OWNER_PASSWORD, user=password, R=encryption['R'],
+                                             aes=encryption['aes'], metadata=encryption['aes']),
+                 compress_streams=False)
+    return True
+
+
+def _build_r5(pdf, path, password):
+    """pikepdf不支持写入R5，用qpdf命令行加密；没有qpdf时跳过"""
+    qpdf = shutil.which('qpdf')
+    if qpdf is None:
+        return False
+    plain = path.with_suffix('.plain.pdf')
+    pdf.save(plain, compress_streams=False)
+    try:
+        subprocess.run([qpdf, '--allow-weak-crypto', '--encrypt', password, OWNER_PASSWORD, '256',
+                        '--force-R5', '--', str(plain), str(path)], check=True, capture_output=True)
+    except subprocess.CalledProcessError:
+        return False
+    finally:
+        plain.unlink(missing_ok=True)
+    return True
+
+
+def build_corpus(directory, profile='quick'):
+    """生成（或复用）语料并返回清单；已存在且大小一致的文件不会重新生成"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / 'manifest.json'
+    previous = {}
+    if manifest_path.exists():
+        previous = {case['name']: case for case in json.loads(manifest_path.read_text())}
+
+    cases = []
+    for seed, (size_name, enc_name) in enumerate(
+            (s, e) for s in PROFILES[profile] for e in ENCRYPTIONS):
+        name = f'{enc_name}-{size_name}'
+        path = directory / f'{name}.pdf'
+        # 4-6位数字密码，用默认掩码（?d 长度4-8）就能破解
+        password = str(random.Random(seed).randrange(1000, 999999))
+        old = previous.get(name)
+        if not (old and path.exists() and old['target_size'] == SIZES[size_name]):
+            print(f'生成 {name} ...')
+            if not build_pdf(path, SIZES[size_name], ENCRYPTIONS[enc_name], password, seed):
+                print(f'  跳过 {name}：需要qpdf命令行生成R5文件')
+                continue
+        else:
+            password = old['password']
+        cases.append({
+            'name': name,
+            'path': str(path),
+            'encryption': enc_name,
+            'target_size': SIZES[size_name],
+            'size': path.stat().st_size,
+            'password': password,
+        })
+    manifest_path.write_text(json.dumps(cases, indent=2))
+    return cases
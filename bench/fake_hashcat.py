@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""基准测试用的hashcat替身：按 --status-json 格式输出进度，从清单中“破解”已知密码
+
+密码表由环境变量 PDFJOKER_BENCH_PASSWORDS 指定（JSON，哈希 -> 密码），
+模拟的运行时长由 PDFJOKER_FAKE_SECONDS 指定（默认1秒）。
+
+分片运行（--skip/--limit）时按 PDFJOKER_FAKE_SPEED（每秒的基础密钥空间）模拟时长，
+只有密码落在 [skip, skip + limit) 内才“破解”；--keyspace 输出掩码或字典的基础密钥空间。
+设置 PDFJOKER_FAKE_CRASH 为一个文件路径时，第一个分片进程运行到一半被SIGKILL
+（用该文件做标记），用于测试块的重新排队。
+"""
+import json
+import math
+import os
+import signal
+import string
+import sys
+import time
+
+SPEED = 1_000_000  # 模拟的H/s
+
+CHARSETS = {
+    'l': string.ascii_lowercase, 'u': string.ascii_uppercase, 'd': string.digits,
+    'h': '0123456789abcdef', 'H': '0123456789ABCDEF', 's': ' ' + string.punctuation,
+}
+CHARSETS['a'] = CHARSETS['l'] + CHARSETS['u'] + CHARSETS['d'] + CHARSETS['s']
+
+
+def _arg(argv, name, default=None):
+    return argv[argv.index(name) + 1] if name in argv else default
+
+
+def _positionals(argv):
+    """去掉选项后的位置参数（哈希文件、字典、掩码）"""
+    flags = {'--status', '--status-json', '--force', '-O', '--potfile-disable', '--restore-disable',
+             '--keyspace', '--increment'}
+    args = []
+    i = 1
+    while i < len(argv):
+        if argv[i] in flags:
+            i += 1
+        elif argv[i].startswith('-') and len(argv[i]) > 1:
+            i += 2
+        else:
+            args.append(argv[i])
+            i += 1
+    return args
+
+
+def _mask_charsets(mask):
+    charsets = []
+    i = 0
+    while i < len(mask):
+        if mask[i] == '?' and i + 1 < len(mask):
+            charsets.append(CHARSETS.get(mask[i + 1], mask[i + 1]))
+            i += 2
+        else:
+            charsets.append(mask[i])
+            i += 1
+    return charsets
+
+
+def _mask_index(charsets, password):
+    """密码在掩码中的序号，不属于该掩码时返回None"""
+    if len(password) != len(charsets):
+        return None
+    index = 0
+    for charset, char in zip(charsets, password):
+        if char not in charset:
+            return None
+        index = index * len(charset) + charset.index(char)
+    return index
+
+
+def _read_lines(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return [line.rstrip('\r\n') for line in f]
+
+
+def keyspace(argv):
+    """基础密钥空间：掩码为全部候选数，字典攻击为字典行数"""
+    attack_mode = _arg(argv, '-a', '0')
+    positionals = _positionals(argv)  # --keyspace 不带哈希文件
+    if attack_mode == '3':
+        return math.prod(len(charset) for charset in _mask_charsets(positionals[-1]))
+    return len(_read_lines(positionals[-1] if attack_mode == '7' else positionals[0]))
+
+
+def _index(argv, password):
+    """密码在本次攻击中的基础密钥空间序号"""
+    attack_mode = _arg(argv, '-a', '0')
+    positionals = _positionals(argv)
+    if attack_mode == '3':
+        return _mask_index(_mask_charsets(positionals[-1]), password)
+    wordlist = positionals[2] if attack_mode == '7' else positionals[1]
+    lines = _read_lines(wordlist)
+    return lines.index(password) if password in lines else None
+
+
+def _plain(password):
+    """像hashcat的 --outfile-autohex 一样输出明文：含冒号、控制字符或形如 $HEX[...] 时写成 $HEX[...]"""
+    if ':' in password or any(c < ' ' for c in password) or password.startswith('$HEX['):
+        return f'$HEX[{password.encode("utf-8").hex()}]'
+    return password
+
+
+def main(argv):
+    if '--version' in argv:
+        print('v0.0.0-pdfjoker-bench')
+        return 0
+    if '--keyspace' in argv:
+        print(keyspace(argv))
+        return 0
+    if '--restore' in argv:
+        print('ERROR: restore is not supported by the benchmark stand-in', file=sys.stderr)
+        return 255
+    out_file = _arg(argv, '--outfile')
+    hash_file = _positionals(argv)[0]
+    with open(hash_file, 'r', encoding='utf-8') as f:
+        hashes = [line.strip() for line in f if line.strip()]
+    with open(os.environ['PDFJOKER_BENCH_PASSWORDS'], 'r', encoding='utf-8') as f:
+        passwords = json.load(f)
+
+    sharded = '--limit' in argv
+    if sharded:
+        skip, limit = int(_arg(argv, '--skip', 0)), int(_arg(argv, '--limit'))
+        speed = float(os.environ.get('PDFJOKER_FAKE_SPEED', SPEED))
+        seconds = limit / speed
+        total = limit
+        # 每个哈希在本块内的位置，块外的不会被破解
+        hits = {}
+        for hash_str in hashes:
+            index = _index(argv, passwords[hash_str]) if hash_str in passwords else None
+            if index is not None and skip <= index < skip + limit:
+                hits[hash_str] = index - skip + 1
+        crash_marker = os.environ.get('PDFJOKER_FAKE_CRASH')
+        crash = crash_marker and not os.path.exists(crash_marker)
+        if crash:
+            open(crash_marker, 'w').close()
+    else:
+        seconds = float(os.environ.get('PDFJOKER_FAKE_SECONDS', 1.0))
+        total = int(SPEED * seconds)
+        hits = {h: total for h in hashes if h in passwords}
+        crash = False
+        speed = SPEED
+    interval = float(_arg(argv, '--status-timer', 1))
+    start = time.time()
+    done = 0
+    found = []
+    while True:
+        remaining = [h for h in hits if h not in dict(found) and hits[h] <= done]
+        if remaining:
+            with open(out_file, 'a', encoding='utf-8') as f:
+                for hash_str in remaining:
+                    f.write(f'{hash_str}:{_plain(passwords[hash_str])}\n')
+                    found.append((hash_str, passwords[hash_str]))
+        if crash and done >= total // 2:
+            os.kill(os.getpid(), signal.SIGKILL)
+        if len(found) == len(hashes) or done >= total:
+            break
+        time.sleep(min(interval, max(0.0, seconds - (time.time() - start))))
+        done = min(total, int((time.time() - start) * speed))
+        print(json.dumps({
+            'session': _arg(argv, '--session', 'hashcat'), 'status': 3,
+            'progress': [done, total], 'restore_point': done,
+            'recovered_hashes': [len(found), len(hashes)], 'time_start': int(start),
+            'estimated_stop': int(start + seconds),
+            'devices': [{'device_id': 1, 'device_name': 'bench', 'device_type': 'CPU', 'speed': int(speed)}],
+        }), flush=True)
+    return 0 if len(found) == len(hashes) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
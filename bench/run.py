@@ -0,0 +1,248 @@
+"""基准测试：哈希提取、解密和端到端破解的耗时、峰值内存与吞吐量
+
+用法::
+
+    python bench/run.py --profile quick --out bench/results/new.json --baseline bench/results/old.json
+
+每次测量都在新的子进程中执行，峰值内存（ru_maxrss）互不影响。
+端到端测试用 fake_hashcat.py 代替hashcat，在只有CPU的机器上也能运行。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+APP_DIR = ROOT_DIR / 'app'
+sys.path.insert(0, str(APP_DIR))
+
+# decrypt-<保存方式>：文件到文件；decrypt-memory：字节到BytesIO（网页下载）
+KINDS = ['hash', 'hash-pyhanko', 'decrypt', 'decrypt-compact', 'decrypt-web', 'decrypt-memory', 'e2e']
+
+
+def _peak_rss_kb(children=False):
+    """峰值常驻内存（KB），不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def measure(kind, path, password, env_dir):
+    """在当前（新的）进程中执行一次测量，返回耗时和峰值内存"""
+    if kind == 'hash':
+        from pdf2john import get_pdf_hash
+        start = time.perf_counter()
+        get_pdf_hash(path)
+        return {'seconds': time.perf_counter() - start, 'peak_rss_kb': _peak_rss_kb()}
+    if kind == 'hash-pyhanko':
+        from pdf2john import _process_pdf
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            _process_pdf(f)
+        return {'seconds': time.perf_counter() - start, 'peak_rss_kb': _peak_rss_kb()}
+    output = Path(env_dir) / 'out.pdf'
+    if kind == 'decrypt-memory':
+        from decrypt import decrypt
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            decrypt(f.read(), password)
+        return {'seconds': time.perf_counter() - start, 'peak_rss_kb': _peak_rss_kb()}
+    if kind.startswith('decrypt'):
+        from decrypt import decrypt, DEFAULT_PROFILE
+        start = time.perf_counter()
+        decrypt(path, password, output, kind.partition('-')[2] or DEFAULT_PROFILE)
+        return {'seconds': time.perf_counter() - start, 'peak_rss_kb': _peak_rss_kb()}
+    if kind == 'e2e':
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(APP_DIR / 'cli_main.py'), path, '-o', str(output), '--budget', '0'],
+                       check=True, stdout=subprocess.DEVNULL, env=_e2e_env(env_dir))
+        seconds = time.perf_counter() - start
+        # 子进程（cli和hashcat替身）中的最大值
+        return {'seconds': seconds, 'peak_rss_kb': _peak_rss_kb(children=True)}
+    raise ValueError(f'未知的测量类型: {kind}')
+
+
+def _e2e_env(env_dir):
+    """端到端测试的环境：独立的缓存、任务和日志目录，hashcat换成替身"""
+    env_dir = Path(env_dir)
+    env = dict(os.environ)
+    env.update({
+        'PDFJOKER_HASHCAT_DIR': str(env_dir / 'hashcat'),
+        'PDFJOKER_CACHE_DIR': str(env_dir / 'cache'),
+        'PDFJOKER_JOBS_DIR': str(env_dir / 'jobs'),
+        'PDFJOKER_LOG_DIR': str(env_dir / 'logs'),
+    })
+    return env
+
+
+def _prepare_env(env_dir, passwords):
+    """准备hashcat替身目录和密码表"""
+    env_dir = Path(env_dir)
+    hashcat_dir = env_dir / 'hashcat'
+    (hashcat_dir / 'OpenCL').mkdir(parents=True, exist_ok=True)
+    binary = hashcat_dir / ('hashcat.exe' if platform.system() == 'Windows' else 'hashcat.bin')
+    shutil.copy(BENCH_DIR / 'fake_hashcat.py', binary)
+    binary.chmod(0o755)
+    passwords_file = env_dir / 'passwords.json'
+    passwords_file.write_text(json.dumps(passwords))
+    os.environ['PDFJOKER_BENCH_PASSWORDS'] = str(passwords_file)
+
+
+def _run_isolated(kind, case, env_dir):
+    """在新进程中执行一次测量；端到端测试每次使用空的结果缓存"""
+    for name in ('cache', 'jobs'):
+        shutil.rmtree(Path(env_dir) / name, ignore_errors=True)
+    result = subprocess.run(
+        [sys.executable, __file__, '--measure', kind, case['path'], case['password'], str(env_dir)],
+        check=True, capture_output=True, text=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _versions():
+    versions = {'python': platform.python_version(), 'platform': platform.platform()}
+    for package in ('pikepdf', 'pyhanko', 'streamlit'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    from config import Config
+    try:
+        versions['hashcat'] = subprocess.run([str(Config.HASHCAT_BIN), '--version'], capture_output=True,
+                                             text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        versions['hashcat'] = None
+    try:
+        versions['commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                                            text=True).stdout.strip() or None
+    except OSError:
+        versions['commit'] = None
+    return versions
+
+
+def compare_with_pyhanko(path) -> bool:
+    """差分检查：快速提取的哈希必须与pyhanko路径一致；快速路径放弃（回退到pyhanko）时算作一致"""
+    from pdf2john import _process_pdf
+    from pdf_scan import ScanError, scan_pdf_hash
+    try:
+        fast = scan_pdf_hash(path)
+    except ScanError as e:
+        print(f'{path}: 回退到pyhanko（{e}）')
+        return True
+    with open(path, 'rb') as f:
+        reference = _process_pdf(f)
+    if fast != reference:
+        print(f'{path}: 哈希不一致\n  scan:    {fast}\n  pyhanko: {reference}')
+        return False
+    return True
+
+
+def run_suite(cases, kinds, repeat):
+    """对每个语料文件执行各项测量，取耗时中位数"""
+    from pdf2john import get_pdf_hash
+    hashes = {case['name']: get_pdf_hash(case['path']) for case in cases}
+    passwords = {hashes[case['name']]: case['password'] for case in cases if hashes[case['name']]}
+    results = []
+    with tempfile.TemporaryDirectory(prefix='pdfjoker-bench-') as env_dir:
+        _prepare_env(env_dir, passwords)
+        for case in cases:
+            hash_match = compare_with_pyhanko(case['path'])
+            for kind in kinds:
+                runs = [_run_isolated(kind, case, env_dir) for _ in range(repeat)]
+                seconds = statistics.median(run['seconds'] for run in runs)
+                rss = [run['peak_rss_kb'] for run in runs if run['peak_rss_kb'] is not None]
+                result = {
+                    'case': case['name'],
+                    'kind': kind,
+                    'size': case['size'],
+                    'seconds': seconds,
+                    'runs': [run['seconds'] for run in runs],
+                    'peak_rss_kb': max(rss) if rss else None,
+                    'throughput_mb_s': case['size'] / 1024 ** 2 / seconds if seconds else None,
+                    'hash_match': hash_match,
+                }
+                results.append(result)
+                print(f'{case["name"]:<22} {kind:<16} {seconds:9.4f}s  '
+                      f'{result["peak_rss_kb"] or 0:>9} KB  {result["throughput_mb_s"] or 0:9.1f} MB/s')
+    return results
+
+
+def compare(results, baseline, threshold):
+    """和基线对比，返回退化的项目"""
+    base = {(r['case'], r['kind']): r for r in baseline['results']}
+    regressions = []
+    print(f'\n与基线对比（{baseline.get("created_at")}，阈值 {threshold:.0%}）:')
+    for result in results:
+        old = base.get((result['case'], result['kind']))
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else 1.0
+        rss_ratio = (result['peak_rss_kb'] / old['peak_rss_kb']
+                     if result['peak_rss_kb'] and old.get('peak_rss_kb') else 1.0)
+        flag = ''
+        if ratio > 1 + threshold or rss_ratio > 1 + threshold:
+            flag = '  ⚠️ 退化'
+            regressions.append(result)
+        print(f'  {result["case"]:<22} {result["kind"]:<16} 耗时 x{ratio:.2f}  内存 x{rss_ratio:.2f}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pdfjoker基准测试')
+    parser.add_argument('--profile', choices=['quick', 'full'], default='quick',
+                        help='quick: 10KB和1MB；full: 10KB到500MB')
+    parser.add_argument('--corpus', default=str(BENCH_DIR / 'corpus'), help='语料目录（会复用已生成的文件）')
+    parser.add_argument('--kind', action='append', choices=KINDS, help='只执行指定的测量，可重复')
+    parser.add_argument('--repeat', type=int, default=3, help='每项测量的重复次数')
+    parser.add_argument('--out', default=str(BENCH_DIR / 'results' / 'latest.json'), help='结果JSON')
+    parser.add_argument('--baseline', help='用于对比的基线结果JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='判定退化的比例')
+    parser.add_argument('--measure', nargs=4, metavar=('KIND', 'PDF', 'PASSWORD', 'ENV_DIR'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return 0
+
+    from corpus import build_corpus
+    cases = build_corpus(args.corpus, args.profile)
+    results = run_suite(cases, args.kind or KINDS, max(1, args.repeat))
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'profile': args.profile,
+        'repeat': args.repeat,
+        'versions': _versions(),
+        'results': results,
+    }
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f'\n结果已保存到: {out}')
+
+    mismatches = [r['case'] for r in results if not r['hash_match']]
+    if mismatches:
+        print(f'❌ pdf_scan与pyhanko的哈希不一致: {sorted(set(mismatches))}')
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            return 1
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""测试共用的设置：app目录加入导入路径，数据目录指向临时目录"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Config在导入时读取环境变量，必须在导入app模块之前设置
+_data_dir = tempfile.mkdtemp(prefix='pdfjoker-tests-')
+for name, sub in (('PDFJOKER_CACHE_DIR', 'cache'), ('PDFJOKER_JOBS_DIR', 'jobs'), ('PDFJOKER_LOG_DIR', 'logs')):
+    os.environ.setdefault(name, os.path.join(_data_dir, sub))
+
+sys.path.insert(0, str(ROOT / 'app'))
@@ -0,0 +1,46 @@
+from pathlib import Path
+import pytest
+from cli_main import collect_inputs
+from engine import batch_outputs
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'%PDF-1.4\n')
+    return path
+
+
+def test_same_name_in_subdirectories_keeps_relative_paths(tmp_path):
+    a = touch(tmp_path / 'in' / 'a' / 'report.pdf')
+    b = touch(tmp_path / 'in' / 'b' / 'report.pdf')
+    inputs = collect_inputs([str(tmp_path / 'in')])
+    assert inputs == {a: Path('a/report.pdf'), b: Path('b/report.pdf')}
+    outputs = batch_outputs(list(inputs), tmp_path / 'out', inputs)
+    assert outputs[str(a)] == tmp_path / 'out' / 'a' / 'report_decrypted.pdf'
+    assert outputs[str(b)] == tmp_path / 'out' / 'b' / 'report_decrypted.pdf'
+
+
+def test_glob_paths_are_relative_to_the_glob_base(tmp_path):
+    a = touch(tmp_path / 'in' / 'x' / 'doc.pdf')
+    inputs = collect_inputs([str(tmp_path / 'in' / '**' / '*.pdf')])
+    assert inputs == {a: Path('x/doc.pdf')}
+
+
+def test_colliding_outputs_fail_before_processing(tmp_path):
+    a = touch(tmp_path / 'a' / 'report.pdf')
+    b = touch(tmp_path / 'b' / 'report.pdf')
+    inputs = collect_inputs([str(a), str(b)])
+    with pytest.raises(ValueError, match='同一个输出文件'):
+        batch_outputs(list(inputs), tmp_path / 'out', inputs)
+
+
+def test_output_that_overwrites_an_input_is_rejected(tmp_path):
+    a = touch(tmp_path / 'report.pdf')
+    b = touch(tmp_path / 'report_decrypted.pdf')
+    with pytest.raises(ValueError, match='覆盖输入文件'):
+        batch_outputs([a, b])
+
+
+def test_outputs_next_to_inputs_without_output_dir(tmp_path):
+    a = touch(tmp_path / 'a' / 'report.pdf')
+    assert batch_outputs([a]) == {str(a): tmp_path / 'a' / 'report_decrypted.pdf'}
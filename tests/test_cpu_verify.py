@@ -0,0 +1,81 @@
+import itertools
+import time
+import pikepdf
+import pytest
+from pikepdf import Encryption
+from cpu_verify import candidate_limit, make_target, top_passwords, verify
+from pdf2john import get_pdf_hash
+
+ENCRYPTIONS = {
+    'r2-rc4-40': dict(R=2, aes=False, metadata=False),
+    'r3-rc4-128': dict(R=3, aes=False, metadata=False),
+    'r4-rc4-128': dict(R=4, aes=False, metadata=False),
+    'r4-aes-128': dict(R=4, aes=True),
+    'r4-aes-128-plain-metadata': dict(R=4, aes=True, metadata=False),
+    'r6-aes-256': dict(R=6, aes=True),
+}
+
+
+def _hash(path, user, **encryption):
+    with pikepdf.new() as pdf:
+        pdf.add_blank_page()
+        pdf.save(path, encryption=Encryption(owner='owner', user=user, **encryption))
+    return get_pdf_hash(str(path))
+
+
+@pytest.fixture(scope='module')
+def hashes(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('cpu-verify')
+    return {name: _hash(directory / f'{name}.pdf', 'secret42', **encryption)
+            for name, encryption in ENCRYPTIONS.items()}
+
+
+@pytest.mark.parametrize('name', ENCRYPTIONS)
+def test_target_checks_user_password(hashes, name):
+    target = make_target(hashes[name])
+    assert target is not None
+    assert target.revision == ENCRYPTIONS[name]['R']
+    assert target.check('secret42')
+    assert not target.check('secret43')
+    assert not target.check('owner')
+
+
+def test_verify_returns_password_bytes_per_hash(hashes):
+    candidates = ['x', 'y', *map(str, range(100)), 'secret42']
+    recovered = verify(list(hashes.values()), candidates, processes=1)
+    assert recovered == {h: b'secret42' for h in hashes.values()}
+
+
+def test_non_ascii_passwords_use_the_revision_encoding(tmp_path):
+    # R2-R4的密码是latin-1字节，R6是UTF-8
+    r4 = _hash(tmp_path / 'r4.pdf', 'pässwort', R=4, aes=True)
+    r6 = _hash(tmp_path / 'r6.pdf', 'pässwort', R=6, aes=True)
+    assert verify([r4, r6], ['pässwort'], processes=1) == {r4: 'pässwort'.encode('latin-1'),
+                                                           r6: 'pässwort'.encode('utf-8')}
+
+
+def test_unsupported_hash_has_no_target():
+    assert make_target('$pdf$1*2*40*-4*0*16*00*32*00') is None
+    assert verify(['not a hash'], ['x']) == {}
+
+
+def test_candidate_limit_scales_with_revision_cost(hashes):
+    r2 = candidate_limit([hashes['r2-rc4-40']], 1, processes=1)
+    r4 = candidate_limit([hashes['r4-aes-128']], 1, processes=1)
+    r6 = candidate_limit([hashes['r6-aes-256']], 1, processes=1)
+    assert r2 > r4 > r6 > 0
+    assert candidate_limit([hashes['r6-aes-256']], 1, processes=4) == pytest.approx(4 * r6, abs=4)
+    # 每个候选要对每个哈希校验一次
+    assert candidate_limit([hashes['r6-aes-256']] * 2, 1, processes=1) == pytest.approx(r6 / 2, abs=1)
+
+
+def test_verify_stops_at_timeout(hashes):
+    start = time.monotonic()
+    endless = map(str, itertools.count())
+    assert verify([hashes['r6-aes-256']], endless, processes=1, batch_size=16, timeout=0.2) == {}
+    assert time.monotonic() - start < 2
+
+
+def test_top_passwords_limit():
+    assert len(list(top_passwords(50))) == 50
+    assert '0000' in set(top_passwords())
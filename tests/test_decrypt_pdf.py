@@ -0,0 +1,39 @@
+from io import BytesIO
+import pikepdf
+from pikepdf import Encryption
+from engine import Decrypted, decrypt_pdf
+from upload_cache import SizedLRU, entry_size
+
+
+def _encrypted(path):
+    with pikepdf.new() as pdf:
+        pdf.add_blank_page()
+        pdf.save(path, encryption=Encryption(owner='owner', user='user', R=4, aes=True))
+    return path
+
+
+def test_in_memory_result_is_the_decrypt_buffer(tmp_path):
+    result = decrypt_pdf(str(_encrypted(tmp_path / 'in.pdf')), b'user')
+    assert isinstance(result.data, BytesIO)
+    assert result.data.tell() == 0
+    with pikepdf.open(result.data) as pdf:
+        assert not pdf.is_encrypted
+        assert len(pdf.pages) == 1
+
+
+def test_output_file_returns_no_data(tmp_path):
+    output = tmp_path / 'out.pdf'
+    result = decrypt_pdf(str(_encrypted(tmp_path / 'in.pdf')), b'user', str(output))
+    assert result.data is None
+    with pikepdf.open(output) as pdf:
+        assert not pdf.is_encrypted
+
+
+def test_memo_counts_the_buffer_size():
+    buffer = BytesIO(b'x' * 5000)
+    assert entry_size(buffer) == 5000
+    # 计算大小后缓冲区仍可以继续写入（没有残留的导出视图）
+    buffer.write(b'more')
+    memo = SizedLRU(max_bytes=4000)
+    memo.put('big', Decrypted(0.1, buffer))
+    assert memo.get('big') is None
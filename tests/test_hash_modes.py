@@ -0,0 +1,74 @@
+import pytest
+from hash_modes import UnsupportedHashError, hash_key, parse_pdf_hash, resolve_hash_mode
+
+DOC_ID = bytes(range(16))
+
+
+def make_hash(version=4, revision=4, length=128, perms=-1028, encrypt_metadata=1, document_id=DOC_ID,
+              udata=b'\x11' * 32, odata=b'\x22' * 32, extra=(), id_len=None, id_hex=None):
+    fields = [f'$pdf${version}', str(revision), str(length), str(perms), str(encrypt_metadata),
+              str(len(document_id) if id_len is None else id_len),
+              document_id.hex() if id_hex is None else id_hex]
+    for data in (udata, odata, *extra):
+        fields.extend([str(len(data)), data.hex()])
+    return '*'.join(fields)
+
+
+@pytest.mark.parametrize('version, revision, length, size, mode', [
+    (1, 2, 40, 32, '10400'),
+    (2, 3, 128, 32, '10500'),
+    (4, 4, 128, 32, '10500'),
+    (5, 5, 256, 48, '10600'),
+    (5, 6, 256, 48, '10700'),
+])
+def test_resolve_hash_mode(version, revision, length, size, mode):
+    hash_str = make_hash(version, revision, length, udata=b'\x11' * size, odata=b'\x22' * size)
+    assert resolve_hash_mode(hash_str).mode == mode
+
+
+def test_resolve_hash_mode_accepts_32_byte_id():
+    assert resolve_hash_mode(make_hash(document_id=bytes(32))).mode == '10500'
+
+
+@pytest.mark.parametrize('hash_str', [
+    'not a hash',
+    make_hash(version=3, revision=3),                                   # 没有对应的模式
+    make_hash(length=40),                                               # R4只支持128位
+    make_hash(udata=b'\x11' * 48),                                      # RC4的U固定为32字节
+    make_hash(version=5, revision=6, length=256, udata=b'\x11' * 16, odata=b'\x22' * 16),
+    make_hash(document_id=bytes(8)),                                    # /ID只能是16或32字节
+    make_hash(document_id=b''),
+    make_hash(id_hex=DOC_ID.hex()[:-1] + 'g'),                          # 不是十六进制
+    make_hash(id_hex=' ' + DOC_ID.hex()[1:]),                           # fromhex会忽略的空白
+    make_hash(id_hex=DOC_ID.hex() + '0', id_len=16),                    # 奇数个字符
+    make_hash(id_len=17),                                               # 长度字段不匹配
+    make_hash(encrypt_metadata=2),
+    make_hash()[:-4],                                                   # 截断的O
+    make_hash() + '*32',                                                # 字段数为偶数
+])
+def test_resolve_hash_mode_rejects_malformed(hash_str):
+    with pytest.raises(UnsupportedHashError):
+        resolve_hash_mode(hash_str)
+
+
+def test_unsupported_hash_error_is_value_error():
+    with pytest.raises(ValueError):
+        resolve_hash_mode(make_hash(id_hex='zz' * 16))
+
+
+def test_parse_pdf_hash_fields():
+    extra = (b'\x33' * 32, b'\x44' * 32)
+    fields = parse_pdf_hash(make_hash(5, 6, 256, encrypt_metadata=0, udata=b'\x11' * 48, odata=b'\x22' * 48,
+                                      extra=extra))
+    assert fields['version'] == 5 and fields['revision'] == 6 and fields['length'] == 256
+    assert fields['permissions'] == -1028
+    assert fields['encrypt_metadata'] is False
+    assert fields['document_id'] == DOC_ID
+    assert fields['udata'] == b'\x11' * 48
+    assert fields['extra'] == list(extra)
+
+
+def test_hash_key_ignores_case_and_trailing_fields():
+    hash_str = make_hash()
+    assert hash_key(hash_str.upper().replace('$PDF$', '$pdf$')) == hash_key(hash_str)
+    assert hash_key(hash_str) == (DOC_ID, b'\x11' * 32, b'\x22' * 32)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+import pytest
+from hashcat_driver import (AsyncHashcatRun, ErrorEvent, FinishedEvent, HashcatRun, OutfileReader, ProgressEvent,
+                            RecoveredEvent, STATUS_ARGS, STOP_TIMEOUT, decode_plain, encode_plain, format_password)
+from jobs import read_outfile
+
+FAKE_HASHCAT = Path(__file__).resolve().parents[1] / 'bench' / 'fake_hashcat.py'
+
+
+def make_hash(document_id, revision=4, size=32, extra=()):
+    version, length = (5, 256) if revision >= 5 else (4, 128)
+    fields = [f'$pdf${version}', str(revision), str(length), '-1028', '1', str(len(document_id)), document_id.hex()]
+    for data in (b'\x11' * size, b'\x22' * size, *extra):
+        fields.extend([str(len(data)), data.hex()])
+    return '*'.join(fields)
+
+
+FIRST = make_hash(b'\x01' * 16)
+SECOND = make_hash(b'\x02' * 16)
+R6 = make_hash(b'\x03' * 16, revision=6, size=48, extra=(b'\x33' * 32, b'\x44' * 32))
+
+
+def write(path, *lines, mode='ab'):
+    with open(path, mode) as f:
+        f.write(b''.join(lines))
+
+
+def test_plains_are_read_as_bytes(tmp_path):
+    out = tmp_path / 'cracked.txt'
+    write(out,
+          FIRST.encode() + b':pass:word\n',                    # 第一个冒号之后都是密码
+          SECOND.encode() + b':caf\xe9\n',                     # latin-1字节不是UTF-8，原样保留
+          R6.encode() + b':$HEX[613a62e9000a]\n')              # hashcat的 --outfile-autohex
+    assert read_outfile(out, [FIRST, SECOND, R6]) == {
+        FIRST: b'pass:word',
+        SECOND: b'caf\xe9',
+        R6: b'a:b\xe9\x00\n',
+    }
+
+
+def test_hashes_map_back_to_the_original_hash(tmp_path):
+    out = tmp_path / 'cracked.txt'
+    # hashcat输出的哈希可能是大写十六进制，也可能省略R6的OE/UE字段
+    r6_short = make_hash(b'\x03' * 16, revision=6, size=48)
+    write(out, SECOND.upper().replace('$PDF$', '$pdf$').encode() + b':two\n', r6_short.encode() + b':six\n')
+    assert read_outfile(out, [FIRST, SECOND, R6]) == {SECOND: b'two', R6: b'six'}
+
+
+def test_unknown_hash_is_ignored_unless_there_is_only_one(tmp_path):
+    out = tmp_path / 'cracked.txt'
+    write(out, b'garbage:one\n', make_hash(b'\x09' * 16).encode() + b':two\n')
+    assert read_outfile(out, [FIRST, SECOND]) == {}
+    # 只有一个哈希时无法识别的行也归它（如hashcat改写了哈希格式）
+    assert read_outfile(out, [FIRST]) == {FIRST: b'one'}
+
+
+def test_read_new_waits_for_complete_lines(tmp_path):
+    out = tmp_path / 'cracked.txt'
+    reader = OutfileReader(out, [FIRST, SECOND])
+    assert reader.read_new() == []
+    write(out, FIRST.encode() + b':one\n', SECOND.encode() + b':tw')
+    assert reader.read_new() == [(FIRST, b'one')]
+    write(out, b'o\n')
+    assert reader.read_new() == [(SECOND, b'two')]
+    # 同一个哈希再次出现时保留第一次的结果
+    write(out, FIRST.encode() + b':other')
+    assert reader.read_new(final=True) == []
+    assert reader.recovered == {FIRST: b'one', SECOND: b'two'}
+
+
+def test_plain_round_trip():
+    for password in (b'plain', b'a:b', b'caf\xe9', 'café'.encode(), b'$HEX[41]', b'\x00\r\n', b''):
+        assert decode_plain(encode_plain(password)) == password
+    assert encode_plain(b'plain') == b'plain'
+    assert decode_plain(b'$HEX[zz]') == b'$HEX[zz]'
+
+
+def test_format_password():
+    assert format_password('café'.encode()) == 'café'
+    assert format_password(b'caf\xe9') == '$HEX[636166e9]'
+    assert format_password(b'tab\there') == '$HEX[7461620968657265]'
+    assert format_password(None) == ''
+
+
+def _fake_command(tmp_path, monkeypatch, seconds, *extra):
+    hash_file = tmp_path / 'hashes.txt'
+    hash_file.write_text(f'{FIRST}\n', encoding='utf-8')
+    passwords = tmp_path / 'passwords.json'
+    passwords.write_text(json.dumps({FIRST: 'p:w'}), encoding='utf-8')
+    monkeypatch.setenv('PDFJOKER_BENCH_PASSWORDS', str(passwords))
+    monkeypatch.setenv('PDFJOKER_FAKE_SECONDS', str(seconds))
+    out_file = tmp_path / 'cracked.txt'
+    cmd = [sys.executable, FAKE_HASHCAT, '-m', '10500', *STATUS_ARGS[:-1], '0.1', '--outfile', out_file,
+           *extra, hash_file]
+    return cmd, out_file
+
+
+def _run_sync(cmd, out_file, timeout=None):
+    with HashcatRun(cmd, out_file, [FIRST], timeout=timeout) as run:
+        return list(run.events(poll_interval=0.1))
+
+
+def _run_async(cmd, out_file, timeout=None):
+    async def collect():
+        run = AsyncHashcatRun(cmd, out_file, [FIRST], timeout=timeout)
+        try:
+            return [event async for event in run.events(poll_interval=0.1)]
+        finally:
+            await run.terminate()
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize('run', [_run_sync, _run_async], ids=['sync', 'async'])
+def test_run_reports_progress_recovered_and_finished(tmp_path, monkeypatch, run):
+    events = run(*_fake_command(tmp_path, monkeypatch, 0.3))
+    # 进度事件的条数和结果出现的时机取决于计时
+    assert isinstance(events[0], ProgressEvent)
+    assert [event for event in events if isinstance(event, RecoveredEvent)] == [RecoveredEvent(FIRST, b'p:w')]
+    assert not any(isinstance(event, ErrorEvent) for event in events)
+    # 全部哈希恢复后hashcat可能已被提前结束，退出码不一定是0
+    assert isinstance(events[-1], FinishedEvent)
+    assert events[-1].status == 'Cracked' and events[-1].recovered == {FIRST: b'p:w'}
+
+
+@pytest.mark.parametrize('run', [_run_sync, _run_async], ids=['sync', 'async'])
+def test_run_reports_errors(tmp_path, monkeypatch, run):
+    events = run(*_fake_command(tmp_path, monkeypatch, 0.3, '--restore'))
+    assert isinstance(events[0], ErrorEvent) and 'restore' in events[0].message
+    assert events[-1] == FinishedEvent(255, 'Error', {})
+
+
+@pytest.mark.parametrize('run', [_run_sync, _run_async], ids=['sync', 'async'])
+def test_run_stops_at_timeout(tmp_path, monkeypatch, run):
+    events = run(*_fake_command(tmp_path, monkeypatch, 30), timeout=0.3)
+    assert isinstance(events[-1], FinishedEvent)
+    assert events[-1].status == STOP_TIMEOUT and events[-1].recovered == {}
+
+
+# 收到SIGINT后过一会儿才写入“还原点”并退出的hashcat替身，SIGTERM按默认处理直接结束
+SLOW_CHECKPOINT = """
+import pathlib, signal, sys, time
+marker = pathlib.Path(sys.argv[1])
+def checkpoint(*_):
+    time.sleep(0.3)
+    marker.write_text('restore')
+    sys.exit(0)
+signal.signal(signal.SIGINT, checkpoint)
+marker.with_suffix('.ready').touch()
+while True:
+    time.sleep(0.05)
+"""
+
+
+def _wait_ready(marker):
+    ready = marker.with_suffix('.ready')
+    for _ in range(200):
+        if ready.exists():
+            return
+        time.sleep(0.02)
+    raise AssertionError('替身进程没有启动')
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='使用POSIX信号')
+def test_interrupt_waits_for_the_restore_point(tmp_path):
+    marker = tmp_path / 'restore.txt'
+    run = HashcatRun([sys.executable, '-c', SLOW_CHECKPOINT, marker], tmp_path / 'out.txt', [FIRST]).start()
+    _wait_ready(marker)
+    run.interrupt(timeout=5)
+    assert marker.read_text() == 'restore'
+    assert run.process.returncode == 0
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='使用POSIX信号')
+def test_async_interrupt_waits_for_the_restore_point(tmp_path):
+    marker = tmp_path / 'restore.txt'
+
+    async def interrupt():
+        run = await AsyncHashcatRun([sys.executable, '-c', SLOW_CHECKPOINT, marker], tmp_path / 'out.txt',
+                                    [FIRST]).start()
+        await asyncio.to_thread(_wait_ready, marker)
+        await run.interrupt(timeout=5)
+        return run.process.returncode
+    assert asyncio.run(interrupt()) == 0
+    assert marker.read_text() == 'restore'
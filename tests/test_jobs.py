@@ -0,0 +1,36 @@
+from jobs import JobStore, ORIGIN_WEB, STATUS_FINISHED, STATUS_INTERRUPTED, STATUS_QUEUED, STATUS_RUNNING
+
+
+def make_store(tmp_path):
+    return JobStore(db_path=tmp_path / 'jobs.sqlite3')
+
+
+def create(store, status):
+    return store.create('a.pdf', ['$pdf$...'], '10500', '?d', 1, 4, origin=ORIGIN_WEB, status=status)
+
+
+def test_requeue_only_touches_the_given_job(tmp_path):
+    store = make_store(tmp_path)
+    first, second = create(store, STATUS_INTERRUPTED), create(store, STATUS_INTERRUPTED)
+    assert store.requeue(first.id)
+    assert store.get(first.id).status == STATUS_QUEUED
+    assert store.get(second.id).status == STATUS_INTERRUPTED
+    # 已经排队的任务不会再次排队
+    assert not store.requeue(first.id)
+
+
+def test_requeue_orphaned_running_job(tmp_path):
+    store = make_store(tmp_path)
+    job = create(store, STATUS_RUNNING)
+    # 当前进程还在运行，任务不算中断
+    assert not store.requeue(job.id)
+    store.update(job, pid=2 ** 22 + 12345)  # 不存在的进程
+    assert store.requeue(job.id)
+    assert store.get(job.id).status == STATUS_QUEUED
+
+
+def test_requeue_rejects_finished_and_missing_jobs(tmp_path):
+    store = make_store(tmp_path)
+    job = create(store, STATUS_FINISHED)
+    assert not store.requeue(job.id)
+    assert not store.requeue('missing')
@@ -0,0 +1,72 @@
+from mask_stats import MaskStats, coverage, rank_masks, write_mask_file
+from planner import keyspace, read_mask_file
+
+SIX_DIGITS = [f'{n:06d}'.encode() for n in range(100000, 100020)]
+
+
+def _stats(*passwords):
+    stats = MaskStats()
+    stats.update(passwords)
+    return stats
+
+
+def _masks(ranked):
+    return [r.attack.mask for r in ranked]
+
+
+def test_add_splits_prefix_and_suffix_by_class():
+    stats = MaskStats()
+    stats.add(b'Admin2023!', weight=3)
+    assert stats.total == 3 and stats.lengths == {10: 3}
+    assert stats.structures == {b'ulllldddds': 3}
+    assert stats.prefixes == {(b'Admin', b'dddds'): 3}
+    assert stats.suffixes == {(b'ulllldddd', b'!'): 3}
+
+
+def test_add_skips_long_affixes_and_non_ascii():
+    stats = _stats(b'abcdefghij1', b'\xe9t\xe91', b'plain')
+    # 超过MAX_AFFIX的片段和 ?b 片段不作为前后缀；只有一个片段的密码没有前后缀
+    assert stats.prefixes == {}
+    assert stats.suffixes == {(b'llllllllll', b'1'): 1, (b'blb', b'1'): 1}
+    assert stats.total == 3
+
+
+def test_add_skips_empty_and_overlong_lines():
+    stats = _stats(b'', b'x' * 33, b'ok')
+    assert stats.total == 1 and stats.skipped == 2
+
+
+def test_rank_masks_orders_by_density():
+    stats = _stats(b'pass1', b'pass2', b'pass3', b'abcd1', *SIX_DIGITS)
+    ranked = rank_masks(stats, max_masks=10)
+    assert _masks(ranked) == ['pass?d', '?d?d?d?d?d?d', '?l?l?l?l1', '?l?l?l?l?d']
+    assert [(r.count, r.keyspace) for r in ranked] == [(3, 10), (20, 10 ** 6), (2, 26 ** 4), (4, 26 ** 4 * 10)]
+    # 只出现一次的前后缀（abcd?d、?l?l?l?l2）低于MIN_COUNT
+    assert len(rank_masks(stats, min_count=1, max_masks=100)) == 7
+    assert _masks(rank_masks(stats, max_masks=2)) == ['pass?d', '?d?d?d?d?d?d']
+
+
+def test_max_keyspace_skips_oversized_masks():
+    stats = _stats(b'pass1', b'pass2', b'pass3', b'abcd1', *SIX_DIGITS)
+    ranked = rank_masks(stats, max_masks=10, max_keyspace=500_000)
+    # ?d?d?d?d?d?d 超出累计密钥空间被跳过，后面更小的掩码仍然加入
+    assert _masks(ranked) == ['pass?d', '?l?l?l?l1']
+    assert sum(r.keyspace for r in ranked) <= 500_000
+
+
+def test_coverage_counts_each_structure_once():
+    stats = _stats(b'pass1', b'pass2', b'pass3', b'abcd1', *SIX_DIGITS)
+    points = coverage(stats, rank_masks(stats, max_masks=10))
+    # 前后缀掩码按所属结构的样本数（4）封顶，完整结构加入后不再重复计数
+    assert points == [(10, 3), (1_000_010, 23), (1_456_986, 24), (6_026_746, 24)]
+
+
+def test_literals_survive_the_mask_file(tmp_path):
+    stats = _stats(b'??12', b'??34', b'12,,', b'56,,')
+    ranked = rank_masks(stats, max_masks=10)
+    assert {'?????d?d', '?d?d,,'} <= set(_masks(ranked))
+    path = tmp_path / 'learned.hcmask'
+    assert write_mask_file(path, ranked) == len(ranked)
+    read = read_mask_file(path)
+    assert read == [r.attack for r in ranked]
+    assert [keyspace(attack) for attack in read] == [r.keyspace for r in ranked]
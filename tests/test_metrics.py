@@ -0,0 +1,70 @@
+import math
+import re
+from metrics import BUCKETS, Metrics
+
+# Prometheus文本格式的一个样本行：名字、可选的标签、值
+SAMPLE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_]\w*="(?:[^"\\]|\\.)*",?)*\})? (\S+)')
+
+
+def _samples(text):
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.fullmatch(line)
+        assert match, f'不是有效的样本行: {line!r}'
+        samples[match[1] + (match[2] or '')] = float(match[3])
+    return samples
+
+
+def test_render_counters_and_gauges():
+    metrics = Metrics()
+    metrics.inc('files', path='single')
+    metrics.inc('files', 2, path='batch')
+    metrics.inc('files', path='single')
+    metrics.set_gauge('hashcat_speed', 1.5e9, mode='10500', worker='local', device=1)
+    metrics.add_gauge('hashcat_processes', 1)
+    metrics.add_gauge('hashcat_processes', -1)
+    text = metrics.render()
+    assert text.endswith('\n')
+    assert '# TYPE pdfjoker_files_total counter' in text
+    assert '# HELP pdfjoker_files_total ' in text
+    assert '# TYPE pdfjoker_hashcat_speed gauge' in text
+    samples = _samples(text)
+    assert samples['pdfjoker_files_total{path="single"}'] == 2
+    assert samples['pdfjoker_files_total{path="batch"}'] == 2
+    assert samples['pdfjoker_hashcat_speed{device="1",mode="10500",worker="local"}'] == 1.5e9
+    assert samples['pdfjoker_hashcat_processes'] == 0
+
+
+def test_render_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for seconds in (0.003, 0.2, 7, 100_000):
+        metrics.observe('crack', seconds, mode='10700')
+    samples = _samples(metrics.render())
+    buckets = [samples[f'pdfjoker_phase_seconds_bucket{{mode="10700",phase="crack",le="{le}"}}']
+               for le in ('0.01', '0.5', '10', '86400', '+Inf')]
+    assert buckets == [1, 2, 3, 3, 4]
+    counts = [samples[key] for key in samples if key.startswith('pdfjoker_phase_seconds_bucket')]
+    assert len(counts) == len(BUCKETS) and counts == sorted(counts)
+    assert samples['pdfjoker_phase_seconds_count{mode="10700",phase="crack"}'] == 4
+    assert math.isclose(samples['pdfjoker_phase_seconds_sum{mode="10700",phase="crack"}'], 100_007.203)
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc('failed', reason='a "quoted" \\ path\nnext')
+    text = metrics.render()
+    assert 'pdfjoker_failed_total{reason="a \\"quoted\\" \\\\ path\\nnext"} 1' in text
+    _samples(text)
+
+
+def test_empty_metrics_render_and_summary():
+    metrics = Metrics()
+    assert metrics.render() == '\n'
+    metrics.observe('decrypt', 2.0)
+    metrics.observe('decrypt', 4.0)
+    metrics.inc('cracked')
+    summary = metrics.summary()
+    assert summary['phases']['decrypt'] == {'count': 2, 'seconds': 6.0, 'mean': 3.0, 'max': 4.0}
+    assert summary['counters'] == {'cracked': 1}
@@ -0,0 +1,111 @@
+"""pdf_scan与pyhanko的差分测试：生成覆盖各种加密方式和交叉引用结构的语料，两条路径的哈希必须一致
+
+设置 PDFJOKER_SCAN_CORPUS 为一个目录时，其中的PDF也参与比较（如收集到的真实文件）。
+"""
+import os
+import re
+from pathlib import Path
+import pikepdf
+import pytest
+from pikepdf import Encryption, ObjectStreamMode
+from pdf2john import _process_pdf, get_pdf_hash
+from pdf_scan import ScanError, scan_pdf_hash
+
+ENCRYPTIONS = {
+    'r2-rc4-40': dict(R=2, aes=False, metadata=False),
+    'r3-rc4-128': dict(R=3, aes=False, metadata=False),
+    'r4-rc4-128': dict(R=4, aes=False, metadata=False),
+    'r4-aes-128': dict(R=4, aes=True),
+    'r4-aes-128-plain-metadata': dict(R=4, aes=True, metadata=False),
+    'r6-aes-256': dict(R=6, aes=True),
+    'r6-aes-256-plain-metadata': dict(R=6, aes=True, metadata=False),
+}
+
+LAYOUTS = {
+    'xref-table': dict(object_stream_mode=ObjectStreamMode.disable),
+    'xref-stream': dict(object_stream_mode=ObjectStreamMode.generate),
+    'linearized': dict(object_stream_mode=ObjectStreamMode.generate, linearize=True),
+    'uncompressed': dict(object_stream_mode=ObjectStreamMode.disable, compress_streams=False),
+}
+
+
+def _build(path, encryption=None, pages=3, **save_options):
+    with pikepdf.new() as pdf:
+        for _ in range(pages):
+            pdf.add_blank_page()
+        pdf.docinfo['/Title'] = path.stem
+        if encryption is not None:
+            save_options['encryption'] = Encryption(owner='owner', user='user', **encryption)
+        pdf.save(path, **save_options)
+    return path
+
+
+def _append_empty_update(path):
+    """追加一个不含对象的增量更新，/Prev指向原来的交叉引用表"""
+    data = path.read_bytes()
+    prev = int(re.findall(rb'startxref\s+(\d+)', data)[-1])
+    trailer = re.findall(rb'trailer\s*(<<.*?>>)\s*startxref', data, re.S)[-1]
+    trailer = re.sub(rb'/Prev\s+\d+', b'', trailer)
+    offset = len(data) + 1
+    update = b'\nxref\n0 0\ntrailer\n' + trailer[:-2] + b' /Prev %d >>\nstartxref\n%d\n%%%%EOF\n' % (prev, offset)
+    path.write_bytes(data + update)
+    return path
+
+
+@pytest.fixture(scope='module')
+def corpus(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('scan-corpus')
+    files = {'unencrypted': _build(directory / 'unencrypted.pdf')}
+    for enc_name, encryption in ENCRYPTIONS.items():
+        for layout, options in LAYOUTS.items():
+            name = f'{enc_name}-{layout}'
+            files[name] = _build(directory / f'{name}.pdf', encryption, **options)
+        name = f'{enc_name}-incremental'
+        files[name] = _append_empty_update(_build(directory / f'{name}.pdf', encryption,
+                                                  **LAYOUTS['xref-table']))
+    return files
+
+
+def _reference(path):
+    with open(path, 'rb') as f:
+        return _process_pdf(f)
+
+
+CASES = ['unencrypted'] + [f'{enc}-{layout}' for enc in ENCRYPTIONS for layout in [*LAYOUTS, 'incremental']]
+
+
+@pytest.mark.parametrize('name', CASES)
+def test_scan_matches_pyhanko(corpus, name):
+    path = corpus[name]
+    reference = _reference(path)
+    assert scan_pdf_hash(path) == reference
+    assert scan_pdf_hash(path.read_bytes()) == reference
+    assert get_pdf_hash(str(path)) == reference
+    if name != 'unencrypted':
+        assert reference.startswith('$pdf$')
+
+
+def test_scan_error_falls_back_to_pyhanko(corpus, monkeypatch):
+    import pdf2john
+
+    def unsupported(pdf_file):
+        raise ScanError('unsupported')
+    monkeypatch.setattr(pdf2john, 'scan_pdf_hash', unsupported)
+    path = corpus['r6-aes-256-xref-stream']
+    assert get_pdf_hash(str(path)) == get_pdf_hash(path.read_bytes()) == _reference(path)
+
+
+def _external_corpus():
+    directory = os.environ.get('PDFJOKER_SCAN_CORPUS')
+    if not directory:
+        return []
+    return sorted(Path(directory).rglob('*.pdf'))
+
+
+@pytest.mark.parametrize('path', _external_corpus(), ids=str)
+def test_scan_matches_pyhanko_external(path):
+    try:
+        fast = scan_pdf_hash(path)
+    except ScanError:
+        pytest.skip('falls back to pyhanko')
+    assert fast == _reference(path)
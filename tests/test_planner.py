@@ -0,0 +1,85 @@
+import pytest
+from planner import (DEFAULT_SPEEDS, DictAttack, MaskAttack, SpeedTable, _trim, build_plan, estimate,
+                     keyspace, mask_positions, parse_duration)
+
+
+@pytest.fixture
+def speeds(tmp_path):
+    table = SpeedTable(str(tmp_path / 'speeds.json'))
+    table.record('10500', 1000)
+    return table
+
+
+def test_mask_keyspace_sums_increment_lengths():
+    assert keyspace(MaskAttack('?d?d?d?d', 1, 4)) == 10 + 100 + 1000 + 10000
+    assert keyspace(MaskAttack('?d?d?d?d', 4, 4)) == 10000
+    # 长度范围超过掩码位置数时截到掩码长度
+    assert keyspace(MaskAttack('?l?d', 1, 8)) == 26 + 260
+
+
+def test_mask_keyspace_with_literals_and_custom_charsets():
+    assert keyspace(MaskAttack('ab?d', 3, 3)) == 10
+    assert keyspace(MaskAttack('??', 1, 1)) == 1
+    assert keyspace(MaskAttack('?1?1', 2, 2, ('?dab',))) == 12 * 12
+    # 自定义字符集可以引用前面的自定义字符集
+    assert mask_positions('?2', ('?d', '?1x')) == [11]
+    with pytest.raises(ValueError):
+        mask_positions('?2', ('?d',))
+
+
+def test_dict_keyspace(tmp_path):
+    words = tmp_path / 'words.txt'
+    words.write_bytes(b'alpha\nbeta\ngamma')  # 最后一行没有换行符
+    rules = tmp_path / 'best.rule'
+    rules.write_text('# 注释\n:\nu\n\nc\n', encoding='utf-8')
+    assert keyspace(DictAttack(str(words))) == 3
+    assert keyspace(DictAttack(str(words), rules=(str(rules),))) == 9
+    assert keyspace(DictAttack(str(words), rules=(str(rules), str(rules)))) == 27
+    assert keyspace(DictAttack(str(words), attack_mode=6, mask='?d?d')) == 300
+    assert keyspace(DictAttack(words=('a', 'b'), label='meta')) == 2
+
+
+def test_mask_file_keyspace(tmp_path):
+    masks = tmp_path / 'masks.hcmask'
+    masks.write_text('# 注释\n?d?d\n?dab,?1?1?1\n', encoding='utf-8')
+    assert keyspace(DictAttack(str(masks), attack_mode=3)) == 100 + 12 ** 3
+
+
+def test_trim_shortens_max_len_to_fit_budget(speeds):
+    stage = estimate('10500', MaskAttack('?d', 1, 6), speeds)
+    assert stage.keyspace == 1_111_110
+    trimmed = _trim('10500', stage, 200, speeds)
+    assert trimmed.attack.max_len == 5
+    assert trimmed.keyspace == 111_110
+    assert trimmed.trimmed
+    assert _trim('10500', stage, 0.001, speeds) is None
+    assert _trim('10500', estimate('10500', DictAttack(words=('x',)), speeds), 0, speeds) is None
+
+
+def test_build_plan_orders_trims_and_rejects(speeds):
+    small = MaskAttack('?d', 1, 3)  # 1110 个候选
+    large = MaskAttack('?d', 1, 6)
+    words = DictAttack(words=tuple(str(i) for i in range(50000)))
+    plan = build_plan('10500', [large, words, small], budget=20, speeds=speeds)
+    assert [stage.attack for stage in plan.stages][0] == MaskAttack('?d?d?d', 1, 3)
+    assert plan.stages[1].trimmed and plan.stages[1].attack.max_len == 4
+    assert [stage.attack for stage in plan.rejected] == [words]
+    assert plan.seconds <= 20
+    # 不限预算时不裁剪
+    assert not any(stage.trimmed for stage in build_plan('10500', [large], speeds=speeds).stages)
+
+
+def test_speed_table_defaults_and_average(tmp_path):
+    table = SpeedTable(str(tmp_path / 'speeds.json'))
+    assert table.get('10700') == DEFAULT_SPEEDS['10700']
+    table.record('10700', 1000)
+    table.record('10700', 2000)
+    assert table.get('10700') == pytest.approx(1300)
+    assert SpeedTable(str(tmp_path / 'speeds.json')).get('10700') == pytest.approx(1300)
+
+
+def test_parse_duration():
+    assert parse_duration('30m') == 1800
+    assert parse_duration('2h') == 7200
+    assert parse_duration('90') == 90
+    assert parse_duration('none') is None
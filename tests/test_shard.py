@@ -0,0 +1,58 @@
+import pytest
+from shard import LocalTransport, SSHTransport, parse_workers, split_keyspace
+
+
+def _covers(chunks, units):
+    """每个长度的块首尾相接，恰好覆盖 [0, 密钥空间)"""
+    for length, space in units:
+        ranges = [(c.skip, c.skip + c.limit) for c in chunks if c.length == length]
+        position = 0
+        for start, end in ranges:
+            assert start == position and end > start
+            position = end
+        assert position == max(space, 0)
+
+
+def test_chunks_cover_each_length_exactly_once():
+    units = [(4, 10_000), (5, 100_000), (6, 1_000_000)]
+    chunks = split_keyspace(units, workers=4, chunks_per_worker=8)
+    _covers(chunks, units)
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    assert sum(c.limit for c in chunks) == 1_110_000
+
+
+def test_chunk_sizes_are_close_to_the_target():
+    chunks = split_keyspace([(None, 1_000_003)], workers=3, chunks_per_worker=5)
+    assert len(chunks) == 15
+    sizes = {c.limit for c in chunks}
+    assert max(sizes) - min(sizes) <= 15
+    _covers(chunks, [(None, 1_000_003)])
+
+
+def test_small_lengths_stay_in_one_chunk():
+    # 远小于目标块大小的长度不再切分
+    units = [(1, 10), (2, 100), (8, 100_000_000)]
+    chunks = split_keyspace(units, workers=2, chunks_per_worker=4)
+    assert [c for c in chunks if c.length == 1] == [(0, 1, 0, 10)]
+    assert len([c for c in chunks if c.length == 2]) == 1
+    _covers(chunks, units)
+
+
+def test_empty_units_and_single_candidates():
+    assert split_keyspace([], workers=4, chunks_per_worker=8) == []
+    assert split_keyspace([(3, 0)], workers=4, chunks_per_worker=8) == []
+    assert split_keyspace([(None, 1)], workers=4, chunks_per_worker=8) == [(0, None, 0, 1)]
+    # 块数多于候选数时每块一个候选；没有工作进程时按一个计算
+    assert [c.limit for c in split_keyspace([(None, 5)], workers=4, chunks_per_worker=8)] == [1] * 5
+    assert split_keyspace([(None, 5)], workers=0, chunks_per_worker=1) == [(0, None, 0, 5)]
+
+
+def test_parse_workers():
+    workers = parse_workers(' local:1, local:2 ,ssh:user@gpu-box,ssh:gpu-box2:1,')
+    assert [type(w) for w in workers] == [LocalTransport, LocalTransport, SSHTransport, SSHTransport]
+    assert [w.devices for w in workers] == ['1', '2', '', '1']
+    assert parse_workers('') == []
+    with pytest.raises(ValueError, match='无法识别'):
+        parse_workers('gpu-box')
+    with pytest.raises(ValueError, match='重复'):
+        parse_workers('local,local')
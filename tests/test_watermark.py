@@ -0,0 +1,124 @@
+import multiprocessing
+import pikepdf
+from pikepdf import Dictionary, Name, Stream
+from config import Config
+from watermark import WatermarkReport, filter_page, find_watermarks, inspect, strip_watermarks
+
+
+def _with_form(pages, **form_keys):
+    """每页都绘制同一个表单XObject的文档，如信头"""
+    pdf = pikepdf.new()
+    form = Stream(pdf, b'0 0 m 100 0 l S', Type=Name.XObject, Subtype=Name.Form,
+                  BBox=[0, 0, 100, 10], **form_keys)
+    form = pdf.make_indirect(form)
+    for _ in range(pages):
+        pdf.add_blank_page()
+        page = pdf.pages[-1]
+        page.Resources = Dictionary(XObject=Dictionary(Fm0=form))
+        page.Contents = pdf.make_stream(b'q /Fm0 Do Q')
+    return pdf, form.objgen
+
+
+def test_letterhead_on_every_page_is_kept_by_default():
+    pdf, _ = _with_form(5)
+    found = find_watermarks(pdf)
+    assert found.xobjects == {} and found.pages == []
+
+
+def test_repeated_stamp_check_is_opt_in():
+    pdf, objgen = _with_form(5)
+    found = find_watermarks(pdf, stamp_ratio=0.9)
+    assert list(found.xobjects) == [objgen]
+    assert found.pages == list(range(5))
+
+
+def test_acrobat_watermark_is_found_without_the_stamp_check():
+    piece = Dictionary(ADBE_CompoundType=Dictionary(Private=Name.Watermark))
+    pdf, objgen = _with_form(1, PieceInfo=piece)
+    found = find_watermarks(pdf)
+    assert list(found.xobjects) == [objgen]
+    assert found.pages == [0]
+
+
+# 保留的绘制内容，水印段落插在它的前后
+KEPT = b'q 1 0 0 1 10 10 cm 0 0 m 100 100 l S Q\n'
+MARKED = (b'/Artifact <</Subtype /Watermark /Type /Pagination>> BDC 0 0 m 50 50 l S EMC\n'
+          + KEPT
+          + b'/OC /MC0 BDC q 0 0 m 20 20 l S /OC /MC1 BDC EMC Q EMC\n')
+
+
+def _marked(path, pages=4, annotated=3):
+    """每页有一段 /Artifact /Watermark 和一段水印图层的 /OC 内容，前annotated页各有一个 /Watermark 注释"""
+    pdf = pikepdf.new()
+    watermark = pdf.make_indirect(Dictionary(Type=Name.OCG, Name=pikepdf.String('Watermark')))
+    notes = pdf.make_indirect(Dictionary(Type=Name.OCG, Name=pikepdf.String('Notes')))
+    pdf.Root.OCProperties = Dictionary(
+        OCGs=[watermark, notes],
+        D=Dictionary(ON=[watermark, notes], Order=[watermark, pikepdf.Array([notes])]))
+    for index in range(pages):
+        pdf.add_blank_page()
+        page = pdf.pages[-1]
+        page.Resources = Dictionary(Properties=Dictionary(MC0=watermark))
+        page.Contents = pdf.make_stream(MARKED)
+        annots = [Dictionary(Type=Name.Annot, Subtype=Name.Link, Rect=[0, 0, 10, 10])]
+        if index < annotated:
+            annots.append(Dictionary(Type=Name.Annot, Subtype=Name.Watermark, Rect=[0, 0, 10, 10]))
+        page.Annots = pdf.make_indirect(pikepdf.Array(annots))
+    pdf.save(path)
+    pdf.close()
+    return path
+
+
+def _instructions(stream):
+    return pikepdf.unparse_content_stream(pikepdf.parse_content_stream(stream))
+
+
+def _check_removed(pdf, report, pages=4):
+    assert report == WatermarkReport(pages, 3, 2 * pages, 0, ('Watermark',), ())
+    expected = _instructions(pdf.make_stream(KEPT))
+    for page in pdf.pages:
+        assert _instructions(page.obj) == expected
+        assert [annot.Subtype for annot in page.Annots] == [Name.Link]
+    properties = pdf.Root.OCProperties
+    assert [str(ocg.Name) for ocg in properties.OCGs] == ['Notes']
+    assert [str(ocg.Name) for ocg in properties.D.ON] == ['Notes']
+    assert len(properties.D.Order) == 1 and str(properties.D.Order[0][0].Name) == 'Notes'
+
+
+def test_strip_removes_annotations_sections_and_layers(tmp_path):
+    with pikepdf.open(_marked(tmp_path / 'marked.pdf')) as pdf:
+        _check_removed(pdf, strip_watermarks(pdf))
+
+
+def test_strip_through_the_process_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'WATERMARK_INLINE_PAGES', 1)
+    monkeypatch.setattr(Config, 'WATERMARK_BATCH_PAGES', 2)
+    contexts = []
+    get_context = multiprocessing.get_context
+    monkeypatch.setattr(multiprocessing, 'get_context', lambda method: contexts.append(method) or get_context(method))
+    path = _marked(tmp_path / 'marked.pdf', pages=5)
+    with pikepdf.open(path) as pdf:
+        _check_removed(pdf, strip_watermarks(pdf, str(path), processes=2), pages=5)
+    assert contexts == ['spawn']
+
+
+def test_dry_run_reports_the_same_counts_without_changes(tmp_path):
+    path = _marked(tmp_path / 'marked.pdf')
+    with pikepdf.open(path) as pdf:
+        report = strip_watermarks(pdf, dry_run=True)
+        for index, page in enumerate(pdf.pages):
+            assert page.obj.Contents.read_bytes() == MARKED
+            assert len(page.Annots) == (2 if index < 3 else 1)
+        assert len(pdf.Root.OCProperties.OCGs) == 2
+        assert len(pdf.Root.OCProperties.D.ON) == 2
+    assert inspect(str(path)) == report
+    with pikepdf.open(path) as pdf:
+        assert strip_watermarks(pdf) == report
+
+
+def test_filter_page_leaves_unmarked_pages_alone():
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    page = pdf.pages[0]
+    page.Contents = pdf.make_stream(KEPT)
+    assert filter_page(page.obj, (), ()) == (None, 0, 0)